@@ -178,3 +178,51 @@ function deploy_event_function {
   cd $MAIN_DIR;
   echo "Exit, current path: ${PWD}";
 }
+
+#
+# Deploys a CloudWatch Events rule that invokes a function on a schedule
+#
+function deploy_schedule {
+    FUNCTION_NAME=$1
+    SCHEDULE_EXPRESSION=$2
+    echo "Deploying schedule '${SCHEDULE_EXPRESSION}' for '${FUNCTION_NAME}'";
+    RULE_ARN=$(aws events put-rule --name "${FUNCTION_NAME}" --schedule-expression "${SCHEDULE_EXPRESSION}" | jq -r ".RuleArn");
+    FUNCTION_ARN=$(aws lambda get-function --function-name "${FUNCTION_NAME}" | jq -r ".Configuration.FunctionArn");
+    echo "RULE_ARN: ${RULE_ARN}";
+
+    # The permission exists after the first deployment
+    aws lambda add-permission --function-name "${FUNCTION_NAME}" \
+        --statement-id "${FUNCTION_NAME}-schedule" \
+        --action "lambda:InvokeFunction" \
+        --principal "events.amazonaws.com" \
+        --source-arn "${RULE_ARN}" > /dev/null 2>&1 || echo "Skipping, the permission already exists";
+
+    aws events put-targets --rule "${FUNCTION_NAME}" --targets "Id=${FUNCTION_NAME},Arn=${FUNCTION_ARN}" > /dev/null;
+}
+
+#
+# Builds & Deploys a Scheduled Function
+#
+function deploy_scheduled_function {
+  MAIN_DIR=$PWD
+  FUNCTION_NAME_MIN=$1
+  SCHEDULE_EXPRESSION=$2
+  FUNCTION_NAME_AWS="atd-moped-events-${FUNCTION_NAME_MIN}_${WORKING_STAGE}";
+  FUNCTION_DIR="${MAIN_DIR}/moped-data-events/${FUNCTION_NAME_MIN}";
+
+  echo "Building function '${FUNCTION_NAME_AWS}' @ path: '${FUNCTION_DIR}'";
+  cd $FUNCTION_DIR;
+
+  install_requirements;
+  bundle_function;
+  generate_env_vars "${FUNCTION_NAME_MIN}";
+  deploy_lambda_function "${FUNCTION_NAME_AWS}";
+  # A run may archive many chunks, it needs more than the default timeout
+  aws lambda wait function-updated --function-name "${FUNCTION_NAME_AWS}";
+  aws lambda update-function-configuration \
+        --function-name "${FUNCTION_NAME_AWS}" \
+        --timeout 900 | jq -r ".LastModified";
+  deploy_schedule "${FUNCTION_NAME_AWS}" "${SCHEDULE_EXPRESSION}";
+  cd $MAIN_DIR;
+  echo "Exit, current path: ${PWD}";
+}
@@ -1,8 +1,13 @@
 import os, datetime
 from flask import Flask, jsonify, Response
-from flask_cognito import CognitoAuth
 from flask_cors import CORS
 from config import api_config
+import codec
+import metrics
+import profiling
+
+# Before the blueprints are imported: they create boto3 clients (ie. files)
+metrics.instrument_boto3()
 
 MOPED_API_CURRENT_ENVIRONMENT = os.getenv("MOPED_API_CURRENT_ENVIRONMENT", "STAGING")
 
@@ -12,9 +17,14 @@ MOPED_API_CURRENT_ENVIRONMENT = os.getenv("MOPED_API_CURRENT_ENVIRONMENT", "STAG
 from auth.auth import auth_blueprint
 from users.users import users_blueprint
 from events.events import events_blueprint
+from events import spool as events_spool
 from files.files import files_blueprint
+from projects.projects import projects_blueprint
+from auth.cognito import CachedCognitoAuth
 
 app = Flask(__name__)
+# orjson, when installed, parses the requests and serializes the responses
+codec.init_app(app)
 
 #
 # Register Blueprints
@@ -23,12 +33,38 @@ app.register_blueprint(auth_blueprint, url_prefix="/auth")
 app.register_blueprint(users_blueprint, url_prefix="/users")
 app.register_blueprint(events_blueprint, url_prefix="/events")
 app.register_blueprint(files_blueprint, url_prefix="/files")
+app.register_blueprint(projects_blueprint, url_prefix="/projects")
 
 #
 # Cognito
+#   Verified tokens and the user pool keys are cached, see auth/cognito.py
 #
 app.config.update(api_config)
-cognito = CognitoAuth(app)
+cognito = CachedCognitoAuth(app)
+
+#
+# Metrics
+#   Request and dependency latency histograms at /metrics, see metrics.py
+#
+metrics.init_app(app)
+metrics.register_collector(lambda: {
+    f"moped_api_token_cache_{name}_total": value
+    for name, value in cognito.token_cache.get_metrics().items() if name != "size"
+})
+metrics.register_collector(lambda: {
+    f"moped_api_jwks_{name}_total": value for name, value in cognito.jwks.metrics.items()
+})
+# The spool is created on first use, every worker counts the events of its own segments
+metrics.register_collector(lambda: {
+    f"moped_api_events_spool_{name}_total": value
+    for name, value in (events_spool.EVENT_SPOOL.metrics.items() if events_spool.EVENT_SPOOL else [])
+})
+
+#
+# Profiling
+#   Requests with the X-Moped-Profile header, signed or from an admin, are profiled, see profiling.py
+#
+profiling.init_app(app)
 
 #
 # CORS Policy
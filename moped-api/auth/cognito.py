@@ -0,0 +1,278 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask_cognito import CognitoAuth
+from cognitojwt import CognitoJWTException
+
+from codec import loads
+
+#
+# Cognito authentication with caches: flask_cognito verifies the signature of
+# the JWT on every request, while the editor sends the same token for as long
+# as it is valid. CachedCognitoAuth keeps the claims of every verified token
+# (by its sha256) until the token expires, so a token is verified about once
+# per worker. The public keys of the user pool (JWKS) are parsed once and
+# refreshed by a background thread, or right away for a key id that is not
+# known yet (Cognito rotated its keys).
+#
+MOPED_API_TOKEN_CACHE_SIZE = int(os.getenv("MOPED_API_TOKEN_CACHE_SIZE", "1024"))
+MOPED_API_JWKS_REFRESH_INTERVAL = float(os.getenv("MOPED_API_JWKS_REFRESH_INTERVAL", "3600"))
+# The minimum seconds between two downloads for unknown key ids, a forged kid can't force one per request
+MOPED_API_JWKS_MIN_REFRESH_INTERVAL = float(os.getenv("MOPED_API_JWKS_MIN_REFRESH_INTERVAL", "60"))
+
+JWKS_URL_TEMPLATE = "https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json"
+
+
+class JWKSCache:
+    """
+    The public keys of a user pool, by key id, ready to verify signatures
+    """
+
+    def __init__(
+        self,
+        keys_url: str,
+        refresh_interval: float = MOPED_API_JWKS_REFRESH_INTERVAL,
+        min_refresh_interval: float = MOPED_API_JWKS_MIN_REFRESH_INTERVAL,
+    ):
+        """
+        Constructor for the key cache, the keys are downloaded on first use
+        :param str keys_url: The URL of the jwks.json document, or a local path
+        :param float refresh_interval: The seconds between two background refreshes
+        :param float min_refresh_interval: The minimum seconds between two refreshes for an unknown key id
+        """
+        self.keys_url = keys_url
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+
+        self.keys = {}
+        # When the keys were last downloaded, on the monotonic clock
+        self.refreshed_at = None
+        # Only one download at a time
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.metrics = {"refreshes": 0, "refresh_errors": 0}
+
+    def download_keys(self) -> list:
+        """
+        Downloads the JSON Web Key Set
+        :return list: The keys, as JWK dictionaries
+        """
+        if self.keys_url.startswith("http"):
+            import requests
+            response = requests.get(self.keys_url, timeout=10)
+            response.raise_for_status()
+            return response.json().get("keys", [])
+
+        with open(self.keys_url) as file:
+            return loads(file.read()).get("keys", [])
+
+    def refresh(self) -> None:
+        """
+        Downloads and parses the keys, the current keys are kept if it fails
+        """
+        from jose import jwk
+
+        with self.lock:
+            try:
+                self.keys = {key["kid"]: jwk.construct(key) for key in self.download_keys()}
+                self.metrics["refreshes"] += 1
+            except Exception as e:
+                self.metrics["refresh_errors"] += 1
+                print(f"Could not refresh the Cognito keys: {str(e)}")
+            finally:
+                self.refreshed_at = time.monotonic()
+
+    def get_key(self, kid: str):
+        """
+        Returns the public key of a key id, the keys are downloaded again
+        if the key id is unknown and they were not downloaded recently
+        :param str kid: The key id of a token
+        :return jose.jwk.Key: The public key
+        """
+        key = self.keys.get(kid, None)
+        if key is None:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.min_refresh_interval:
+                self.refresh()
+            key = self.keys.get(kid, None)
+        if key is None:
+            raise CognitoJWTException("Public key not found in jwks.json")
+        return key
+
+    def run_refresher(self) -> None:
+        """
+        The refresher thread: downloads the keys every refresh_interval seconds
+        """
+        while not self.stop_event.wait(self.refresh_interval):
+            self.refresh()
+
+    def start_refresher(self) -> None:
+        """
+        Starts the refresher thread, if it is not running
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run_refresher, name="jwks-refresher", daemon=True)
+            self.thread.start()
+
+    def stop_refresher(self) -> None:
+        """
+        Stops the refresher thread
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class VerifiedTokenCache:
+    """
+    The claims of verified tokens by sha256, each one until its exp, the
+    least recently used are dropped beyond max_size
+    """
+
+    def __init__(self, max_size: int = MOPED_API_TOKEN_CACHE_SIZE):
+        """
+        Constructor for the token cache
+        :param int max_size: The maximum number of tokens kept
+        """
+        self.max_size = max_size
+        # sha256 -> (claims, exp)
+        self.tokens = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0}
+
+    @staticmethod
+    def get_digest(token: str) -> str:
+        """
+        Returns the cache key of a token, tokens are not kept
+        :param str token: The encoded token
+        :return str: The sha256 of the token
+        """
+        return hashlib.sha256(str(token).encode("utf-8")).hexdigest()
+
+    def get(self, token: str):
+        """
+        Returns the claims of a verified token that did not expire
+        :param str token: The encoded token
+        :return dict: A copy of the claims, None if the token is not cached
+        """
+        digest = self.get_digest(token)
+        with self.lock:
+            entry = self.tokens.get(digest, None)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            claims, exp = entry
+            if time.time() >= exp:
+                del self.tokens[digest]
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self.tokens.move_to_end(digest)
+            self.metrics["hits"] += 1
+        # The views may change the claims of their request (ie. is_valid_user)
+        return dict(claims)
+
+    def put(self, token: str, claims: dict) -> None:
+        """
+        Keeps the claims of a verified token until its exp
+        :param str token: The encoded token
+        :param dict claims: The verified claims
+        """
+        try:
+            exp = float(claims["exp"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if time.time() >= exp or self.max_size <= 0:
+            return
+
+        digest = self.get_digest(token)
+        with self.lock:
+            self.tokens[digest] = (dict(claims), exp)
+            self.tokens.move_to_end(digest)
+            while len(self.tokens) > self.max_size:
+                self.tokens.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forgets every token
+        """
+        with self.lock:
+            self.tokens.clear()
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the counters of the cache, and the number of tokens kept
+        :return dict:
+        """
+        with self.lock:
+            return {**self.metrics, "size": len(self.tokens)}
+
+
+class CachedCognitoAuth(CognitoAuth):
+    """
+    flask_cognito's CognitoAuth, with a verified-token cache and a JWKS cache
+    """
+
+    def init_app(self, app, identity_handler=None):
+        super().init_app(app, identity_handler=identity_handler)
+        keys_url = os.getenv("AWS_COGNITO_JWKS_PATH") or JWKS_URL_TEMPLATE.format(self.region, self.userpool_id)
+        self.jwks = JWKSCache(keys_url)
+        self.token_cache = VerifiedTokenCache()
+
+    def verify_token(self, token: str) -> dict:
+        """
+        Verifies the signature, expiration and audience of a token, like cognitojwt.decode
+        :param str token: The encoded token
+        :return dict: The claims
+        """
+        from jose import jwt
+        from jose.utils import base64url_decode
+        from cognitojwt.token_utils import check_expired, check_client_id
+
+        message, encoded_signature = str(token).rsplit(".", 1)
+        signature = base64url_decode(encoded_signature.encode("utf-8"))
+
+        # The background refresh starts with the first token
+        self.jwks.start_refresher()
+        public_key = self.jwks.get_key(jwt.get_unverified_headers(token)["kid"])
+        if not public_key.verify(message.encode("utf-8"), signature):
+            raise CognitoJWTException("Signature verification failed")
+
+        claims = jwt.get_unverified_claims(token)
+        check_expired(claims["exp"], testmode=not self.check_expiration)
+        if self.app_client_id:
+            check_client_id(claims, self.app_client_id)
+        return claims
+
+    def decode_token(self, token: str) -> dict:
+        """
+        Returns the claims of a token, it is only verified if it is not cached
+        :param str token: The encoded token
+        :return dict: The claims
+        """
+        claims = self.token_cache.get(token)
+        if claims is not None:
+            return claims
+
+        from jose.exceptions import JWTError
+        try:
+            claims = self.verify_token(token)
+        except (ValueError, KeyError, JWTError):
+            raise CognitoJWTException("Malformed Authentication Token")
+
+        self.token_cache.put(token, claims)
+        return dict(claims)
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the counters of the token and key caches
+        :return dict:
+        """
+        return {
+            "tokens": self.token_cache.get_metrics(),
+            "jwks": {**self.jwks.metrics, "keys": len(self.jwks.keys)},
+        }
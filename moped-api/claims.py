@@ -1,6 +1,9 @@
-import json, boto3, datetime
+import json, boto3, datetime, logging
 from functools import wraps
+from types import MappingProxyType
+from collections.abc import Mapping
 from config import api_config
+from codec import loads
 
 from flask_cognito import _request_ctx_stack, current_cognito_jwt
 from werkzeug.local import LocalProxy
@@ -13,16 +16,151 @@ MOPED_API_CURRENT_ENVIRONMENT = api_config.get("MOPED_API_CURRENT_ENVIRONMENT",
 AWS_COGNITO_DYNAMO_TABLE_NAME = api_config.get("COGNITO_DYNAMO_TABLE_NAME", None)
 AWS_COGNITO_DYNAMO_SECRET_KEY = api_config.get("COGNITO_DYNAMO_SECRET_KEY", None)
 
+# The key of the Hasura claims in the Cognito JWT, their value is a JSON string
+HASURA_CLAIMS_KEY = "https://hasura.io/jwt/claims"
+
+logger = logging.getLogger(__name__)
+
+
+def freeze(value):
+    """
+    Returns a read-only copy of a JSON value: dicts become read-only mappings, lists become tuples
+    :param any value: The JSON value
+    :return any: The read-only copy
+    """
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class HasuraClaims(Mapping):
+    """
+    The Hasura claims of a JWT token, parsed once and read-only. It is a
+    mapping, so it can be read like the claims dictionary (and serialized
+    by jsonify), with typed accessors for the values the API checks.
+    """
+
+    __slots__ = ("_claims",)
+
+    def __init__(self, claims: Mapping = None):
+        """
+        Constructor for the claims
+        :param Mapping claims: The parsed claims, they are copied
+        """
+        self._claims = freeze(claims or {})
+
+    @classmethod
+    def from_jwt(cls, cognito_jwt: Mapping) -> "HasuraClaims":
+        """
+        Parses the Hasura claims of a decoded Cognito JWT token
+        :param Mapping cognito_jwt: The decoded token, None for an anonymous request
+        :return HasuraClaims: The claims, empty if the token has none
+        """
+        claims = (cognito_jwt or {}).get(HASURA_CLAIMS_KEY, None)
+        if isinstance(claims, HasuraClaims):
+            return claims
+        if isinstance(claims, (str, bytes)):
+            claims = loads(claims)
+        return cls(claims if isinstance(claims, Mapping) else None)
+
+    def __getitem__(self, key: str):
+        return self._claims[key]
+
+    def __iter__(self):
+        return iter(self._claims)
+
+    def __len__(self) -> int:
+        return len(self._claims)
+
+    def __repr__(self) -> str:
+        return f"HasuraClaims({dict(self._claims)!r})"
+
+    @property
+    def roles(self) -> tuple:
+        """
+        The allowed roles (x-hasura-allowed-roles)
+        :return tuple:
+        """
+        roles = self._claims.get("x-hasura-allowed-roles", None)
+        return roles if isinstance(roles, tuple) else ()
+
+    @property
+    def default_role(self) -> Optional[str]:
+        """
+        The default role (x-hasura-default-role)
+        :return str:
+        """
+        return self._claims.get("x-hasura-default-role", None)
+
+    @property
+    def user_id(self) -> Optional[str]:
+        """
+        The Cognito user id (x-hasura-user-id)
+        :return str:
+        """
+        return self._claims.get("x-hasura-user-id", None)
+
+    @property
+    def user_db_id(self) -> Optional[int]:
+        """
+        The database id of the user (x-hasura-user-db-id)
+        :return int: The id, None if it is missing or not a number
+        """
+        return self.get_int("x-hasura-user-db-id")
+
+    @property
+    def workgroup_id(self) -> Optional[int]:
+        """
+        The workgroup id of the user (x-hasura-user-wg-id)
+        :return int: The id, None if it is missing or not a number
+        """
+        return self.get_int("x-hasura-user-wg-id")
+
+    def get_int(self, key: str) -> Optional[int]:
+        """
+        Returns a claim as an integer, Hasura claims are strings
+        :param str key: The name of the claim
+        :return int: The value, None if it is missing or not a number
+        """
+        try:
+            return int(self._claims[key])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def has_role(self, role: str) -> bool:
+        """
+        Returns True if the role is one of the allowed roles
+        :param str role: The role being evaluated
+        :return bool:
+        """
+        return role in self.roles
+
+
+def get_hasura_claims() -> HasuraClaims:
+    """
+    Returns the Hasura claims of the current request, they are parsed
+    the first time and kept in the request context
+    :return HasuraClaims: The claims, empty if the request is not authenticated
+    """
+    request_context = _request_ctx_stack.top
+    if request_context is None:
+        return HasuraClaims()
+
+    hasura_claims = getattr(request_context, "hasura_claims", None)
+    if hasura_claims is None:
+        hasura_claims = HasuraClaims.from_jwt(current_cognito_jwt._get_current_object())
+        request_context.hasura_claims = hasura_claims
+    return hasura_claims
+
+
 #
 # LocalProxy is a funny class in werkzeug.local, it seems to be a way
 # to safely manage global variables (thread locals) with concurrency
 # safety. A LocalProxy seems to behave as a pointer to global variable.
 #
-current_hasura_claims = LocalProxy(
-    lambda:
-    {} if hasattr(_request_ctx_stack.top, 'hasura_claims') is False
-    else getattr(_request_ctx_stack.top, 'hasura_claims', None)
-)
+current_hasura_claims = LocalProxy(get_hasura_claims)
 
 
 def lower_case_email(user_email: str) -> str:
@@ -37,14 +175,15 @@ def lower_case_email(user_email: str) -> str:
         return user_email
 
 
-def get_claims(payload: LocalProxy) -> dict:
+def get_claims(payload: LocalProxy) -> HasuraClaims:
     """
     It's a handy way to extract the hasura claims from a valid payload.
-    :param LocalProxy payload:
-    :return dict:
+    :param LocalProxy payload: The decoded JWT token, ie. current_cognito_jwt
+    :return HasuraClaims:
     """
-    cognito_jwt_dict = payload._get_current_object()
-    return json.loads(cognito_jwt_dict["https://hasura.io/jwt/claims"])
+    if payload is current_cognito_jwt:
+        return get_hasura_claims()
+    return HasuraClaims.from_jwt(payload._get_current_object())
 
 
 def resolve_hasura_claims(func: Callable) -> Callable:
@@ -55,10 +194,10 @@ def resolve_hasura_claims(func: Callable) -> Callable:
     :return Callable: The wrapper function
     """
 
+    @wraps(func)
     def wrapper(*args, **kwargs):
-        print("resolve_hasura_claims: start")
-        cognito_jwt_dict = current_cognito_jwt._get_current_object()
-        _request_ctx_stack.top.hasura_claims = json.loads(cognito_jwt_dict["https://hasura.io/jwt/claims"])
+        logger.debug("resolve_hasura_claims: start")
+        get_hasura_claims()
         return func(*args, **kwargs)
 
     return wrapper
@@ -66,17 +205,20 @@ def resolve_hasura_claims(func: Callable) -> Callable:
 
 def normalize_claims(func: Callable) -> Callable:
     """
-    Implements a decorator that parses the contents of the hasura claims
-    and transforms it from string to a dictionary.
+    Implements a decorator that provides a copy of the token whose
+    hasura claims are parsed (HasuraClaims) instead of a string. The
+    token itself is left as it is.
     :param Callable func: The function to be wrapped
     :return Callable: The wrapper function
     """
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        print("resolve_hasura_claims: start")
-        claims = current_cognito_jwt._get_current_object()
-        claims["https://hasura.io/jwt/claims"] = json.loads(claims["https://hasura.io/jwt/claims"])
+        logger.debug("normalize_claims: start")
+        claims = {
+            **(current_cognito_jwt._get_current_object() or {}),
+            HASURA_CLAIMS_KEY: get_hasura_claims(),
+        }
         return func(claims=claims, *args, **kwargs)
 
     return wrapper
@@ -149,20 +291,16 @@ def generate_iso_timestamp() -> str:
     return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
-def has_user_role(role, claims) -> bool:
+def has_user_role(role, claims: Mapping = None) -> bool:
     """
     Checks if role exists in claims
     :param str role: The role being evaluated
-    :param dict claims: The claims presented in the token
+    :param Mapping claims: The claims presented in the token, default: the claims of the current request
     :return bool:
     """
-    user_claims = claims.get("https://hasura.io/jwt/claims", {})
-    allowed_roles = user_claims.get("x-hasura-allowed-roles", False)
-
-    if allowed_roles:
-        if role in allowed_roles:
-            return True
-    return False
+    if claims is None:
+        return get_hasura_claims().has_role(role)
+    return HasuraClaims.from_jwt(claims).has_role(role)
 
 
 def retrieve_user_profile(user_email: str) -> dict:
@@ -197,7 +335,7 @@ def load_claims(user_email: str) -> dict:
     claims_encrypted = profile["claims"]["S"]
     cognito_uuid = profile["cognito_uuid"]["S"]
     decrypted_claims = decrypt(fernet_key=AWS_COGNITO_DYNAMO_SECRET_KEY, content=claims_encrypted)
-    claims = json.loads(decrypted_claims)
+    claims = loads(decrypted_claims)
     claims["x-hasura-user-id"] = cognito_uuid
     return claims
 
@@ -0,0 +1,183 @@
+#
+# JSON codec
+#
+#   orjson when it is installed, the standard library otherwise, both write
+# compact UTF-8 JSON. Values JSON has no type for are serialized the same way
+# by both: datetime and date (ie. the UserCreateDate of boto3 Cognito
+# responses) as ISO 8601, Decimal as a number, sets and tuples as lists, any
+# other mapping as an object. Integers over 64 bits are left to the standard
+# library when serializing (orjson raises), orjson parses them as floats.
+#
+#   The Flask responses (jsonify) and request bodies (request.get_json) go
+# through JSONEncoder and JSONDecoder, see init_app.
+#
+#   MOPED_API_JSON_CODEC: auto (orjson if installed), orjson or json
+#
+import os
+import json
+import decimal
+import datetime
+from collections.abc import Mapping
+
+from flask import Flask
+from flask.json import JSONEncoder as FlaskJSONEncoder, JSONDecoder as FlaskJSONDecoder
+
+MOPED_API_JSON_CODEC = os.getenv("MOPED_API_JSON_CODEC", "auto").lower()
+
+
+def load_orjson():
+    """
+    Returns the orjson module if it is installed and allowed by MOPED_API_JSON_CODEC
+    :return module: The orjson module, or None to use the standard library
+    """
+    if MOPED_API_JSON_CODEC == "json":
+        return None
+    try:
+        import orjson
+        return orjson
+    except ImportError:
+        if MOPED_API_JSON_CODEC == "orjson":
+            raise
+        return None
+
+
+orjson = load_orjson()
+
+# The codec in use: orjson or json
+JSON_CODEC = "json" if orjson is None else "orjson"
+
+
+def default(value):
+    """
+    Serializes the values JSON has no type for
+    :param any value: The value
+    :return any: A value JSON can represent
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    if isinstance(value, Mapping):
+        # ie. the read-only HasuraClaims
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_stdlib(value, sort_keys: bool = False, default_function=default) -> str:
+    """
+    Serializes a value to compact JSON with the standard library
+    :param any value: The value
+    :param bool sort_keys: True to sort the keys of the objects
+    :param Callable default_function: Serializes the values JSON has no type for
+    :return str: The JSON
+    """
+    return json.dumps(
+        value,
+        default=default_function,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        sort_keys=sort_keys,
+    )
+
+
+def dumps_bytes(value, sort_keys: bool = False, default_function=default) -> bytes:
+    """
+    Serializes a value to compact UTF-8 JSON
+    :param any value: The value
+    :param bool sort_keys: True to sort the keys of the objects
+    :param Callable default_function: Serializes the values JSON has no type for
+    :return bytes: The JSON
+    """
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(value, default=default_function, option=option)
+        except orjson.JSONEncodeError:
+            # ie. integers over 64 bits, the standard library handles them
+            pass
+    return dumps_stdlib(value, sort_keys=sort_keys, default_function=default_function).encode("utf-8")
+
+
+def dumps(value, sort_keys: bool = False, default_function=default) -> str:
+    """
+    Serializes a value to compact JSON
+    :param any value: The value
+    :param bool sort_keys: True to sort the keys of the objects
+    :param Callable default_function: Serializes the values JSON has no type for
+    :return str: The JSON
+    """
+    if orjson is not None:
+        return dumps_bytes(value, sort_keys=sort_keys, default_function=default_function).decode("utf-8")
+    return dumps_stdlib(value, sort_keys=sort_keys, default_function=default_function)
+
+
+def loads(data):
+    """
+    Parses JSON
+    :param str|bytes data: The JSON
+    :return any: The value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """
+    The Flask JSON encoder, with the codec. Indented JSON (JSONIFY_PRETTYPRINT_REGULAR)
+    is left to the standard library.
+    """
+
+    def default(self, value):
+        """
+        Serializes datetime and the other values of the codec, anything else is left to Flask
+        :param any value: The value
+        :return any: A value JSON can represent
+        """
+        try:
+            return default(value)
+        except TypeError:
+            return super().default(value)
+
+    def encode(self, value) -> str:
+        """
+        Serializes a value, with orjson if available
+        :param any value: The value
+        :return str: The JSON
+        """
+        if orjson is not None and self.indent is None:
+            try:
+                return dumps(value, sort_keys=self.sort_keys, default_function=self.default)
+            except TypeError:
+                pass
+        return super().encode(value)
+
+
+class JSONDecoder(FlaskJSONDecoder):
+    """
+    The Flask JSON decoder, with the codec
+    """
+
+    def decode(self, data: str, *args, **kwargs):
+        """
+        Parses JSON, with orjson if available
+        :param str data: The JSON
+        :return any: The value
+        """
+        if orjson is not None:
+            return orjson.loads(data)
+        return super().decode(data, *args, **kwargs)
+
+
+def init_app(app: Flask) -> None:
+    """
+    Makes Flask parse and serialize JSON with the codec. Flask 1.1 has no
+    JSON provider yet, the encoder and decoder classes are its extension points.
+    :param Flask app: The Flask application
+    """
+    app.json_encoder = JSONEncoder
+    app.json_decoder = JSONDecoder
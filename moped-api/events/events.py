@@ -1,8 +1,12 @@
-import hashlib, json, boto3, os, datetime
+import hashlib, json, boto3, os, datetime, time
 from flask import Blueprint, jsonify, request
 
 # Import our custom code
 from requests import Response
+from events.helpers import get_message_body
+import events.spool as events_spool
+from events.spool import get_event_spool, resume_event_spool, SpoolFullError
+from tracing import get_hasura_parent, get_hasura_created_at, start_span, record_span
 
 events_blueprint = Blueprint('events_blueprint', __name__)
 
@@ -11,6 +15,9 @@ HASURA_EVENT_API = os.getenv("MOPED_API_HASURA_APIKEY", "")
 HASURA_EVENTS_SQS_URL = os.getenv("MOPED_API_HASURA_SQS_URL", "")
 MOPED_API_CURRENT_ENVIRONMENT = os.getenv("MOPED_API_CURRENT_ENVIRONMENT", "")
 
+# Events spooled by a previous process are sent once this worker gets its first request
+events_blueprint.before_app_request(resume_event_spool)
+
 
 @events_blueprint.route('/', methods=["GET"])
 def events_index() -> str:
@@ -19,12 +26,14 @@ def events_index() -> str:
     :return str:
     """
     now = datetime.datetime.now()
-    return jsonify(
-        {
-            "message": "MOPED API Available - Events - Health Check - Available @ %s"
-            % now.strftime("%Y-%m-%d %H:%M:%S")
-        }
-    )
+    health_check = {
+        "message": "MOPED API Available - Events - Health Check - Available @ %s"
+        % now.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    # The spool only exists once an event could not be queued, or was left by a previous process
+    if events_spool.EVENT_SPOOL is not None:
+        health_check["spool"] = events_spool.EVENT_SPOOL.get_metrics()
+    return jsonify(health_check)
 
 
 #
@@ -60,29 +69,74 @@ def events_process() -> (Response, int):
     else:
         print("We're good with the event name...")
 
+    queue_url = (
+        # The SQS url is a constant that follows this pattern:
+        # https://sqs.us-east-1.amazonaws.com/{AWS_ACCOUNT_NUMBER}/{THE_QUEUE_NAME}
+        HASURA_EVENTS_SQS_URL[0:48]  # This is the length of the url with the account number
+        + "/atd-moped-events-"  # We're going to add a prefix pattern for our ATD VisionZero queues
+        + f"{incoming_event_name}_{MOPED_API_CURRENT_ENVIRONMENT}".lower()  # And event name plus current environment
+    )
+    message_body = None
+    message_attributes = None
+
     # We continue the execution 
     try:
-        sqs = boto3.client("sqs")
-        queue_url = (
-            # The SQS url is a constant that follows this pattern:
-            # https://sqs.us-east-1.amazonaws.com/{AWS_ACCOUNT_NUMBER}/{THE_QUEUE_NAME}
-            HASURA_EVENTS_SQS_URL[0:48]  # This is the length of the url with the account number
-            + "/atd-moped-events-"  # We're going to add a prefix pattern for our ATD VisionZero queues
-            + f"{incoming_event_name}_{MOPED_API_CURRENT_ENVIRONMENT}".lower()  # And event name plus current environment
-        )
-
-        # Send message to SQS queue
-        response = sqs.send_message(
-            QueueUrl=queue_url,
-            DelaySeconds=10,
-            MessageBody=json.dumps(request.get_json(force=True)),
-        )
+        payload = request.get_json(force=True)
+        event_id = payload.get("id", None) if isinstance(payload, dict) else None
+
+        # The trace of the Hasura event continues here, and in the activity log (see tracing.py)
+        trace_parent = get_hasura_parent(payload)
+        created_at = get_hasura_created_at(payload)
+        if created_at is not None:
+            record_span(
+                "hasura_delivery",
+                parent=trace_parent,
+                start_time=created_at,
+                end_time=time.time_ns(),
+                attributes={"hasura.event_id": event_id},
+            )
+
+        with start_span(
+            "events_process",
+            parent=trace_parent,
+            attributes={"hasura.event_id": event_id, "moped.event_name": incoming_event_name},
+        ) as span:
+            # Large payloads are compressed, or offloaded to S3 (see events/helpers.py)
+            message_body = get_message_body(
+                payload=payload,
+                event_name=incoming_event_name,
+                environment=MOPED_API_CURRENT_ENVIRONMENT,
+            )
+            message_attributes = {
+                "traceparent": {"DataType": "String", "StringValue": span.get_traceparent()}
+            }
+
+            # Send message to SQS queue
+            sqs = boto3.client("sqs")
+            response = sqs.send_message(
+                QueueUrl=queue_url,
+                DelaySeconds=10,
+                MessageBody=message_body,
+                MessageAttributes=message_attributes,
+            )
+            span.attributes["messaging.message_id"] = response["MessageId"]
 
         return jsonify({
             "message": "Update queued: " + str(response["MessageId"])
         }), 200
 
     except Exception as e:
+        # Hasura does not retry, the event is kept on disk until SQS is available again
+        if message_body is not None:
+            try:
+                get_event_spool().append(queue_url=queue_url, body=message_body, attributes=message_attributes)
+                print(f"Update spooled, unable to queue it: {str(e)}")
+                return jsonify({
+                    "message": "Update spooled: " + str(e)
+                }), 202
+            except (SpoolFullError, OSError) as spool_error:
+                print(f"Unable to spool update request: {str(spool_error)}")
+
         return jsonify({
             "message": "Unable to queue update request: " + str(e)
         }), 503
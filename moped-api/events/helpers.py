@@ -0,0 +1,99 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+
+from codec import dumps_bytes
+
+#
+# Claim check: SQS messages can't be larger than 256 KB. Payloads larger than
+# MOPED_API_EVENTS_COMPRESS_THRESHOLD are gzipped and sent base64-encoded; if
+# they are still larger than MOPED_API_EVENTS_MAX_MESSAGE_SIZE, the gzipped
+# payload is written to S3 and only a pointer to it is enqueued. The
+# activity_log Lambda resolves both envelopes before processing the events.
+#
+MOPED_API_EVENTS_COMPRESS_THRESHOLD = int(
+    os.getenv("MOPED_API_EVENTS_COMPRESS_THRESHOLD", str(64 * 1024))
+)
+# Below the SQS limit, to leave room for the message attributes
+MOPED_API_EVENTS_MAX_MESSAGE_SIZE = int(
+    os.getenv("MOPED_API_EVENTS_MAX_MESSAGE_SIZE", str(240 * 1024))
+)
+MOPED_API_EVENTS_BUCKET = os.getenv("MOPED_API_EVENTS_BUCKET", "atd-moped-data-events")
+MOPED_API_EVENTS_PREFIX = os.getenv("MOPED_API_EVENTS_PREFIX", "claim-check")
+
+PAYLOAD_ENCODING_GZIP = "gzip+base64"
+PAYLOAD_ENCODING_S3 = "s3"
+
+
+def get_payload_sha256(data: bytes) -> str:
+    """
+    Returns the hex sha256 of the payload, it names the S3 object
+    :param bytes data: The encoded payload
+    :return str:
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_claim_check_key(event_name: str, environment: str, sha256: str) -> str:
+    """
+    Returns the S3 key of an offloaded payload
+    :param str event_name: The name of the Hasura event
+    :param str environment: The current environment (ie. staging)
+    :param str sha256: The sha256 of the payload
+    :return str:
+    """
+    return f"{MOPED_API_EVENTS_PREFIX}/{environment}/{event_name}/{sha256}.json.gz".lower()
+
+
+def get_message_body(
+    payload: dict,
+    event_name: str,
+    environment: str,
+    s3_client=None,
+    compress_threshold: int = MOPED_API_EVENTS_COMPRESS_THRESHOLD,
+    max_message_size: int = MOPED_API_EVENTS_MAX_MESSAGE_SIZE,
+) -> str:
+    """
+    Returns the SQS message body of a Hasura event payload: the payload itself
+    if it is small enough, otherwise a gzip envelope, or an S3 pointer
+    :param dict payload: The Hasura event payload
+    :param str event_name: The name of the Hasura event
+    :param str environment: The current environment (ie. staging)
+    :param object s3_client: The boto3 S3 client, only used for the largest payloads
+    :param int compress_threshold: Payloads larger than this (in bytes) are compressed
+    :param int max_message_size: Envelopes larger than this (in bytes) are offloaded to S3
+    :return str:
+    """
+    data = dumps_bytes(payload)
+    if len(data) <= compress_threshold:
+        return data.decode("utf-8")
+
+    compressed = gzip.compress(data, mtime=0)
+    body = json.dumps({
+        "payload_encoding": PAYLOAD_ENCODING_GZIP,
+        "payload": base64.b64encode(compressed).decode("ascii"),
+    })
+    if len(body) <= max_message_size:
+        return body
+
+    sha256 = get_payload_sha256(data)
+    key = get_claim_check_key(event_name=event_name, environment=environment, sha256=sha256)
+    if s3_client is None:
+        import boto3
+        s3_client = boto3.client("s3")
+    s3_client.put_object(
+        Bucket=MOPED_API_EVENTS_BUCKET,
+        Key=key,
+        Body=compressed,
+        ContentType="application/json",
+        ContentEncoding="gzip",
+    )
+    return json.dumps({
+        "payload_encoding": PAYLOAD_ENCODING_S3,
+        "bucket": MOPED_API_EVENTS_BUCKET,
+        "key": key,
+        "sha256": sha256,
+        "size": len(data),
+    })
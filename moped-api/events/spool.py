@@ -0,0 +1,505 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+#
+# Event spool: when an event can't be sent to SQS, events_process appends it
+# to an append-only spool on disk instead of losing it (the Hasura event
+# triggers do not retry). A background thread drains the spool in batches
+# with send_message_batch once SQS is available again.
+#
+#   The spool is a directory of segments (JSON Lines), one event per line.
+# The workers of the API share the directory, every process writes its own
+# segments ("<pid>-<sequence>.jsonl") and holds an flock on "<pid>.lock" for
+# as long as it runs. A process drains its own segments, and the segments of
+# the processes that exited: their lock is free, the first process to take
+# it drains them. The segments of a running process are never touched.
+# A line is written and flushed before the request returns, so it survives a
+# crash of the process; fsync runs every MOPED_API_EVENTS_SPOOL_FSYNC_BATCH
+# events, or every MOPED_API_EVENTS_SPOOL_FSYNC_INTERVAL seconds from the
+# drainer thread, so a burst does not pay for an fsync per request.
+#
+#   Delivery is at-least-once: an event may be sent twice if the drainer stops
+# between a batch and its checkpoint, the activity log ignores duplicates.
+#
+#   The drainer thread belongs to the process that created the spool. Nothing
+# is started at import time: a parent that imports the app before forking its
+# workers (ie. gunicorn --preload) would keep the thread, and every worker
+# would inherit a spool without one. Each worker resumes the spool on its first
+# request instead (resume_event_spool), and get_event_spool opens a new one if
+# the process was forked since.
+#
+MOPED_API_EVENTS_SPOOL_DIR = os.getenv("MOPED_API_EVENTS_SPOOL_DIR", "/tmp/moped-api-events-spool")
+MOPED_API_EVENTS_SPOOL_MAX_BYTES = int(os.getenv("MOPED_API_EVENTS_SPOOL_MAX_BYTES", str(256 * 1024 * 1024)))
+MOPED_API_EVENTS_SPOOL_SEGMENT_BYTES = int(os.getenv("MOPED_API_EVENTS_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+MOPED_API_EVENTS_SPOOL_FSYNC_BATCH = int(os.getenv("MOPED_API_EVENTS_SPOOL_FSYNC_BATCH", "32"))
+MOPED_API_EVENTS_SPOOL_FSYNC_INTERVAL = float(os.getenv("MOPED_API_EVENTS_SPOOL_FSYNC_INTERVAL", "0.2"))
+MOPED_API_EVENTS_SPOOL_DRAIN_INTERVAL = float(os.getenv("MOPED_API_EVENTS_SPOOL_DRAIN_INTERVAL", "5"))
+# The longest wait between two drain attempts while SQS keeps failing
+MOPED_API_EVENTS_SPOOL_MAX_BACKOFF = float(os.getenv("MOPED_API_EVENTS_SPOOL_MAX_BACKOFF", "300"))
+
+# The largest batch accepted by send_message_batch
+SQS_MAX_BATCH_SIZE = 10
+
+# The spool shared by the requests of this process, created on first use
+EVENT_SPOOL = None
+
+# The process that last checked for events left on disk, see resume_event_spool
+RESUMED_PID = None
+
+logger = logging.getLogger(__name__)
+
+
+class SpoolFullError(Exception):
+    """
+    Raised when an event does not fit in the spool
+    """
+    pass
+
+
+class EventSpool:
+    def __init__(
+        self,
+        directory: str = MOPED_API_EVENTS_SPOOL_DIR,
+        max_bytes: int = MOPED_API_EVENTS_SPOOL_MAX_BYTES,
+        segment_bytes: int = MOPED_API_EVENTS_SPOOL_SEGMENT_BYTES,
+        fsync_batch: int = MOPED_API_EVENTS_SPOOL_FSYNC_BATCH,
+        fsync_interval: float = MOPED_API_EVENTS_SPOOL_FSYNC_INTERVAL,
+        drain_interval: float = MOPED_API_EVENTS_SPOOL_DRAIN_INTERVAL,
+        sqs_client=None,
+    ):
+        """
+        Opens the spool of this process, the events left by processes that exited are drained too
+        :param str directory: The directory of the segments
+        :param int max_bytes: The maximum size of the spool, events are rejected beyond it
+        :param int segment_bytes: The size after which a new segment is started
+        :param int fsync_batch: The number of events written between two fsync calls
+        :param float fsync_interval: The maximum seconds an event waits for its fsync
+        :param float drain_interval: The seconds between two drain attempts
+        :param object sqs_client: The boto3 SQS client, default: created on first drain
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.drain_interval = drain_interval
+        self.sqs_client = sqs_client
+        # The process of the drainer thread, and the owner of the segments it writes
+        self.pid = os.getpid()
+
+        # Guards the active segment, the size and the metrics
+        self.lock = threading.Lock()
+        # Only one drain at a time
+        self.drain_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.active_file = None
+        self.active_path = None
+        self.active_bytes = 0
+        self.unsynced = 0
+        self.last_fsync = time.monotonic()
+        self.metrics = {
+            "spooled": 0,
+            "spooled_bytes": 0,
+            "rejected": 0,
+            "drained": 0,
+            "drain_errors": 0,
+            "fsyncs": 0,
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Held until the process exits (or close), the other processes leave its segments alone
+        self.lock_file = open(self.get_path(f"{self.pid}.lock"), "a")
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+        # Segments of a previous process with the same pid are this process' own
+        segments = self.list_segments(self.pid)
+        self.next_segment = self.get_sequence(segments[-1]) + 1 if segments else 0
+        # The events of this process left to send
+        self.size = sum(
+            os.path.getsize(self.get_path(segment)) - self.read_offset(segment) for segment in segments
+        )
+
+    def get_path(self, name: str) -> str:
+        """
+        Returns the path of a file of the spool
+        :param str name: The file name
+        :return str:
+        """
+        return os.path.join(self.directory, name)
+
+    def list_segments(self, pid: int) -> list:
+        """
+        Returns the segment file names of a process, oldest first
+        :param int pid: The process that wrote them
+        :return list:
+        """
+        return sorted(
+            name for name in os.listdir(self.directory) if name.startswith(f"{pid}-") and name.endswith(".jsonl")
+        )
+
+    @staticmethod
+    def get_sequence(segment: str) -> int:
+        """
+        Returns the sequence number of a segment
+        :param str segment: The segment file name, ie. 123-000000000004.jsonl
+        :return int: ie. 4
+        """
+        return int(segment.split(".")[0].split("-")[1])
+
+    def list_other_processes(self) -> list:
+        """
+        Returns the other processes with segments or a lock file in the directory
+        :return list: The pids
+        """
+        pids = set()
+        for name in os.listdir(self.directory):
+            if name.endswith(".jsonl"):
+                pid = name.split("-")[0]
+            elif name.endswith(".lock"):
+                pid = name[:-len(".lock")]
+            else:
+                continue
+            if pid.isdigit() and int(pid) != self.pid:
+                pids.add(int(pid))
+        return sorted(pids)
+
+    def lock_exited_process(self, pid: int):
+        """
+        Takes the lock of a process, if it exited and no other process drains its segments
+        :param int pid: The process
+        :return: The locked file, to be closed after draining, None if the process is running or drained
+        """
+        lock_file = open(self.get_path(f"{pid}.lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def has_exited_segments(self) -> bool:
+        """
+        Checks if processes that exited left segments to drain
+        :return bool:
+        """
+        for pid in self.list_other_processes():
+            if self.list_segments(pid):
+                lock_file = self.lock_exited_process(pid)
+                if lock_file is not None:
+                    lock_file.close()
+                    return True
+        return False
+
+    def read_offset(self, segment: str) -> int:
+        """
+        Returns the number of bytes of a segment already drained
+        :param str segment: The segment file name
+        :return int:
+        """
+        try:
+            with open(self.get_path(segment + ".offset")) as file:
+                return int(file.read())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def write_offset(self, segment: str, offset: int) -> None:
+        """
+        Records how many bytes of a segment were drained, the file is replaced atomically
+        :param str segment: The segment file name
+        :param int offset: The number of bytes drained
+        """
+        path = self.get_path(segment + ".offset")
+        with open(path + ".tmp", "w") as file:
+            file.write(str(offset))
+        os.replace(path + ".tmp", path)
+
+    def append(self, queue_url: str, body: str, attributes: dict = None) -> None:
+        """
+        Writes an event to the spool, and starts the drainer
+        :param str queue_url: The SQS queue of the event
+        :param str body: The SQS message body
+        :param dict attributes: The SQS message attributes (ie. traceparent)
+        :raises SpoolFullError: If the spool is full
+        """
+        line = (json.dumps({
+            "queue_url": queue_url,
+            "body": body,
+            "attributes": attributes,
+            "spooled_at": time.time(),
+        }) + "\n").encode("utf-8")
+
+        with self.lock:
+            if self.size + len(line) > self.max_bytes:
+                self.metrics["rejected"] += 1
+                raise SpoolFullError(f"The event spool is full ({self.size} bytes)")
+
+            if self.active_file is None or self.active_bytes >= self.segment_bytes:
+                self.open_segment()
+
+            self.active_file.write(line)
+            self.active_file.flush()
+            self.active_bytes += len(line)
+            self.size += len(line)
+            self.unsynced += 1
+            self.metrics["spooled"] += 1
+            self.metrics["spooled_bytes"] += len(line)
+
+            if self.unsynced >= self.fsync_batch:
+                self.fsync()
+
+        self.start_drainer()
+
+    def fsync(self) -> None:
+        """
+        Flushes the written events of the active segment to disk, the lock must be held
+        """
+        if self.active_file is not None and self.unsynced > 0:
+            os.fsync(self.active_file.fileno())
+            self.metrics["fsyncs"] += 1
+        self.unsynced = 0
+        self.last_fsync = time.monotonic()
+
+    def open_segment(self) -> None:
+        """
+        Closes the active segment, and starts a new one, the lock must be held
+        """
+        self.close_segment()
+        self.active_path = f"{self.pid}-{self.next_segment:012d}.jsonl"
+        self.active_file = open(self.get_path(self.active_path), "ab")
+        self.active_bytes = 0
+        self.next_segment += 1
+
+    def close_segment(self) -> None:
+        """
+        Closes the active segment so it can be drained, the lock must be held
+        """
+        if self.active_file is not None:
+            self.fsync()
+            self.active_file.close()
+        self.active_file = None
+        self.active_path = None
+        self.active_bytes = 0
+
+    def get_sqs_client(self):
+        """
+        Returns the SQS client, it is created on first use
+        :return: The boto3 SQS client
+        """
+        if self.sqs_client is None:
+            import boto3
+            self.sqs_client = boto3.client("sqs")
+        return self.sqs_client
+
+    def send_batch(self, queue_url: str, events: list) -> bool:
+        """
+        Sends a batch of events to SQS
+        :param str queue_url: The SQS queue
+        :param list events: Up to 10 spooled events
+        :return bool: True if every message was sent
+        """
+        entries = []
+        for index, event in enumerate(events):
+            entry = {"Id": str(index), "MessageBody": event["body"], "DelaySeconds": 10}
+            if event.get("attributes", None):
+                entry["MessageAttributes"] = event["attributes"]
+            entries.append(entry)
+
+        response = self.get_sqs_client().send_message_batch(QueueUrl=queue_url, Entries=entries)
+        return len(response.get("Failed", [])) == 0
+
+    def drain_segment(self, segment: str, own: bool = True) -> int:
+        """
+        Sends the events of a closed segment, in batches of events of the same queue.
+        The offset is recorded after every batch, the segment is deleted once sent.
+        :param str segment: The segment file name
+        :param bool own: False for the segment of a process that exited, it is not in the size
+        :return int: The number of events sent
+        :raises RuntimeError: If a batch could not be sent
+        """
+        offset = self.read_offset(segment)
+        drained = 0
+        batch = []
+        batch_bytes = 0
+
+        def send() -> None:
+            nonlocal offset, drained, batch, batch_bytes
+            if not self.send_batch(batch[0]["queue_url"], batch):
+                raise RuntimeError(f"Could not send a batch of {segment}")
+            offset += batch_bytes
+            drained += len(batch)
+            self.write_offset(segment, offset)
+            with self.lock:
+                if own:
+                    self.size -= batch_bytes
+                self.metrics["drained"] += len(batch)
+            batch, batch_bytes = [], 0
+
+        with open(self.get_path(segment), "rb") as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b"\n"):
+                    # A line cut by a crash before its flush, it was never acknowledged
+                    break
+                event = json.loads(line)
+                if len(batch) > 0 and (len(batch) == SQS_MAX_BATCH_SIZE or event["queue_url"] != batch[0]["queue_url"]):
+                    send()
+                batch.append(event)
+                batch_bytes += len(line)
+            if len(batch) > 0:
+                send()
+
+        if own:
+            with self.lock:
+                self.size -= os.path.getsize(self.get_path(segment)) - offset
+        os.remove(self.get_path(segment))
+        if os.path.exists(self.get_path(segment + ".offset")):
+            os.remove(self.get_path(segment + ".offset"))
+        return drained
+
+    def drain_segments(self, segments: list, own: bool = True) -> bool:
+        """
+        Sends the events of closed segments, oldest first. It stops at the first
+        batch that fails, the next drain resumes from there.
+        :param list segments: The segment file names
+        :param bool own: False for the segments of a process that exited
+        :return bool: True if every segment was sent
+        """
+        for segment in segments:
+            try:
+                self.drain_segment(segment, own=own)
+            except Exception as e:
+                with self.lock:
+                    self.metrics["drain_errors"] += 1
+                logger.error(f"Could not drain the event spool: {str(e)}")
+                return False
+        return True
+
+    def drain_exited_processes(self) -> bool:
+        """
+        Sends the events left by the processes that exited, their lock is removed once they are sent
+        :return bool: True if every segment was sent
+        """
+        for pid in self.list_other_processes():
+            lock_file = self.lock_exited_process(pid)
+            if lock_file is None:
+                continue
+            try:
+                if not self.drain_segments(self.list_segments(pid), own=False):
+                    return False
+                os.remove(self.get_path(f"{pid}.lock"))
+            finally:
+                lock_file.close()
+        return True
+
+    def drain(self) -> int:
+        """
+        Sends the spooled events of this process, then the events left by the
+        processes that exited, oldest first. It stops at the first batch that
+        fails, the next drain resumes from there.
+        :return int: The number of events sent
+        """
+        with self.drain_lock:
+            with self.lock:
+                self.close_segment()
+                segments = self.list_segments(self.pid)
+                drained = self.metrics["drained"]
+
+            if self.drain_segments(segments):
+                self.drain_exited_processes()
+
+            with self.lock:
+                return self.metrics["drained"] - drained
+
+    def run_drainer(self) -> None:
+        """
+        The drainer thread: flushes the pending fsync and drains the spool, with
+        an exponential backoff while SQS is failing
+        """
+        delay = self.drain_interval
+        next_drain = time.monotonic() + delay
+        while not self.stop_event.wait(self.fsync_interval):
+            with self.lock:
+                if self.unsynced > 0 and time.monotonic() - self.last_fsync >= self.fsync_interval:
+                    self.fsync()
+
+            if time.monotonic() >= next_drain:
+                errors = self.metrics["drain_errors"]
+                if self.size > 0 or self.has_exited_segments():
+                    self.drain()
+                if self.metrics["drain_errors"] == errors:
+                    delay = self.drain_interval
+                else:
+                    delay = min(delay * 2, MOPED_API_EVENTS_SPOOL_MAX_BACKOFF)
+                    logger.warning(f"Event spool: {self.size} bytes left, next drain in {delay} seconds")
+                next_drain = time.monotonic() + delay
+
+    def start_drainer(self) -> None:
+        """
+        Starts the drainer thread, if it is not running
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run_drainer, name="event-spool-drainer", daemon=True)
+            self.thread.start()
+
+    def stop_drainer(self) -> None:
+        """
+        Stops the drainer thread, and flushes the active segment
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            self.fsync()
+
+    def close(self) -> None:
+        """
+        Stops the drainer thread, and releases the segments: the next process drains them
+        """
+        self.stop_drainer()
+        with self.lock:
+            self.close_segment()
+        self.lock_file.close()
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the counters of the spool, and the size of the events of this process left to send
+        :return dict:
+        """
+        with self.lock:
+            return {**self.metrics, "pending_bytes": self.size}
+
+
+def get_event_spool() -> EventSpool:
+    """
+    Returns the spool of this process, events left by processes that exited are drained
+    :return EventSpool:
+    """
+    global EVENT_SPOOL
+    # A spool inherited from the parent process has no drainer thread here
+    if EVENT_SPOOL is None or EVENT_SPOOL.pid != os.getpid():
+        EVENT_SPOOL = EventSpool(directory=MOPED_API_EVENTS_SPOOL_DIR)
+        if EVENT_SPOOL.size > 0 or EVENT_SPOOL.has_exited_segments():
+            EVENT_SPOOL.start_drainer()
+    return EVENT_SPOOL
+
+
+def resume_event_spool() -> None:
+    """
+    Drains the events left on disk by processes that exited, if there are any.
+    Only the first call of every process checks the directory.
+    """
+    global RESUMED_PID
+    if RESUMED_PID == os.getpid():
+        return
+    RESUMED_PID = os.getpid()
+    if os.path.isdir(MOPED_API_EVENTS_SPOOL_DIR) and any(
+        name.endswith(".jsonl") for name in os.listdir(MOPED_API_EVENTS_SPOOL_DIR)
+    ):
+        get_event_spool()
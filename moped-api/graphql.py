@@ -1,6 +1,7 @@
 import requests
 from config import get_config
 from requests import Response
+from metrics import time_dependency
 
 
 def get_hasura_endpoint(alternative_conf=None) -> str:
@@ -64,14 +65,17 @@ def run_query(query: str, variables: dict, alternative_conf=None) -> Response:
     """
     if alternative_conf is None:
         alternative_conf = {}
-    response = requests.post(
-        url=get_hasura_endpoint(alternative_conf) + "/v1/graphql",
-        headers=generate_hasura_headers(alternative_conf),
-        json={
-            "query": query,
-            "variables": variables
-        }
-    )
+    with time_dependency("hasura", "run_query") as outcome:
+        response = requests.post(
+            url=get_hasura_endpoint(alternative_conf) + "/v1/graphql",
+            headers=generate_hasura_headers(alternative_conf),
+            json={
+                "query": query,
+                "variables": variables
+            }
+        )
+        if response.status_code >= 400:
+            outcome["outcome"] = "error"
     response.encoding = "utf-8"
     return response
 
@@ -85,15 +89,18 @@ def run_sql(query: str, alternative_conf=None) -> Response:
     """
     if alternative_conf is None:
         alternative_conf = {}
-    response = requests.post(
-        url=get_hasura_endpoint(alternative_conf) + "/v1/query",
-        headers=generate_hasura_headers(alternative_conf),
-        json={
-            "type": "run_sql",
-            "args": {
-                "sql": query
+    with time_dependency("hasura", "run_sql") as outcome:
+        response = requests.post(
+            url=get_hasura_endpoint(alternative_conf) + "/v1/query",
+            headers=generate_hasura_headers(alternative_conf),
+            json={
+                "type": "run_sql",
+                "args": {
+                    "sql": query
+                }
             }
-        }
-    )
+        )
+        if response.status_code >= 400:
+            outcome["outcome"] = "error"
     response.encoding = "utf-8"
     return response
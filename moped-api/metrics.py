@@ -0,0 +1,359 @@
+#
+# Metrics
+#
+#   Latency histograms of the API routes (moped_api_request_duration_seconds)
+# and of the calls to its dependencies (moped_api_dependency_duration_seconds):
+# every boto3 call (Cognito, DynamoDB, S3, SQS, Secrets Manager...) and the
+# Hasura requests of graphql.py. They are exposed at GET /metrics in the
+# Prometheus text format.
+#
+#   Every worker process keeps its own histograms, in memory, and writes them
+# to MOPED_API_METRICS_DIR/<pid>.json at most every
+# MOPED_API_METRICS_FLUSH_INTERVAL seconds. /metrics adds up the files of
+# every worker, so any worker can answer for all of them. The files of workers
+# that exited are removed, Prometheus reads the drop of their counters as a
+# reset.
+#
+#   MOPED_API_METRICS_TOKEN: /metrics requires "Authorization: Bearer <token>",
+# it refuses every request while the token is not set
+#
+import os
+import time
+import bisect
+import hmac
+import threading
+from contextlib import contextmanager
+
+from flask import Flask, Response, g, request
+
+from codec import dumps_bytes, loads
+
+MOPED_API_METRICS_DIR = os.getenv("MOPED_API_METRICS_DIR", "/tmp/moped-api-metrics")
+MOPED_API_METRICS_FLUSH_INTERVAL = float(os.getenv("MOPED_API_METRICS_FLUSH_INTERVAL", "5"))
+MOPED_API_METRICS_TOKEN = os.getenv("MOPED_API_METRICS_TOKEN", "")
+
+# The upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_DURATION = "moped_api_request_duration_seconds"
+DEPENDENCY_DURATION = "moped_api_dependency_duration_seconds"
+
+HELP = {
+    REQUEST_DURATION: "Duration of the API requests, by route, method and status",
+    DEPENDENCY_DURATION: "Duration of the calls to the dependencies of the API, by dependency, operation and outcome",
+}
+
+# (name, labels) -> [count of every bucket..., count of +Inf, sum]
+HISTOGRAMS = {}
+
+# Functions returning counters (named *_total) and gauges of this process, ie. the event spool
+COLLECTORS = []
+
+# Guards HISTOGRAMS
+LOCK = threading.Lock()
+
+# When this process last wrote its file, on the monotonic clock
+LAST_FLUSH = [0.0]
+
+
+def observe(name: str, labels: dict, seconds: float) -> None:
+    """
+    Records a duration in a histogram
+    :param str name: The name of the histogram
+    :param dict labels: The labels of the series
+    :param float seconds: The duration
+    """
+    key = (name, tuple(sorted(labels.items())))
+    index = bisect.bisect_left(BUCKETS, seconds)
+    with LOCK:
+        series = HISTOGRAMS.get(key, None)
+        if series is None:
+            series = HISTOGRAMS[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+        series[index] += 1
+        series[-1] += seconds
+
+
+@contextmanager
+def time_dependency(dependency: str, operation: str):
+    """
+    Records the duration of a call to a dependency. The outcome is "error" if
+    the block raises, or if it sets outcome["outcome"] (ie. from a status code)
+    :param str dependency: The dependency, ie. hasura
+    :param str operation: The operation, ie. run_query
+    :return dict: The outcome, the block may change it
+    """
+    outcome = {"outcome": "ok"}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        outcome["outcome"] = "error"
+        raise
+    finally:
+        observe(
+            DEPENDENCY_DURATION,
+            {"dependency": dependency, "operation": operation, "outcome": outcome["outcome"]},
+            time.perf_counter() - start,
+        )
+
+
+def register_collector(collector) -> None:
+    """
+    Adds counters and gauges of this process to /metrics, they are added up across workers
+    :param Callable collector: Returns a dictionary of metric name -> value, counters end with _total
+    """
+    COLLECTORS.append(collector)
+
+
+def get_snapshot() -> dict:
+    """
+    Returns the metrics of this process
+    :return dict: The histograms, as [name, labels, values] lists, and the counters
+    """
+    with LOCK:
+        histograms = [[name, list(labels), list(series)] for (name, labels), series in HISTOGRAMS.items()]
+
+    counters = {}
+    for collector in COLLECTORS:
+        try:
+            counters.update(collector())
+        except Exception as e:
+            print(f"Could not collect metrics: {str(e)}")
+    return {"histograms": histograms, "counters": counters}
+
+
+def flush(directory: str = None, force: bool = False) -> None:
+    """
+    Writes the metrics of this process to its file, at most every MOPED_API_METRICS_FLUSH_INTERVAL seconds
+    :param str directory: The directory of the files of every worker, default: MOPED_API_METRICS_DIR
+    :param bool force: True to write it now
+    """
+    now = time.monotonic()
+    if not force and now - LAST_FLUSH[0] < MOPED_API_METRICS_FLUSH_INTERVAL:
+        return
+    LAST_FLUSH[0] = now
+
+    directory = directory or MOPED_API_METRICS_DIR
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "wb") as file:
+            file.write(dumps_bytes(get_snapshot()))
+        # Readers never see a partial file
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Could not write the metrics: {str(e)}")
+
+
+def is_alive(pid: int) -> bool:
+    """
+    Checks if a process is running
+    :param int pid: The process id
+    :return bool:
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It runs as another user
+        return True
+    return True
+
+
+def collect(directory: str = None) -> dict:
+    """
+    Adds up the metrics of every worker
+    :param str directory: The directory of the files of every worker, default: MOPED_API_METRICS_DIR
+    :return dict: The histograms, (name, labels) -> values, and the counters
+    """
+    directory = directory or MOPED_API_METRICS_DIR
+    flush(directory=directory, force=True)
+
+    histograms = {}
+    counters = {}
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".json"):
+            continue
+        pid = file_name[:-len(".json")]
+        if pid.isdigit() and int(pid) != os.getpid() and not is_alive(int(pid)):
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+            continue
+        try:
+            with open(os.path.join(directory, file_name), "rb") as file:
+                snapshot = loads(file.read())
+        except (OSError, ValueError):
+            continue
+
+        for name, labels, values in snapshot.get("histograms", []):
+            key = (name, tuple(tuple(label) for label in labels))
+            totals = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                totals[index] += value
+        for name, value in snapshot.get("counters", {}).items():
+            counters[name] = counters.get(name, 0) + value
+
+    return {"histograms": histograms, "counters": counters}
+
+
+def format_labels(labels) -> str:
+    """
+    Formats the labels of a series
+    :param tuple labels: (name, value) pairs
+    :return str: ie. {route="/users/",status="200"}
+    """
+    escaped = [
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    ]
+    return "{" + ",".join(escaped) + "}" if escaped else ""
+
+
+def format_le(bound: float) -> str:
+    """
+    Formats the upper bound of a bucket
+    :param float bound: The bound, in seconds
+    :return str:
+    """
+    return repr(float(bound))
+
+
+def render(metrics: dict) -> str:
+    """
+    Renders metrics in the Prometheus text exposition format
+    :param dict metrics: The metrics, as returned by collect
+    :return str:
+    """
+    lines = []
+    by_name = {}
+    for (name, labels), values in sorted(metrics["histograms"].items()):
+        by_name.setdefault(name, []).append((labels, values))
+
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', format_le(bound)),))} {cumulative}")
+            cumulative += values[len(BUCKETS)]
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+
+    for name, value in sorted(metrics["counters"].items()):
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def start_boto3_call(context: dict = None, **kwargs) -> None:
+    """
+    botocore before-call hook: the start of a call
+    """
+    if context is not None:
+        context["moped_api_metrics_start"] = time.perf_counter()
+
+
+def end_boto3_call(model=None, http_response=None, context: dict = None, **kwargs) -> None:
+    """
+    botocore after-call hook: records the duration of a call
+    """
+    start = (context or {}).get("moped_api_metrics_start", None)
+    if start is None or model is None:
+        return
+    status_code = getattr(http_response, "status_code", 500)
+    observe(
+        DEPENDENCY_DURATION,
+        {
+            "dependency": model.service_model.service_name,
+            "operation": model.name,
+            "outcome": "ok" if status_code < 400 else "error",
+        },
+        time.perf_counter() - start,
+    )
+
+
+def instrument_boto3() -> None:
+    """
+    Times the calls of the boto3 clients created from now on with the default session
+    """
+    import boto3
+
+    events = boto3._get_default_session().events
+    events.register("before-call.*.*", start_boto3_call, unique_id="moped-api-metrics-before-call")
+    events.register("after-call.*.*", end_boto3_call, unique_id="moped-api-metrics-after-call")
+
+
+def start_request() -> None:
+    """
+    Flask before_request hook
+    """
+    g.moped_api_metrics_start = time.perf_counter()
+
+
+def end_request(response: Response) -> Response:
+    """
+    Flask after_request hook: records the duration of the request
+    :param Response response: The response
+    :return Response: The response, unchanged
+    """
+    record_request(response.status_code)
+    return response
+
+
+def end_failed_request(exception: Exception = None) -> None:
+    """
+    Flask teardown_request hook: records the requests that raised (after_request is not called)
+    :param Exception exception: The unhandled exception, if any
+    """
+    if exception is not None:
+        record_request(500)
+
+
+def record_request(status_code: int) -> None:
+    """
+    Records the duration of the current request, once
+    :param int status_code: The HTTP status code of the response
+    """
+    start = g.pop("moped_api_metrics_start", None)
+    if start is None:
+        return
+    # The route pattern (ie. /users/<id>), not the path, keeps the number of series bounded
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    observe(
+        REQUEST_DURATION,
+        {"route": route, "method": request.method, "status": str(status_code)},
+        time.perf_counter() - start,
+    )
+    flush()
+
+
+def metrics_index() -> Response:
+    """
+    Returns the metrics of every worker in the Prometheus text format
+    :return Response:
+    """
+    token = request.headers.get("Authorization", "")
+    if not MOPED_API_METRICS_TOKEN or \
+            not hmac.compare_digest(token.encode("utf-8"), f"Bearer {MOPED_API_METRICS_TOKEN}".encode("utf-8")):
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return Response(render(collect()), mimetype="text/plain; version=0.0.4")
+
+
+def init_app(app: Flask) -> None:
+    """
+    Times the requests of an app and the boto3 calls, and adds GET /metrics.
+    Call instrument_boto3 before, if clients are created when the blueprints are imported.
+    :param Flask app: The Flask application
+    """
+    app.before_request(start_request)
+    app.after_request(end_request)
+    app.teardown_request(end_failed_request)
+    app.add_url_rule("/metrics", "metrics_index", metrics_index, methods=["GET"])
+    instrument_boto3()
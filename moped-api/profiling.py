@@ -0,0 +1,377 @@
+#
+# On-demand profiling
+#
+#   A request that sends the X-Moped-Profile header runs under a sampling
+# profiler if either:
+#   - the header is signed: "<expires>.<hmac>", see sign_profiling_header
+#     (MOPED_API_PROFILING_SECRET must be set), or
+#   - the request is authenticated by a moped-admin.
+#
+#   A background thread reads the stack of the request thread every
+# MOPED_API_PROFILING_INTERVAL seconds (sys._current_frames), and the samples
+# are kept as folded stacks ("module.function;module.function count" lines),
+# the input of flamegraph.pl, speedscope or inferno. The profile id is
+# returned in the X-Moped-Profile-Id response header, and the profile can be
+# downloaded from GET /profiles/<profile_id> (same authorization).
+#
+#   Requests without the header only pay for a header lookup. A process runs
+# one profile at a time, and at most MOPED_API_PROFILING_RATE_LIMIT per minute.
+#
+import os
+import re
+import sys
+import hmac
+import time
+import uuid
+import hashlib
+import threading
+from collections import Counter, deque
+
+from flask import Flask, Response, current_app, g, request
+
+from claims import has_user_role
+
+MOPED_API_PROFILING_SECRET = os.getenv("MOPED_API_PROFILING_SECRET", "")
+MOPED_API_PROFILING_INTERVAL = float(os.getenv("MOPED_API_PROFILING_INTERVAL", "0.005"))
+# Sampling stops after this many seconds, the request goes on
+MOPED_API_PROFILING_MAX_SECONDS = float(os.getenv("MOPED_API_PROFILING_MAX_SECONDS", "30"))
+MOPED_API_PROFILING_RATE_LIMIT = int(os.getenv("MOPED_API_PROFILING_RATE_LIMIT", "6"))
+MOPED_API_PROFILING_DIR = os.getenv("MOPED_API_PROFILING_DIR", "/tmp/moped-api-profiles")
+# The most recent profiles kept in MOPED_API_PROFILING_DIR
+MOPED_API_PROFILING_MAX_PROFILES = int(os.getenv("MOPED_API_PROFILING_MAX_PROFILES", "100"))
+# If set, profiles are stored in this bucket instead, so any instance can serve them
+MOPED_API_PROFILING_S3_BUCKET = os.getenv("MOPED_API_PROFILING_S3_BUCKET", None)
+
+PROFILING_HEADER = "X-Moped-Profile"
+PROFILE_ID_HEADER = "X-Moped-Profile-Id"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]+-[0-9a-f]{12}$")
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread from a background thread
+    """
+
+    def __init__(
+        self,
+        thread_id: int,
+        interval: float = MOPED_API_PROFILING_INTERVAL,
+        max_seconds: float = MOPED_API_PROFILING_MAX_SECONDS,
+    ):
+        """
+        Constructor for the profiler, sampling starts with start
+        :param int thread_id: The thread to sample, ie. threading.get_ident()
+        :param float interval: The seconds between two samples
+        :param float max_seconds: The seconds after which sampling stops
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+
+        # Folded stack -> number of samples
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def fold(frame) -> str:
+        """
+        Returns a stack as a folded string, from the outermost frame
+        :param frame frame: The innermost frame
+        :return str: ie. app.view;claims.get_hasura_claims
+        """
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_name}".replace(";", ":").replace(" ", "_"))
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def sample(self) -> None:
+        """
+        Records the current stack of the thread
+        """
+        frame = sys._current_frames().get(self.thread_id, None)
+        if frame is not None:
+            self.stacks[self.fold(frame)] += 1
+            self.samples += 1
+
+    def run_sampler(self) -> None:
+        """
+        The sampler thread: samples every interval seconds until stopped, or for max_seconds
+        """
+        deadline = self.started_at + self.max_seconds
+        while not self.stop_event.wait(self.interval) and time.monotonic() < deadline:
+            self.sample()
+
+    def start(self) -> None:
+        """
+        Starts the sampler thread
+        """
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self.run_sampler, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the sampler thread
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.duration = time.monotonic() - self.started_at
+
+    def get_folded(self) -> str:
+        """
+        Returns the samples as folded stacks, one "stack count" line each
+        :return str:
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RateLimiter:
+    """
+    Allows one profile at a time, and at most limit per period seconds
+    """
+
+    def __init__(self, limit: int = MOPED_API_PROFILING_RATE_LIMIT, period: float = 60):
+        """
+        Constructor for the rate limiter
+        :param int limit: The maximum profiles per period
+        :param float period: The period, in seconds
+        """
+        self.limit = limit
+        self.period = period
+        self.started = deque()
+        self.lock = threading.Lock()
+        self.running = False
+
+    def acquire(self) -> bool:
+        """
+        Reserves a profile, release must be called after it
+        :return bool: False if a profile is running or the limit is reached
+        """
+        now = time.monotonic()
+        with self.lock:
+            while self.started and now - self.started[0] >= self.period:
+                self.started.popleft()
+            if self.running or len(self.started) >= self.limit:
+                return False
+            self.started.append(now)
+            self.running = True
+            return True
+
+    def release(self) -> None:
+        """
+        Ends the running profile
+        """
+        with self.lock:
+            self.running = False
+
+
+RATE_LIMITER = RateLimiter()
+
+
+def get_signature(expires: int, secret: str = None) -> str:
+    """
+    Returns the signature of an expiration time
+    :param int expires: The expiration time, a unix timestamp
+    :param str secret: The secret, default: MOPED_API_PROFILING_SECRET
+    :return str: The hex HMAC-SHA256
+    """
+    secret = secret or MOPED_API_PROFILING_SECRET
+    return hmac.new(secret.encode("utf-8"), str(expires).encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def sign_profiling_header(expires_in: int = 600, secret: str = None) -> str:
+    """
+    Returns a value for the X-Moped-Profile header, valid for expires_in seconds
+    :param int expires_in: The seconds the value is valid for
+    :param str secret: The secret, default: MOPED_API_PROFILING_SECRET
+    :return str: ie. 1634567890.5d41402abc4b2a76b9719d911017c592...
+    """
+    expires = int(time.time()) + expires_in
+    return f"{expires}.{get_signature(expires, secret)}"
+
+
+def is_signed(value: str) -> bool:
+    """
+    Checks a signed X-Moped-Profile header
+    :param str value: The value of the header
+    :return bool: True if it is signed with MOPED_API_PROFILING_SECRET and did not expire
+    """
+    if not MOPED_API_PROFILING_SECRET:
+        return False
+    expires, _, signature = value.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, get_signature(int(expires)))
+
+
+def is_admin() -> bool:
+    """
+    Checks if the current request is authenticated by a moped-admin
+    :return bool:
+    """
+    cognito = current_app.extensions.get("cognito_auth", None)
+    if cognito is None:
+        return False
+    try:
+        token = cognito.get_token()
+        # The token cache makes this free for the view
+        return token is not None and has_user_role("moped-admin", cognito.decode_token(token=token))
+    except Exception:
+        return False
+
+
+def is_authorized() -> bool:
+    """
+    Checks if the current request may be profiled, or download profiles
+    :return bool:
+    """
+    value = request.headers.get(PROFILING_HEADER, "")
+    return is_signed(value) or is_admin()
+
+
+def store_profile(profile_id: str, folded: str) -> None:
+    """
+    Stores a profile, in MOPED_API_PROFILING_S3_BUCKET or MOPED_API_PROFILING_DIR
+    :param str profile_id: The id of the profile
+    :param str folded: The folded stacks
+    """
+    if MOPED_API_PROFILING_S3_BUCKET:
+        import boto3
+        boto3.client("s3").put_object(
+            Bucket=MOPED_API_PROFILING_S3_BUCKET,
+            Key=f"profiles/{profile_id}.folded",
+            Body=folded.encode("utf-8"),
+        )
+        return
+
+    os.makedirs(MOPED_API_PROFILING_DIR, exist_ok=True)
+    with open(os.path.join(MOPED_API_PROFILING_DIR, f"{profile_id}.folded"), "w") as file:
+        file.write(folded)
+
+    # The ids start with a timestamp, the oldest are first
+    profiles = sorted(name for name in os.listdir(MOPED_API_PROFILING_DIR) if name.endswith(".folded"))
+    for name in profiles[:-MOPED_API_PROFILING_MAX_PROFILES]:
+        os.remove(os.path.join(MOPED_API_PROFILING_DIR, name))
+
+
+def load_profile(profile_id: str):
+    """
+    Returns a stored profile
+    :param str profile_id: The id of the profile
+    :return str: The folded stacks, None if it does not exist
+    """
+    if MOPED_API_PROFILING_S3_BUCKET:
+        import boto3
+        from botocore.exceptions import ClientError
+        try:
+            response = boto3.client("s3").get_object(
+                Bucket=MOPED_API_PROFILING_S3_BUCKET,
+                Key=f"profiles/{profile_id}.folded",
+            )
+        except ClientError:
+            return None
+        return response["Body"].read().decode("utf-8")
+
+    try:
+        with open(os.path.join(MOPED_API_PROFILING_DIR, f"{profile_id}.folded")) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def start_profile() -> None:
+    """
+    Flask before_request hook: starts the profiler if the request asks for it and may
+    """
+    if PROFILING_HEADER not in request.headers:
+        return
+    if request.endpoint == "profiles_download" or not is_authorized():
+        return
+    if not RATE_LIMITER.acquire():
+        print("Profiling skipped: rate limit reached")
+        return
+
+    profiler = SamplingProfiler(
+        threading.get_ident(),
+        interval=MOPED_API_PROFILING_INTERVAL,
+        max_seconds=MOPED_API_PROFILING_MAX_SECONDS,
+    )
+    g.moped_api_profile = (f"{int(time.time())}-{uuid.uuid4().hex[:12]}", profiler)
+    profiler.start()
+
+
+def end_profile(response: Response) -> Response:
+    """
+    Flask after_request hook: stops the profiler and stores the profile
+    :param Response response: The response
+    :return Response: The response, with the profile id
+    """
+    profile_id = stop_profile()
+    if profile_id is not None:
+        response.headers[PROFILE_ID_HEADER] = profile_id
+    return response
+
+
+def end_failed_profile(exception: Exception = None) -> None:
+    """
+    Flask teardown_request hook: stores the profiles of requests that raised
+    :param Exception exception: The unhandled exception, if any
+    """
+    stop_profile()
+
+
+def stop_profile():
+    """
+    Stops the profiler of the current request, if any, and stores the profile
+    :return str: The id of the profile, None if the request was not profiled
+    """
+    profile = g.pop("moped_api_profile", None)
+    if profile is None:
+        return None
+
+    profile_id, profiler = profile
+    try:
+        profiler.stop()
+        store_profile(profile_id, profiler.get_folded())
+    except Exception as e:
+        print(f"Could not store the profile {profile_id}: {str(e)}")
+        return None
+    finally:
+        RATE_LIMITER.release()
+    return profile_id
+
+
+def profiles_download(profile_id: str) -> Response:
+    """
+    Returns a stored profile as folded stacks
+    :param str profile_id: The id of the profile, from the X-Moped-Profile-Id header
+    :return Response:
+    """
+    if not is_authorized():
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    profile = load_profile(profile_id) if PROFILE_ID_PATTERN.match(profile_id) else None
+    if profile is None:
+        return Response("Not Found\n", status=404, mimetype="text/plain")
+    return Response(
+        profile,
+        mimetype="text/plain",
+        headers={"Content-Disposition": f"attachment; filename={profile_id}.folded"},
+    )
+
+
+def init_app(app: Flask) -> None:
+    """
+    Lets the requests of an app be profiled on demand, and adds GET /profiles/<profile_id>
+    :param Flask app: The Flask application
+    """
+    app.before_request(start_profile)
+    app.after_request(end_profile)
+    app.teardown_request(end_failed_profile)
+    app.add_url_rule("/profiles/<profile_id>", "profiles_download", profiles_download, methods=["GET"])
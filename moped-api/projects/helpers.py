@@ -0,0 +1,126 @@
+"""
+Helper methods for the project activity feed
+"""
+import re
+
+from dateutil import parser as date_parser
+from graphql import run_query
+
+from projects.queries import (
+    GRAPHQL_PROJECT_ACTIVITY,
+    GRAPHQL_PROJECT_ACTIVITY_WITH_RECORD_DATA,
+)
+
+ACTIVITY_DEFAULT_LIMIT = 50
+ACTIVITY_MAX_LIMIT = 200
+
+
+def is_valid_uuid(activity_id: str) -> bool:
+    """
+    Returns true if the activity_id string is a valid UUID format.
+    :param str activity_id: The string to be evaluated
+    :return bool:
+    """
+    pattern = re.compile(
+        r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+    )
+    return True if pattern.search(str(activity_id)) else False
+
+
+def parse_activity_limit(limit: str) -> int:
+    """
+    Parses the page size, it defaults to ACTIVITY_DEFAULT_LIMIT and is capped at ACTIVITY_MAX_LIMIT
+    :param str limit: The limit query string value
+    :return int: The page size
+    """
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return ACTIVITY_DEFAULT_LIMIT
+    return max(1, min(limit, ACTIVITY_MAX_LIMIT))
+
+
+def parse_activity_cursor(cursor: str) -> tuple:
+    """
+    Parses a cursor in the form <created_at>,<activity_id>
+    :param str cursor: The cursor, ie. "2021-06-01T12:00:00.123456+00:00,9b8c...-..."
+    :raises ValueError: If the cursor is not valid
+    :return tuple: The created_at and activity_id values
+    """
+    try:
+        created_at, activity_id = str(cursor).rsplit(",", 1)
+    except ValueError:
+        raise ValueError("The cursor must be <created_at>,<activity_id>")
+
+    # An unencoded + in a query string arrives as a space
+    created_at = created_at.strip().replace(" ", "+")
+    activity_id = activity_id.strip().lower()
+
+    try:
+        date_parser.isoparse(created_at)
+    except ValueError:
+        raise ValueError("The cursor created_at is not an ISO timestamp")
+
+    if not is_valid_uuid(activity_id):
+        raise ValueError("The cursor activity_id is not a valid uuid")
+
+    return created_at, activity_id
+
+
+def generate_activity_cursor(activity: dict) -> str:
+    """
+    Generates the cursor that points right after an activity log record
+    :param dict activity: The activity log record
+    :return str: The cursor
+    """
+    return f"{activity['created_at']},{activity['activity_id']}"
+
+
+def generate_activity_where(project_id: int, cursor: tuple = None) -> dict:
+    """
+    Generates the where clause for a page of the activity feed. With a cursor,
+    created_at is bound by _lte so the index range starts at the cursor, and
+    ties on created_at are broken by activity_id.
+    :param int project_id: The project id
+    :param tuple cursor: The created_at and activity_id of the last record of the previous page
+    :return dict: The where clause
+    """
+    where = {"record_project_id": {"_eq": project_id}}
+    if cursor is not None:
+        created_at, activity_id = cursor
+        where["created_at"] = {"_lte": created_at}
+        where["_or"] = [
+            {"created_at": {"_lt": created_at}},
+            {"created_at": {"_eq": created_at}, "activity_id": {"_lt": activity_id}},
+        ]
+    return where
+
+
+def db_get_project_activity(project_id: int, cursor: tuple = None, limit: int = ACTIVITY_DEFAULT_LIMIT, include_record_data: bool = False) -> dict:
+    """
+    Retrieves a page of the activity feed of a project
+    :param int project_id: The project id
+    :param tuple cursor: The created_at and activity_id of the last record of the previous page
+    :param int limit: The page size
+    :param bool include_record_data: If True, the record_data column is included
+    :return dict: The page, with the cursor of the next page (None on the last page)
+    """
+    response = run_query(
+        query=GRAPHQL_PROJECT_ACTIVITY_WITH_RECORD_DATA if include_record_data else GRAPHQL_PROJECT_ACTIVITY,
+        variables={
+            "where": generate_activity_where(project_id=project_id, cursor=cursor),
+            # One more record tells us if there is a next page
+            "limit": limit + 1,
+        },
+    ).json()
+
+    if "errors" in response:
+        raise RuntimeError(f"Unable to retrieve the project activity: {response['errors']}")
+
+    activity = response["data"]["moped_activity_log"]
+    next_cursor = generate_activity_cursor(activity[limit - 1]) if len(activity) > limit else None
+
+    return {
+        "activity": activity[:limit],
+        "next_cursor": next_cursor,
+    }
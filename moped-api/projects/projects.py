@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify, abort, request, Response
+from flask_cognito import cognito_auth_required, current_cognito_jwt
+
+# Import our custom code
+from claims import is_valid_user
+from projects.helpers import (
+    parse_activity_cursor,
+    parse_activity_limit,
+    db_get_project_activity,
+)
+
+projects_blueprint = Blueprint("projects_blueprint", __name__)
+
+
+@projects_blueprint.route("/<int:project_id>/activity", methods=["GET"])
+@cognito_auth_required
+def project_get_activity(project_id: int) -> (Response, int):
+    """
+    Returns a page of the project's activity log, newest first.
+    The next page is requested with ?before=<next_cursor>
+    :return Response, int:
+    """
+    if is_valid_user(current_cognito_jwt):
+        before = request.args.get("before", None)
+        limit = parse_activity_limit(request.args.get("limit", None))
+        include_record_data = request.args.get("record_data", "false").lower() == "true"
+
+        try:
+            cursor = parse_activity_cursor(before) if before else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        try:
+            page = db_get_project_activity(
+                project_id=project_id,
+                cursor=cursor,
+                limit=limit,
+                include_record_data=include_record_data,
+            )
+        except RuntimeError as e:
+            return jsonify({"error": str(e)}), 500
+
+        return jsonify(page)
+    else:
+        abort(403)
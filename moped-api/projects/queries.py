@@ -0,0 +1,35 @@
+#
+# GraphQL query for a page of the project activity feed. The where clause
+# is built by the helpers, so that the keyset condition is only added
+# when there is a cursor.
+#
+GRAPHQL_PROJECT_ACTIVITY = """
+    query get_project_activity($where: moped_activity_log_bool_exp!, $limit: Int!) {
+      moped_activity_log(
+        where: $where,
+        order_by: [{created_at: desc}, {activity_id: desc}],
+        limit: $limit
+      ) {
+        activity_id
+        created_at
+        record_id
+        record_project_id
+        record_type
+        description
+        operation_type
+        updated_by
+        moped_user {
+          first_name
+          last_name
+          user_id
+        }
+      }
+    }
+"""
+
+#
+# Same query, including record_data (it can be large)
+#
+GRAPHQL_PROJECT_ACTIVITY_WITH_RECORD_DATA = GRAPHQL_PROJECT_ACTIVITY.replace(
+    "operation_type\n", "operation_type\n        record_data\n"
+)
@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, jsonify
+from flask_cognito import cognito_auth_required, current_cognito_jwt
+from jose import jwk, jwt
+
+from auth.cognito import CachedCognitoAuth, JWKSCache, VerifiedTokenCache
+
+
+def create_signing_key(kid: str) -> tuple:
+    """
+    Returns a private key (PEM) and its public JWK
+    """
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    public_jwk = {**jwk.construct(pem, "RS256").public_key().to_dict(), "kid": kid, "use": "sig"}
+    return pem, public_jwk
+
+
+class TestAuthCognito(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.public_jwk = create_signing_key("key-1")
+        cls.rotated_pem, cls.rotated_jwk = create_signing_key("key-2")
+
+    def setUp(self):
+        self.jwks_file = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+        self.write_jwks([self.public_jwk])
+
+        self.app = Flask(__name__)
+        self.app.config.update({
+            "COGNITO_REGION": "us-east-1",
+            "COGNITO_USERPOOL_ID": "us-east-1_test",
+            "COGNITO_APP_CLIENT_ID": "client",
+        })
+        self.cognito = CachedCognitoAuth(self.app)
+        self.cognito.jwks = JWKSCache(self.jwks_file, min_refresh_interval=0)
+
+        @self.app.route("/protected")
+        @cognito_auth_required
+        def protected():
+            return jsonify({"email": current_cognito_jwt["email"]})
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.cognito.jwks.stop_refresher()
+        os.remove(self.jwks_file)
+
+    def write_jwks(self, keys: list):
+        with open(self.jwks_file, "w") as file:
+            json.dump({"keys": keys}, file)
+
+    def create_token(self, exp: float = None, pem: bytes = None, kid: str = "key-1") -> str:
+        claims = {
+            "email": "test@austintexas.gov",
+            "token_use": "id",
+            "aud": "client",
+            "exp": int(exp if exp is not None else time.time() + 3600),
+        }
+        return jwt.encode(claims, pem or self.pem, algorithm="RS256", headers={"kid": kid})
+
+    def get(self, token: str):
+        return self.client.get("/protected", headers={"Authorization": f"Bearer {token}"})
+
+    def test_verified_once(self):
+        token = self.create_token()
+        with patch.object(self.cognito, "verify_token", wraps=self.cognito.verify_token) as verify_token:
+            for _ in range(5):
+                response = self.get(token)
+                assert response.status_code == 200
+                assert response.get_json() == {"email": "test@austintexas.gov"}
+            assert verify_token.call_count == 1
+
+        metrics = self.cognito.get_metrics()
+        assert metrics["tokens"]["hits"] == 4
+        assert metrics["tokens"]["size"] == 1
+        assert metrics["jwks"]["refreshes"] == 1
+
+    def test_invalid_tokens_are_not_cached(self):
+        forged = self.create_token(pem=self.rotated_pem)
+        for _ in range(2):
+            assert self.get(forged).status_code == 401
+        assert self.get("not.a.token").status_code == 401
+        assert self.get(self.create_token(exp=time.time() - 1)).status_code == 401
+        assert self.cognito.get_metrics()["tokens"]["size"] == 0
+
+    def test_cached_until_exp(self):
+        cache = VerifiedTokenCache(max_size=2)
+        cache.put("a", {"exp": time.time() + 60, "email": "a"})
+        assert cache.get("a")["email"] == "a"
+        # A copy, changes are not kept
+        cache.get("a")["email"] = "b"
+        assert cache.get("a")["email"] == "a"
+
+        with patch("auth.cognito.time.time", return_value=time.time() + 120):
+            assert cache.get("a") is None
+        assert cache.get_metrics()["expired"] == 1
+        assert cache.get_metrics()["size"] == 0
+
+        # The least recently used token is dropped, and tokens are only kept by digest
+        for token in ["b", "c", "d"]:
+            cache.put(token, {"exp": time.time() + 60})
+        assert cache.get("b") is None
+        assert "c" not in cache.tokens and len(cache.tokens) == 2
+
+    def test_rotated_keys(self):
+        assert self.get(self.create_token()).status_code == 200
+
+        # Cognito rotated its keys: the unknown key id downloads them again
+        self.write_jwks([self.public_jwk, self.rotated_jwk])
+        rotated = self.create_token(pem=self.rotated_pem, kid="key-2")
+        assert self.get(rotated).status_code == 200
+        assert self.cognito.get_metrics()["jwks"]["keys"] == 2
+
+    def test_unknown_key_refresh_is_rate_limited(self):
+        self.cognito.jwks.min_refresh_interval = 3600
+        assert self.get(self.create_token()).status_code == 200
+        unknown = self.create_token(pem=self.rotated_pem, kid="key-2")
+        for _ in range(3):
+            assert self.get(unknown).status_code == 401
+        assert self.cognito.get_metrics()["jwks"]["refreshes"] == 1
+
+    def test_background_refresh(self):
+        jwks = JWKSCache(self.jwks_file, refresh_interval=0.01)
+        jwks.start_refresher()
+        try:
+            deadline = time.monotonic() + 5
+            while jwks.metrics["refreshes"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        finally:
+            jwks.stop_refresher()
+        assert jwks.metrics["refreshes"] >= 2
+        assert "key-1" in jwks.keys
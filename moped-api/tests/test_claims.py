@@ -0,0 +1,109 @@
+import json
+import unittest
+from unittest.mock import patch
+
+import claims
+from app import app
+from flask import jsonify
+from flask_cognito import _request_ctx_stack, current_cognito_jwt
+from claims import (
+    HASURA_CLAIMS_KEY,
+    HasuraClaims,
+    current_hasura_claims,
+    get_claims,
+    get_hasura_claims,
+    has_user_role,
+    normalize_claims,
+    resolve_hasura_claims,
+)
+
+
+class TestClaims(unittest.TestCase):
+
+    def setUp(self):
+        self.hasura_claims = {
+            "x-hasura-user-id": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+            "x-hasura-default-role": "moped-viewer",
+            "x-hasura-allowed-roles": ["moped-viewer", "moped-editor"],
+            "x-hasura-user-db-id": "42",
+            "x-hasura-user-wg-id": "1",
+        }
+        self.cognito_jwt = {
+            "email": "test@austintexas.gov",
+            "cognito:username": "test",
+            HASURA_CLAIMS_KEY: json.dumps(self.hasura_claims),
+        }
+
+    def authenticate(self):
+        _request_ctx_stack.top.cogauth_cognito_jwt = self.cognito_jwt
+
+    def test_accessors(self):
+        hasura_claims = HasuraClaims.from_jwt(self.cognito_jwt)
+        assert hasura_claims.roles == ("moped-viewer", "moped-editor")
+        assert hasura_claims.default_role == "moped-viewer"
+        assert hasura_claims.user_id == "e3bd46b2-2a80-486a-b1d2-99be709b73d5"
+        assert hasura_claims.user_db_id == 42
+        assert hasura_claims.workgroup_id == 1
+        assert hasura_claims.has_role("moped-editor")
+        assert not hasura_claims.has_role("moped-admin")
+        assert hasura_claims["x-hasura-user-db-id"] == "42"
+
+        empty = HasuraClaims.from_jwt(None)
+        assert empty.roles == ()
+        assert empty.user_db_id is None
+        assert HasuraClaims({"x-hasura-user-db-id": "none"}).user_db_id is None
+
+    def test_read_only(self):
+        hasura_claims = HasuraClaims(self.hasura_claims)
+        with self.assertRaises(TypeError):
+            hasura_claims["x-hasura-user-db-id"] = "1"
+        with self.assertRaises(AttributeError):
+            hasura_claims.roles.append("moped-admin")
+        # The claims are a copy
+        self.hasura_claims["x-hasura-allowed-roles"].append("moped-admin")
+        assert not hasura_claims.has_role("moped-admin")
+
+    def test_parsed_once_per_request(self):
+        with app.test_request_context():
+            self.authenticate()
+            with patch.object(claims, "loads", wraps=claims.loads) as loads:
+                hasura_claims = get_hasura_claims()
+                assert get_claims(current_cognito_jwt) is hasura_claims
+                assert current_hasura_claims.user_db_id == 42
+                assert has_user_role("moped-viewer")
+                assert loads.call_count == 1
+
+        # A new request parses its own token
+        with app.test_request_context():
+            assert get_hasura_claims() is not hasura_claims
+            assert len(get_hasura_claims()) == 0
+
+    def test_normalize_claims(self):
+        @normalize_claims
+        def view(claims):
+            return claims
+
+        with app.test_request_context():
+            self.authenticate()
+            normalized = view()
+            assert normalized[HASURA_CLAIMS_KEY] is get_hasura_claims()
+            assert normalized["email"] == "test@austintexas.gov"
+            assert has_user_role("moped-editor", normalized)
+            # The token itself is left as it is
+            assert isinstance(self.cognito_jwt[HASURA_CLAIMS_KEY], str)
+            assert json.loads(jsonify(normalized).get_data())[HASURA_CLAIMS_KEY] == self.hasura_claims
+
+    def test_resolve_hasura_claims(self):
+        @resolve_hasura_claims
+        def view():
+            return current_hasura_claims.workgroup_id
+
+        with app.test_request_context():
+            self.authenticate()
+            assert view() == 1
+
+    def test_has_user_role_dict(self):
+        assert has_user_role("moped-editor", {HASURA_CLAIMS_KEY: self.hasura_claims})
+        assert has_user_role("moped-editor", self.cognito_jwt)
+        assert not has_user_role("moped-admin", {HASURA_CLAIMS_KEY: self.hasura_claims})
+        assert not has_user_role("moped-admin", {})
@@ -0,0 +1,65 @@
+import json
+import datetime
+import unittest
+from unittest.mock import patch
+
+import codec
+from app import app
+from flask import jsonify, request
+
+
+class TestCodec(unittest.TestCase):
+
+    def setUp(self):
+        # Like a boto3 Cognito list_users response
+        self.users = {
+            "Users": [
+                {
+                    "Username": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+                    "Attributes": [{"Name": "email", "Value": "josé@austintexas.gov"}],
+                    "UserCreateDate": datetime.datetime(2021, 7, 1, 12, 30, tzinfo=datetime.timezone.utc),
+                    "Enabled": True,
+                }
+            ]
+        }
+        self.expected = {
+            "Users": [
+                {
+                    "Username": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+                    "Attributes": [{"Name": "email", "Value": "josé@austintexas.gov"}],
+                    "UserCreateDate": "2021-07-01T12:30:00+00:00",
+                    "Enabled": True,
+                }
+            ]
+        }
+
+    def test_dumps(self):
+        body = codec.dumps(self.users)
+        assert json.loads(body) == self.expected
+        assert "josé" in body
+        assert codec.dumps_bytes(self.users) == body.encode("utf-8")
+        assert codec.dumps({"b": 1, "a": 2}, sort_keys=True) == '{"a":2,"b":1}'
+
+    def test_dumps_stdlib(self):
+        with patch.object(codec, "orjson", None):
+            assert json.loads(codec.dumps(self.users)) == self.expected
+            assert codec.loads(b'{"id": 1}') == {"id": 1}
+
+    def test_large_integers(self):
+        # Over 64 bits, orjson leaves the integers to the standard library
+        value = {"id": 2 ** 70 + 1, "at": datetime.date(2021, 7, 1)}
+        assert codec.dumps(value) == '{"id":1180591620717411303425,"at":"2021-07-01"}'
+        assert codec.dumps_bytes(value) == b'{"id":1180591620717411303425,"at":"2021-07-01"}'
+        with patch.object(codec, "orjson", None):
+            assert codec.dumps(value) == '{"id":1180591620717411303425,"at":"2021-07-01"}'
+
+    def test_jsonify(self):
+        with app.test_request_context():
+            response = jsonify(self.users)
+            assert response.get_json() == self.expected
+            # JSON_SORT_KEYS is still honored
+            assert response.get_data(as_text=True).index('"Attributes"') < response.get_data(as_text=True).index('"Username"')
+
+    def test_get_json(self):
+        with app.test_request_context(method="POST", data='{"id": "1", "name": "josé"}', content_type="application/json"):
+            assert request.get_json() == {"id": "1", "name": "josé"}
@@ -0,0 +1,52 @@
+import base64
+import gzip
+import json
+import unittest
+
+from events.helpers import get_message_body, get_claim_check_key
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+
+class TestEventsHelpers(unittest.TestCase):
+
+    def setUp(self):
+        self.s3_client = FakeS3Client()
+        self.payload = {
+            "id": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+            "event": {"data": {"new": {"location": [[-97.74 + i * 0.0001, 30.27] for i in range(2000)]}}},
+        }
+
+    def test_small_payload(self):
+        body = get_message_body(
+            payload={"id": "1"}, event_name="activity_log", environment="staging", s3_client=self.s3_client
+        )
+        assert json.loads(body) == {"id": "1"}
+        assert self.s3_client.objects == {}
+
+    def test_compressed_payload(self):
+        body = json.loads(get_message_body(
+            payload=self.payload, event_name="activity_log", environment="staging",
+            s3_client=self.s3_client, compress_threshold=1024,
+        ))
+        assert body["payload_encoding"] == "gzip+base64"
+        assert json.loads(gzip.decompress(base64.b64decode(body["payload"]))) == self.payload
+        assert self.s3_client.objects == {}
+
+    def test_offloaded_payload(self):
+        body = json.loads(get_message_body(
+            payload=self.payload, event_name="activity_log", environment="staging",
+            s3_client=self.s3_client, compress_threshold=1024, max_message_size=1024,
+        ))
+        assert body["payload_encoding"] == "s3"
+        assert body["key"] == get_claim_check_key("activity_log", "staging", body["sha256"])
+        stored = self.s3_client.objects[(body["bucket"], body["key"])]
+        assert json.loads(gzip.decompress(stored)) == self.payload
+        assert len(json.dumps(body)) < 1024
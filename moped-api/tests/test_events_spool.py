@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+import events.spool as events_spool
+from events.spool import EventSpool, SpoolFullError
+
+
+class FakeSQSClient:
+    def __init__(self):
+        self.available = True
+        self.batches = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        if not self.available:
+            raise RuntimeError("SQS is not available")
+        self.batches.append((QueueUrl, [entry["MessageBody"] for entry in Entries]))
+        self.attributes = [entry.get("MessageAttributes", None) for entry in Entries]
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def get_bodies(self) -> list:
+        return [body for queue_url, bodies in self.batches for body in bodies]
+
+
+class TestEventsSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sqs_client = FakeSQSClient()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_spool(self, **kwargs) -> EventSpool:
+        spool = EventSpool(directory=self.directory, sqs_client=self.sqs_client, **kwargs)
+        # The tests drain the spool themselves
+        spool.start_drainer = lambda: None
+        return spool
+
+    def test_drain_in_batches(self):
+        spool = self.create_spool()
+        for index in range(25):
+            spool.append(queue_url="queue-a" if index < 15 else "queue-b", body=json.dumps({"id": index}))
+
+        assert spool.drain() == 25
+        assert [json.loads(body)["id"] for body in self.sqs_client.get_bodies()] == list(range(25))
+        assert [(queue_url, len(bodies)) for queue_url, bodies in self.sqs_client.batches] == [
+            ("queue-a", 10), ("queue-a", 5), ("queue-b", 10)
+        ]
+        assert spool.get_metrics()["pending_bytes"] == 0
+        # Only the lock of the running process is left
+        assert os.listdir(self.directory) == [f"{spool.pid}.lock"]
+
+    def test_message_attributes(self):
+        spool = self.create_spool()
+        traceparent = {"traceparent": {"DataType": "String", "StringValue": "00-" + "a" * 32 + "-" + "b" * 16 + "-01"}}
+        spool.append(queue_url="queue", body="1", attributes=traceparent)
+        spool.append(queue_url="queue", body="2")
+        spool.drain()
+        assert self.sqs_client.attributes == [traceparent, None]
+
+    def test_fsync_batching(self):
+        spool = self.create_spool(fsync_batch=10)
+        for index in range(25):
+            spool.append(queue_url="queue", body=str(index))
+        assert spool.get_metrics()["fsyncs"] == 2
+        assert spool.unsynced == 5
+
+    def test_size_cap(self):
+        spool = self.create_spool(max_bytes=500)
+        with self.assertRaises(SpoolFullError):
+            for index in range(100):
+                spool.append(queue_url="queue", body="x" * 50)
+        metrics = spool.get_metrics()
+        assert metrics["rejected"] == 1
+        assert metrics["pending_bytes"] <= 500
+
+        spool.drain()
+        spool.append(queue_url="queue", body="x" * 50)
+
+    def test_resume_after_failure(self):
+        spool = self.create_spool()
+        for index in range(15):
+            spool.append(queue_url="queue", body=str(index))
+
+        self.sqs_client.available = False
+        assert spool.drain() == 0
+        assert spool.get_metrics()["drain_errors"] == 1
+
+        # A new process picks up the events left on disk
+        self.sqs_client.available = True
+        spool.close()
+        restarted = self.create_spool()
+        assert restarted.get_metrics()["pending_bytes"] == spool.get_metrics()["pending_bytes"]
+        assert restarted.drain() == 15
+        assert self.sqs_client.get_bodies() == [str(index) for index in range(15)]
+
+    def test_partial_drain_checkpoint(self):
+        spool = self.create_spool()
+        for index in range(15):
+            spool.append(queue_url="queue", body=str(index))
+
+        sent = []
+
+        def send_batch(queue_url, events):
+            if len(sent) > 0:
+                return False
+            sent.append(events)
+            return True
+
+        spool.send_batch = send_batch
+        assert spool.drain() == 10
+
+        spool.close()
+        restarted = self.create_spool()
+        assert restarted.drain() == 5
+        assert self.sqs_client.get_bodies() == [str(index) for index in range(10, 15)]
+
+    def test_resume_on_first_request(self):
+        spool = self.create_spool()
+        spool.append(queue_url="queue", body="left")
+        spool.close()
+
+        patch.object(events_spool, "MOPED_API_EVENTS_SPOOL_DIR", self.directory).start()
+        patch.object(events_spool, "EVENT_SPOOL", None).start()
+        patch.object(events_spool, "RESUMED_PID", None).start()
+        start_drainer = patch.object(EventSpool, "start_drainer").start()
+        self.addCleanup(patch.stopall)
+
+        app = Flask(__name__)
+        app.before_request(events_spool.resume_event_spool)
+        app.add_url_rule("/", "index", lambda: "ok")
+        client = app.test_client()
+        # Nothing runs before the first request
+        assert events_spool.EVENT_SPOOL is None
+
+        client.get("/")
+        client.get("/")
+        assert start_drainer.call_count == 1
+        resumed = events_spool.EVENT_SPOOL
+        assert resumed.get_metrics()["pending_bytes"] > 0
+
+        # A forked worker gets its own spool, the events of the running parent are left to it
+        with patch("events.spool.os.getpid", return_value=resumed.pid + 1):
+            client.get("/")
+            forked = events_spool.EVENT_SPOOL
+            assert forked is not resumed
+            assert forked.pid == resumed.pid + 1
+            assert forked.get_metrics()["pending_bytes"] == 0
+        assert start_drainer.call_count == 1
+        forked.close()
+        resumed.close()
+
+    def create_worker_spool(self, pid: int) -> EventSpool:
+        with patch("events.spool.os.getpid", return_value=pid):
+            return self.create_spool()
+
+    def test_workers_share_the_directory(self):
+        worker_a = self.create_worker_spool(1001)
+        worker_b = self.create_worker_spool(1002)
+        worker_a.append(queue_url="queue", body="a1")
+        worker_b.append(queue_url="queue", body="b1")
+
+        # A only sends its own events, B is running
+        assert worker_a.drain() == 1
+        worker_b.append(queue_url="queue", body="b2")
+        assert worker_b.drain() == 2
+        assert self.sqs_client.get_bodies() == ["a1", "b1", "b2"]
+        assert worker_a.get_metrics()["pending_bytes"] == 0
+        assert worker_b.get_metrics()["pending_bytes"] == 0
+
+        # The events of a worker that exited are sent by the next drain of another one
+        worker_c = self.create_worker_spool(1003)
+        worker_c.append(queue_url="queue", body="c1")
+        worker_c.close()
+        assert worker_b.has_exited_segments()
+        assert worker_a.drain() == 1
+        assert self.sqs_client.get_bodies() == ["a1", "b1", "b2", "c1"]
+        assert not worker_b.has_exited_segments()
+        assert sorted(os.listdir(self.directory)) == ["1001.lock", "1002.lock"]
+
+        worker_a.close()
+        worker_b.close()
@@ -0,0 +1,137 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import boto3
+from botocore.stub import Stubber
+from flask import Flask
+
+import metrics
+from graphql import run_query
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patch.object(metrics, "MOPED_API_METRICS_DIR", self.directory).start()
+        patch.object(metrics, "HISTOGRAMS", {}).start()
+        patch.object(metrics, "COLLECTORS", []).start()
+        patch.object(metrics, "MOPED_API_METRICS_TOKEN", "secret").start()
+
+        self.app = Flask(__name__)
+        metrics.init_app(self.app)
+
+        @self.app.route("/users/<id>")
+        def user(id):
+            if id == "fail":
+                raise RuntimeError("fail")
+            return {"id": id}
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.directory)
+
+    def get_series(self, name: str, **labels) -> list:
+        return metrics.HISTOGRAMS[(name, tuple(sorted(labels.items())))]
+
+    def test_requests(self):
+        for id in ["1", "2", "fail"]:
+            self.client.get(f"/users/{id}")
+        self.client.get("/missing")
+
+        # By route, not by path
+        series = self.get_series(metrics.REQUEST_DURATION, route="/users/<id>", method="GET", status="200")
+        assert sum(series[:-1]) == 2
+        series = self.get_series(metrics.REQUEST_DURATION, route="/users/<id>", method="GET", status="500")
+        assert sum(series[:-1]) == 1
+        series = self.get_series(metrics.REQUEST_DURATION, route="unmatched", method="GET", status="404")
+        assert sum(series[:-1]) == 1
+
+    def test_observe(self):
+        metrics.observe("test_seconds", {"a": "1"}, 0.003)
+        metrics.observe("test_seconds", {"a": "1"}, 0.2)
+        metrics.observe("test_seconds", {"a": "1"}, 60)
+        series = self.get_series("test_seconds", a="1")
+        assert series[0] == 1
+        assert series[metrics.BUCKETS.index(0.25)] == 1
+        assert series[len(metrics.BUCKETS)] == 1
+        self.assertAlmostEqual(series[-1], 60.203)
+
+    def test_render(self):
+        metrics.observe(metrics.DEPENDENCY_DURATION, {"dependency": 'a"b\\c\n', "operation": "x"}, 0.02)
+        metrics.register_collector(lambda: {"moped_api_test_total": 3})
+        text = self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).get_data(as_text=True)
+
+        labels = 'dependency="a\\"b\\\\c\\n",operation="x"'
+        assert f"# TYPE {metrics.DEPENDENCY_DURATION} histogram" in text
+        assert f'{metrics.DEPENDENCY_DURATION}_bucket{{{labels},le="0.01"}} 0' in text
+        assert f'{metrics.DEPENDENCY_DURATION}_bucket{{{labels},le="0.025"}} 1' in text
+        assert f'{metrics.DEPENDENCY_DURATION}_bucket{{{labels},le="+Inf"}} 1' in text
+        assert f"{metrics.DEPENDENCY_DURATION}_count{{{labels}}} 1" in text
+        assert "# TYPE moped_api_test_total counter\nmoped_api_test_total 3" in text
+
+    def test_workers_are_added_up(self):
+        metrics.observe("test_seconds", {}, 1)
+        metrics.register_collector(lambda: {"moped_api_test_total": 3})
+        # Another worker
+        shutil.copy(self.write_snapshot(), os.path.join(self.directory, "1.json"))
+
+        collected = metrics.collect()
+        assert collected["histograms"][("test_seconds", ())][-1] == 2
+        assert collected["counters"]["moped_api_test_total"] == 6
+
+    def write_snapshot(self) -> str:
+        metrics.flush(force=True)
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def test_flush_interval(self):
+        metrics.flush(force=True)
+        metrics.observe("test_seconds", {}, 1)
+        # Not written again before the interval
+        metrics.flush()
+        with open(os.path.join(self.directory, f"{os.getpid()}.json")) as file:
+            assert "test_seconds" not in file.read()
+
+    def test_token(self):
+        assert self.client.get("/metrics").status_code == 403
+        assert self.client.get("/metrics", headers={"Authorization": "Bearer other"}).status_code == 403
+        assert self.client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
+        # Refused while no token is set
+        with patch.object(metrics, "MOPED_API_METRICS_TOKEN", ""):
+            assert self.client.get("/metrics", headers={"Authorization": "Bearer "}).status_code == 403
+
+    def test_dead_workers_are_removed(self):
+        metrics.register_collector(lambda: {"moped_api_test_total": 3})
+        exited = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"], capture_output=True, text=True)
+        dead_path = os.path.join(self.directory, f"{exited.stdout.strip()}.json")
+        shutil.copy(self.write_snapshot(), dead_path)
+
+        assert metrics.collect()["counters"]["moped_api_test_total"] == 3
+        assert not os.path.exists(dead_path)
+        assert os.path.exists(os.path.join(self.directory, f"{os.getpid()}.json"))
+
+    def test_boto3(self):
+        metrics.instrument_boto3()
+        sqs = boto3.client("sqs", region_name="us-east-1")
+        with Stubber(sqs) as stubber:
+            stubber.add_response("list_queues", {"QueueUrls": []})
+            sqs.list_queues()
+        series = self.get_series(metrics.DEPENDENCY_DURATION, dependency="sqs", operation="ListQueues", outcome="ok")
+        assert sum(series[:-1]) == 1
+
+    def test_hasura(self):
+        with patch("graphql.requests.post", return_value=SimpleNamespace(status_code=502)):
+            run_query("query { moped_users { user_id } }", {}, {
+                "HASURA_HTTPS_ENDPOINT": "http://localhost:8080",
+                "HASURA_ADMIN_SECRET": "secret",
+            })
+        series = self.get_series(metrics.DEPENDENCY_DURATION, dependency="hasura", operation="run_query", outcome="error")
+        assert sum(series[:-1]) == 1
@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+import profiling
+from profiling import RateLimiter, SamplingProfiler, sign_profiling_header
+
+
+def busy_wait(seconds: float) -> None:
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        patch.object(profiling, "MOPED_API_PROFILING_DIR", self.directory).start()
+        patch.object(profiling, "MOPED_API_PROFILING_SECRET", "secret").start()
+        patch.object(profiling, "MOPED_API_PROFILING_INTERVAL", 0.001).start()
+        patch.object(profiling, "RATE_LIMITER", RateLimiter(limit=2)).start()
+
+        self.app = Flask(__name__)
+        profiling.init_app(self.app)
+
+        @self.app.route("/slow")
+        def slow():
+            busy_wait(0.05)
+            return {"ok": True}
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        patch.stopall()
+        shutil.rmtree(self.directory)
+
+    def profile(self, header: str = None):
+        return self.client.get("/slow", headers={profiling.PROFILING_HEADER: header or sign_profiling_header()})
+
+    def test_not_profiled_without_header(self):
+        with patch.object(profiling, "SamplingProfiler") as profiler:
+            response = self.client.get("/slow")
+        assert profiler.call_count == 0
+        assert profiling.PROFILE_ID_HEADER not in response.headers
+        assert os.listdir(self.directory) == []
+
+    def test_signed_header(self):
+        response = self.profile()
+        profile_id = response.headers[profiling.PROFILE_ID_HEADER]
+
+        download = self.client.get(
+            f"/profiles/{profile_id}",
+            headers={profiling.PROFILING_HEADER: sign_profiling_header()},
+        )
+        assert download.status_code == 200
+        folded = download.get_data(as_text=True)
+        # The view, and the function it called, are in the stacks
+        assert "tests.test_profiling.slow;tests.test_profiling.busy_wait " in folded
+        for line in folded.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+
+    def test_invalid_header(self):
+        expired = sign_profiling_header(expires_in=-1)
+        forged = sign_profiling_header(secret="forged")
+        for header in [expired, forged, "1"]:
+            response = self.profile(header)
+            assert response.status_code == 200
+            assert profiling.PROFILE_ID_HEADER not in response.headers
+
+        assert self.client.get("/profiles/1-000000000000").status_code == 403
+        headers = {profiling.PROFILING_HEADER: sign_profiling_header()}
+        assert self.client.get("/profiles/1-000000000000", headers=headers).status_code == 404
+        assert self.client.get("/profiles/..%2Fsecret", headers=headers).status_code == 404
+
+    def test_admin(self):
+        with patch.object(profiling, "is_admin", return_value=True):
+            response = self.profile("1")
+        assert profiling.PROFILE_ID_HEADER in response.headers
+
+    def test_rate_limit(self):
+        profiled = [profiling.PROFILE_ID_HEADER in self.profile().headers for _ in range(3)]
+        assert profiled == [True, True, False]
+
+        limiter = RateLimiter(limit=5)
+        assert limiter.acquire()
+        # One at a time
+        assert not limiter.acquire()
+        limiter.release()
+        assert limiter.acquire()
+
+    def test_failed_request(self):
+        @self.app.route("/fail")
+        def fail():
+            raise RuntimeError("fail")
+
+        self.client.get("/fail", headers={profiling.PROFILING_HEADER: sign_profiling_header()})
+        assert len(os.listdir(self.directory)) == 1
+        assert not profiling.RATE_LIMITER.running
+
+    def test_max_profiles(self):
+        with patch.object(profiling, "MOPED_API_PROFILING_MAX_PROFILES", 2):
+            for profile_id in ["1-000000000001", "1-000000000002", "1-000000000003"]:
+                profiling.store_profile(profile_id, "a;b 1\n")
+        assert sorted(os.listdir(self.directory)) == ["1-000000000002.folded", "1-000000000003.folded"]
+
+    def test_sampling_profiler(self):
+        profiler = SamplingProfiler(threading.get_ident(), interval=0.001, max_seconds=0.02)
+        profiler.start()
+        busy_wait(0.1)
+        profiler.stop()
+        # Sampling stopped after max_seconds
+        assert 0 < profiler.samples <= 25
+        assert "busy_wait" in profiler.stacks.most_common(1)[0][0]
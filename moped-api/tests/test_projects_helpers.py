@@ -0,0 +1,67 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from projects.helpers import (
+    parse_activity_cursor,
+    parse_activity_limit,
+    generate_activity_cursor,
+    generate_activity_where,
+    db_get_project_activity,
+    ACTIVITY_DEFAULT_LIMIT,
+    ACTIVITY_MAX_LIMIT,
+)
+
+ACTIVITY_ID = "5d1c0a4e-8f4e-4f7e-9a1e-1b2c3d4e5f60"
+
+
+class TestProjectsHelpers:
+
+    def test_parse_activity_limit(self):
+        assert parse_activity_limit(None) == ACTIVITY_DEFAULT_LIMIT
+        assert parse_activity_limit("abc") == ACTIVITY_DEFAULT_LIMIT
+        assert parse_activity_limit("10") == 10
+        assert parse_activity_limit("0") == 1
+        assert parse_activity_limit("100000") == ACTIVITY_MAX_LIMIT
+
+    def test_parse_activity_cursor(self):
+        cursor = parse_activity_cursor(f"2021-06-01T12:00:00.12345+00:00,{ACTIVITY_ID}")
+        assert cursor == ("2021-06-01T12:00:00.12345+00:00", ACTIVITY_ID)
+
+        # An unencoded + arrives as a space
+        cursor = parse_activity_cursor(f"2021-06-01T12:00:00.12345 00:00,{ACTIVITY_ID}")
+        assert cursor == ("2021-06-01T12:00:00.12345+00:00", ACTIVITY_ID)
+
+        for invalid_cursor in [None, "", "2021-06-01", f"yesterday,{ACTIVITY_ID}", "2021-06-01T12:00:00,1"]:
+            with pytest.raises(ValueError):
+                parse_activity_cursor(invalid_cursor)
+
+    def test_generate_activity_cursor(self):
+        activity = {"created_at": "2021-06-01T12:00:00+00:00", "activity_id": ACTIVITY_ID}
+        assert parse_activity_cursor(generate_activity_cursor(activity)) == (
+            "2021-06-01T12:00:00+00:00", ACTIVITY_ID
+        )
+
+    def test_generate_activity_where(self):
+        assert generate_activity_where(project_id=1) == {"record_project_id": {"_eq": 1}}
+
+        where = generate_activity_where(project_id=1, cursor=("2021-06-01T12:00:00+00:00", ACTIVITY_ID))
+        assert where["record_project_id"] == {"_eq": 1}
+        assert where["created_at"] == {"_lte": "2021-06-01T12:00:00+00:00"}
+        assert len(where["_or"]) == 2
+
+    @patch("projects.helpers.run_query")
+    def test_db_get_project_activity(self, run_query):
+        activity = [
+            {"created_at": f"2021-06-01T12:00:0{index}+00:00", "activity_id": ACTIVITY_ID}
+            for index in range(3)
+        ]
+        run_query.return_value = MagicMock(json=lambda: {"data": {"moped_activity_log": activity}})
+
+        page = db_get_project_activity(project_id=1, limit=2)
+        assert page["activity"] == activity[:2]
+        assert page["next_cursor"] == generate_activity_cursor(activity[1])
+        assert run_query.call_args[1]["variables"]["limit"] == 3
+
+        page = db_get_project_activity(project_id=1, limit=5)
+        assert page["activity"] == activity
+        assert page["next_cursor"] is None
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import tracing
+from app import app
+from tracing import get_hasura_parent, get_hasura_created_at, start_span
+
+
+class FakeSQSClient:
+    def __init__(self):
+        self.messages = []
+
+    def send_message(self, **kwargs):
+        self.messages.append(kwargs)
+        return {"MessageId": "1"}
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.spans_file = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False).name
+        self.payload = {
+            "id": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+            "created_at": "2021-01-19T21:27:00.000000Z",
+            "event": {"trace_context": {"trace_id": 11127784579935739002, "span_id": 17956528671663401255}},
+        }
+
+    def tearDown(self):
+        os.remove(self.spans_file)
+
+    def read_spans(self) -> list:
+        with open(self.spans_file) as file:
+            return [json.loads(line)["span"] for line in file]
+
+    def test_get_hasura_parent(self):
+        trace_id, span_id = get_hasura_parent(self.payload)
+        assert trace_id == f"{11127784579935739002:032x}"
+        assert len(trace_id) == 32
+        assert span_id == f"{17956528671663401255:016x}"
+
+        trace_id, span_id = get_hasura_parent({})
+        assert len(trace_id) == 32
+        assert span_id is None
+
+    def test_get_hasura_created_at(self):
+        assert get_hasura_created_at(self.payload) == 1611091620 * 10 ** 9
+        assert get_hasura_created_at({"created_at": "not a date"}) is None
+
+    def test_export_to_file(self):
+        with patch.object(tracing, "MOPED_API_TRACING_EXPORTER", "file"), \
+                patch.object(tracing, "MOPED_API_TRACING_FILE", self.spans_file):
+            with self.assertRaises(ValueError):
+                with start_span("failing", parent=("a" * 32, "b" * 16)):
+                    raise ValueError("failed")
+
+        span = self.read_spans()[0]
+        assert span["name"] == "failing"
+        assert span["traceId"] == "a" * 32
+        assert span["parentSpanId"] == "b" * 16
+        assert span["status"] == {"code": "ERROR", "message": "failed"}
+
+    def test_events_process_propagates_traceparent(self):
+        sqs_client = FakeSQSClient()
+        with patch.object(tracing, "MOPED_API_TRACING_EXPORTER", "file"), \
+                patch.object(tracing, "MOPED_API_TRACING_FILE", self.spans_file), \
+                patch("events.events.HASURA_EVENT_API", "test-key"), \
+                patch("events.events.boto3.client", return_value=sqs_client):
+            response = app.test_client().post(
+                "/events/",
+                data=json.dumps(self.payload),
+                headers={"MOPED_API_APIKEY": "test-key", "MOPED_API_EVENT_NAME": "activity_log"},
+            )
+
+        assert response.status_code == 200
+        spans = {span["name"]: span for span in self.read_spans()}
+        assert spans["hasura_delivery"]["traceId"] == spans["events_process"]["traceId"]
+        traceparent = sqs_client.messages[0]["MessageAttributes"]["traceparent"]["StringValue"]
+        assert traceparent == f"00-{spans['events_process']['traceId']}-{spans['events_process']['spanId']}-01"
@@ -0,0 +1,160 @@
+#
+# Tracing
+#
+#   OpenTelemetry-compatible spans, without the OpenTelemetry SDK. The trace of
+# a Hasura event (its trace_context) continues in events_process and is sent
+# along with the SQS message in the W3C `traceparent` message attribute, the
+# activity_log Lambda continues it (see moped-data-events/activity_log/tracing.py).
+#
+#   MOPED_API_TRACING_EXPORTER: off (default), log (a JSON line per span) or
+# file (JSON Lines appended to MOPED_API_TRACING_FILE).
+#
+import os
+import json
+import time
+import datetime
+import threading
+from contextlib import contextmanager
+
+MOPED_API_TRACING_EXPORTER = os.getenv("MOPED_API_TRACING_EXPORTER", "off").lower()
+MOPED_API_TRACING_FILE = os.getenv("MOPED_API_TRACING_FILE", "/tmp/moped-api-spans.jsonl")
+MOPED_API_TRACING_SERVICE_NAME = os.getenv("MOPED_API_TRACING_SERVICE_NAME", "moped-api")
+
+# Serializes the writes of the file exporter
+EXPORT_LOCK = threading.Lock()
+
+
+class Span:
+    """
+    A single timed operation of a trace, ids are lowercase hex strings
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str = None,
+                 attributes: dict = None, start_time: int = None):
+        """
+        Constructor for the span
+        :param str name: The name of the operation
+        :param str trace_id: The id of the trace, 32 hex characters
+        :param str parent_span_id: The id of the parent span, 16 hex characters
+        :param dict attributes: Any attributes of the operation
+        :param int start_time: The start time, in nanoseconds since the epoch, default: now
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_time = start_time if start_time is not None else time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def get_traceparent(self) -> str:
+        """
+        Returns the W3C traceparent header of this span, always sampled
+        :return str:
+        """
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        """
+        Returns the span in OTLP/JSON form
+        :return dict:
+        """
+        return {
+            "resource": {"service.name": MOPED_API_TRACING_SERVICE_NAME},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "durationMs": round((self.end_time - self.start_time) / 1e6, 3) if self.end_time else None,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+def get_hasura_parent(payload: dict) -> tuple:
+    """
+    Returns the trace of a Hasura event. Hasura sends 64-bit integers, they
+    become the lower half of a 128-bit trace id.
+    :param dict payload: The Hasura event payload
+    :return tuple: A (trace id, span id) tuple, or a new trace if the event has no trace context
+    """
+    try:
+        trace_context = payload["event"]["trace_context"]
+        return f"{int(trace_context['trace_id']):032x}", f"{int(trace_context['span_id']):016x}"
+    except (TypeError, KeyError, ValueError):
+        return os.urandom(16).hex(), None
+
+
+def get_hasura_created_at(payload: dict) -> int:
+    """
+    Returns the time a Hasura event was created
+    :param dict payload: The Hasura event payload
+    :return int: Nanoseconds since the epoch, None if it can't be parsed
+    """
+    try:
+        created_at = payload["created_at"].replace("Z", "+00:00")
+        timestamp = datetime.datetime.fromisoformat(created_at)
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+        return int(timestamp.timestamp() * 1e9)
+    except (TypeError, KeyError, AttributeError, ValueError):
+        return None
+
+
+def export_span(span: Span) -> None:
+    """
+    Writes a finished span with the configured exporter, errors are only printed
+    :param Span span: The finished span
+    """
+    if MOPED_API_TRACING_EXPORTER == "off":
+        return
+
+    try:
+        line = json.dumps({"span": span.to_dict()}, default=str)
+        if MOPED_API_TRACING_EXPORTER == "file":
+            with EXPORT_LOCK:
+                with open(MOPED_API_TRACING_FILE, "a") as file:
+                    file.write(line + "\n")
+        else:
+            print(line)
+    except Exception as e:
+        print(f"Could not export span {span.name}: {str(e)}")
+
+
+@contextmanager
+def start_span(name: str, parent: tuple, attributes: dict = None):
+    """
+    Runs a block in a new span
+    :param str name: The name of the operation
+    :param tuple parent: A (trace id, parent span id) tuple
+    :param dict attributes: Any attributes of the operation
+    :return Span: The span, attributes can be added to it
+    """
+    span = Span(name, trace_id=parent[0], parent_span_id=parent[1], attributes=attributes)
+    try:
+        yield span
+    except Exception as e:
+        span.error = str(e)
+        raise
+    finally:
+        span.end_time = time.time_ns()
+        export_span(span)
+
+
+def record_span(name: str, parent: tuple, start_time: int, end_time: int, attributes: dict = None) -> Span:
+    """
+    Exports a span of an operation that was not measured here, ie. the Hasura delivery
+    :param str name: The name of the operation
+    :param tuple parent: A (trace id, parent span id) tuple
+    :param int start_time: The start time, in nanoseconds since the epoch
+    :param int end_time: The end time, in nanoseconds since the epoch
+    :param dict attributes: Any attributes of the operation
+    :return Span: The exported span
+    """
+    span = Span(name, trace_id=parent[0], parent_span_id=parent[1], attributes=attributes, start_time=start_time)
+    span.end_time = end_time
+    export_span(span)
+    return span
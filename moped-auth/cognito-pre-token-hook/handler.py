@@ -2,22 +2,82 @@
 
 import os, sys, re
 import json
-import boto3
+import time
+import random
 import logging
-import traceback
 
-from cryptography.fernet import Fernet
-from botocore.exceptions import ClientError
 from typing import Optional
 
+# orjson is used when it is installed, the standard library otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 AWS_COGNITO_DYNAMO_TABLE_NAME = os.getenv("AWS_COGNITO_DYNAMO_TABLE_NAME", None)
 AWS_COGNITO_DYNAMO_SECRET_NAME = os.getenv("AWS_COGNITO_DYNAMO_SECRET_NAME", None)
+# How long a warm container reuses the fernet key read from the Secrets Manager
+AWS_COGNITO_SECRET_CACHE_TTL_SECONDS = int(os.getenv("AWS_COGNITO_SECRET_CACHE_TTL_SECONDS", "300"))
+
+#
+# boto3 and cryptography are imported, and the clients created, on first use:
+# the Scheduled Event warm-up does not pay for them until it preloads them.
+#
+AWS_CLIENTS = {}
+
+# secret name -> (secret value, expiration on the monotonic clock)
+SECRET_CACHE = {}
+
+# fernet key -> Fernet cipher suite
+FERNET_CACHE = {}
+
+#
+# Event logging: the envelope of every event is logged, the (redacted) event
+# itself only with errors, or for a sampled fraction of the sign-ins.
+#
+#   redact and format_event follow moped-data-events/activity_log/event_log.py,
+# but they are kept here: the function is deployed as handler.py alone (see
+# .github/workflows/aws-cognito-helper.sh), and a sign-in carries user
+# attributes and claims, hence the longer list of redacted keys. Cognito
+# events are a few kilobytes at most, so they are redacted whole before the
+# log line is capped.
+#
+AWS_COGNITO_LOG_BODY_SAMPLE_RATE = float(os.getenv("AWS_COGNITO_LOG_BODY_SAMPLE_RATE", "0"))
+AWS_COGNITO_LOG_MAX_BYTES = int(os.getenv("AWS_COGNITO_LOG_MAX_BYTES", "4096"))
+# Values of keys containing any of these (case-insensitive) are never logged
+AWS_COGNITO_LOG_REDACTED_KEYS = ["email", "phone", "name", "address", "token", "secret", "password", "claims"]
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def json_loads(data):
+    """
+    Parses JSON, with orjson if available
+    :param str data: The JSON
+    :return: The value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(value) -> str:
+    """
+    Serializes a value to compact JSON, with orjson if available
+    :param value: The value
+    :return str: The JSON
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # ie. integers over 64 bits, the standard library handles them
+            pass
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
 def parse_key(aws_key_name: str, aws_key_json: str) -> Optional[str]:
     """
     Parses a json string containing a key and returns the key
@@ -28,20 +88,44 @@ def parse_key(aws_key_name: str, aws_key_json: str) -> Optional[str]:
     return json.loads(aws_key_json)[aws_key_name]
 
 
+def get_aws_client(service_name: str):
+    """
+    Returns a boto3 client, it is created once and reused
+    :param str service_name: The name of the service (ie. dynamodb)
+    :return: The boto3 client
+    """
+    if service_name not in AWS_CLIENTS:
+        import boto3
+        AWS_CLIENTS[service_name] = boto3.session.Session().client(
+            service_name=service_name,
+            region_name="us-east-1"
+        )
+    return AWS_CLIENTS[service_name]
+
+
+def get_cached_secret(secret_name: str) -> Optional[str]:
+    """
+    Returns the secret from the Secrets Manager, at most once every AWS_COGNITO_SECRET_CACHE_TTL_SECONDS
+    :param str secret_name: The name of the secret to retrieve
+    :return Optional[str]: The secret string
+    """
+    secret, expiration = SECRET_CACHE.get(secret_name, (None, 0))
+    if time.monotonic() >= expiration:
+        secret = get_secret(secret_name)
+        SECRET_CACHE[secret_name] = (secret, time.monotonic() + AWS_COGNITO_SECRET_CACHE_TTL_SECONDS)
+    return secret
+
+
 def get_secret(secret_name: str) -> Optional[str]:
     """
     Loads the secret key from the AWS Secret Manager
     :param str secret_name: The name of the secret to retrieve
     :return Optional[str]: The secret string
     """
-    region_name = "us-east-1"
+    from botocore.exceptions import ClientError
 
     # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(
-        service_name='secretsmanager',
-        region_name=region_name
-    )
+    client = get_aws_client("secretsmanager")
 
     # In this sample we only handle the specific exceptions for the 'GetSecretValue' API.
     # See https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
@@ -90,6 +174,18 @@ def get_secret(secret_name: str) -> Optional[str]:
     return None
 
 
+def get_fernet(fernet_key: str):
+    """
+    Returns the cipher suite of a fernet key, it is created once and reused
+    :param str fernet_key: The key to be used to encrypt and decrypt
+    :return Fernet: The cipher suite
+    """
+    if fernet_key not in FERNET_CACHE:
+        from cryptography.fernet import Fernet
+        FERNET_CACHE[fernet_key] = Fernet(fernet_key)
+    return FERNET_CACHE[fernet_key]
+
+
 def encrypt(fernet_key: str, content: str) -> Optional[str]:
     """
     Converts a dictionary into an encrypted string.
@@ -97,7 +193,7 @@ def encrypt(fernet_key: str, content: str) -> Optional[str]:
     :param str content: The string to be encrypted
     :return str: The encrypted string
     """
-    cipher_suite = Fernet(fernet_key)
+    cipher_suite = get_fernet(fernet_key)
     return cipher_suite.encrypt(content.encode()).decode()
 
 
@@ -108,7 +204,7 @@ def decrypt(fernet_key: str, content: str) -> str:
     :param str content: The content to be decrypted
     :return str: The decrypted string
     """
-    cipher_suite = Fernet(fernet_key)
+    cipher_suite = get_fernet(fernet_key)
     return cipher_suite.decrypt(content.encode()).decode()
 
 
@@ -118,7 +214,7 @@ def retrieve_user_profile(user_email: str) -> dict:
     :param str user_email: The user email
     :return dict: The user profile as a dictionary
     """
-    dynamodb = boto3.client("dynamodb", region_name="us-east-1")
+    dynamodb = get_aws_client("dynamodb")
     user_profile = dynamodb.get_item(
         TableName=AWS_COGNITO_DYNAMO_TABLE_NAME,
         Key={
@@ -145,12 +241,12 @@ def load_claims(user_email: str) -> dict:
     database_id = profile.get("database_id", {}).get("N", 0)
     workgroup_id = profile.get("workgroup_id", {}).get("N", 0)
 
-    fernet_key = get_secret(AWS_COGNITO_DYNAMO_SECRET_NAME)
+    fernet_key = get_cached_secret(AWS_COGNITO_DYNAMO_SECRET_NAME)
     decrypted_claims = decrypt(
         fernet_key=fernet_key,
         content=claims_encrypted
     )
-    claims = json.loads(decrypted_claims)
+    claims = json_loads(decrypted_claims)
     claims["x-hasura-user-id"] = cognito_uuid
 
     # If database_id or workgroup_Id is not present in
@@ -176,6 +272,62 @@ def is_valid_uuid(cognito_id: str) -> bool:
     return True if pattern.search(cognito_id) else False
 
 
+def redact(value):
+    """
+    Returns a copy of a value without the values of its redacted keys, at any depth
+    :param value: Any JSON value
+    :return: The redacted copy
+    """
+    if isinstance(value, dict):
+        return {
+            key: "[REDACTED]"
+            if any(redacted_key in str(key).lower() for redacted_key in AWS_COGNITO_LOG_REDACTED_KEYS)
+            else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def format_event(event: dict, with_body: bool = False) -> str:
+    """
+    Returns the log line of an event: its envelope, and the redacted event
+    if it is logged, capped to AWS_COGNITO_LOG_MAX_BYTES
+    :param dict event: The aws event dictionary
+    :param bool with_body: True to log the event itself, it is also logged for a sampled fraction of the events
+    :return str: A JSON string
+    """
+    document = {
+        key: event.get(key, None)
+        for key in ["version", "triggerSource", "region", "userPoolId", "source", "detail-type"]
+        if key in event
+    }
+    document["clientId"] = event.get("callerContext", {}).get("clientId", None)
+
+    if with_body or random.random() < AWS_COGNITO_LOG_BODY_SAMPLE_RATE:
+        document["event"] = redact(event)
+
+    message = json_dumps(document)
+    if len(message) > AWS_COGNITO_LOG_MAX_BYTES:
+        return message[:AWS_COGNITO_LOG_MAX_BYTES] + "...[truncated]"
+    return message
+
+
+def preload() -> None:
+    """
+    Creates the clients and reads the fernet key, so that the next
+    sign-in handled by this container is warm. Errors are only logged.
+    """
+    try:
+        get_aws_client("dynamodb")
+        fernet_key = get_cached_secret(AWS_COGNITO_DYNAMO_SECRET_NAME)
+        if fernet_key is not None:
+            get_fernet(fernet_key)
+    except Exception as e:
+        logger.error(f"Could not preload: {str(e)}")
+
+
 def handler(event: dict, context: object) -> dict:
     """
     Entrypoint for AWS Lambda
@@ -185,7 +337,7 @@ def handler(event: dict, context: object) -> dict:
     """
     logger.info(f"Function: {context.function_name}")
     logger.info(f"Request ID: {context.aws_request_id}")
-    logger.info(f"Event: {json.dumps(event)}")
+    logger.info(f"Event: {format_event(event)}")
 
     #
     # Check if the event is a cloudwatch event
@@ -194,7 +346,8 @@ def handler(event: dict, context: object) -> dict:
     event_type = event.get("detail-type", "none")
     if event_source == "aws.events" \
             and event_type == "Scheduled Event":
-        # Return the event so it shows as a successful transaction
+        # Warm up the container, and return the event so it shows as a successful transaction
+        preload()
         return event
 
     # Initialize the claims object
@@ -217,12 +370,14 @@ def handler(event: dict, context: object) -> dict:
             in one log message, with the keys automatically parsed
             into fields.
         """
+        import traceback
         exception_type, exception_value, exception_traceback = sys.exc_info()
         traceback_string = traceback.format_exception(exception_type, exception_value, exception_traceback)
         err_msg = json.dumps({
             "errorType": exception_type.__name__,
             "errorMessage": str(exception_value),
-            "stackTrace": traceback_string
+            "stackTrace": traceback_string,
+            "event": format_event(event, with_body=True),
         })
         logger.error(err_msg)
 
@@ -234,7 +389,7 @@ def handler(event: dict, context: object) -> dict:
     event["response"] = {
         "claimsOverrideDetails": {
             "claimsToAddOrOverride": {
-                "https://hasura.io/jwt/claims": json.dumps(claims)
+                "https://hasura.io/jwt/claims": json_dumps(claims)
             }
         }
     }
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import subprocess
+
+HOOK_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported on first use only, a sign-in on a cold container would pay for them
+HEAVY_MODULES = ["boto3", "botocore", "cryptography"]
+
+
+class TestColdStart:
+    def test_heavy_dependencies_are_deferred(self) -> None:
+        # Checked in a fresh interpreter, on sys.modules rather than timings
+        script = (
+            "import sys, json, handler; "
+            f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], cwd=HOOK_PATH, capture_output=True, text=True, check=True
+        )
+        assert json.loads(result.stdout) == []
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import handler
+
+
+class TestHandler:
+    @pytest.fixture(params=["orjson", "json"])
+    def json_codec(self, request, monkeypatch) -> str:
+        if request.param == "json":
+            monkeypatch.setattr(handler, "orjson", None)
+        elif handler.orjson is None:
+            pytest.skip("orjson is not installed")
+        return request.param
+
+    def test_json_dumps(self, json_codec: str) -> None:
+        assert handler.json_dumps({"name": "Ñ", "ids": [1, 2]}) == '{"name":"Ñ","ids":[1,2]}'
+        # Over 64 bits, orjson leaves the integers to the standard library
+        assert handler.json_dumps({"id": 2 ** 70 + 1}) == '{"id":1180591620717411303425}'
+        assert handler.json_loads('{"id": 1}') == {"id": 1}
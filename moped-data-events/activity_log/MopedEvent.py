@@ -1,29 +1,149 @@
-import json, boto3
+import json
 import re
+import time
 import datetime
-import pytz
-
-import requests
 
+import codec
+import metrics
+import tracing
+from diff import diff_states
+from record_data import build_record_data
 from config import (
+    ACTIVITY_LOG_BUCKET,
+    ACTIVITY_LOG_RECORD_DATA_POLICY,
+    ACTIVITY_LOG_RECORD_DATA_EXCLUDED_COLUMNS,
     HASURA_HTTP_HEADERS,
     HASURA_ENDPOINT,
     HASURA_EVENT_VALIDATION_SCHEMA,
     COGNITO_DYNAMO_TABLE_NAME,
+    USER_CACHE_TTL_SECONDS,
+    PRIMARY_KEYS_CACHE_TTL_SECONDS,
     API_ENVIRONMENT,
 )
 
+#
+# Shared by every event handled by a warm Lambda container:
+#   USER_DATABASE_ID_CACHE: user_id -> (database_id, expiration on the monotonic clock)
+#   PRIMARY_KEY_MAP_CACHE: (primary key map, expiration on the monotonic clock)
+#
+USER_DATABASE_ID_CACHE = {}
 
-class MopedEvent:
+PRIMARY_KEY_MAP_CACHE = ({}, 0)
+
+#
+# boto3 takes a good part of a cold start to import, it is only imported
+# (and the clients created) the first time AWS is needed.
+#
+boto3 = None
+
+DYNAMODB_CLIENT = None
+
+S3_CLIENT = None
+
+
+def get_boto3():
+    """
+    Returns the boto3 module, it is imported on first use
+    :return: The boto3 module
+    """
+    global boto3
+    if boto3 is None:
+        import boto3 as boto3_module
+        boto3 = boto3_module
+    return boto3
+
+
+def get_dynamodb_client():
+    """
+    Returns the DynamoDB client, it is created once and reused
+    :return: The boto3 DynamoDB client
+    """
+    global DYNAMODB_CLIENT
+    if DYNAMODB_CLIENT is None:
+        DYNAMODB_CLIENT = get_boto3().client("dynamodb", region_name="us-east-1")
+    return DYNAMODB_CLIENT
+
+
+def get_s3_client():
+    """
+    Returns the S3 client, it is created once and reused
+    :return: The boto3 S3 client
+    """
+    global S3_CLIENT
+    if S3_CLIENT is None:
+        S3_CLIENT = get_boto3().client("s3")
+    return S3_CLIENT
+
+
+def get_primary_key_map() -> dict:
     """
-    The Moped Event Class
+    Returns the primary key settings, they are downloaded from S3 at most
+    once every PRIMARY_KEYS_CACHE_TTL_SECONDS.
+    :return: A dictionary containing the primary key for every table
+    :rtype: dict
     """
+    global PRIMARY_KEY_MAP_CACHE
+    primary_key_map, expiration = PRIMARY_KEY_MAP_CACHE
+    if time.monotonic() >= expiration:
+        with metrics.span("primary_keys", always=True):
+            s3_object = get_s3_client().get_object(Bucket=ACTIVITY_LOG_BUCKET, Key=f"settings/moped_primary_keys_{API_ENVIRONMENT}.json")
+            primary_key_map = json.loads(s3_object['Body'].read())
+        PRIMARY_KEY_MAP_CACHE = (primary_key_map, time.monotonic() + PRIMARY_KEYS_CACHE_TTL_SECONDS)
+    return primary_key_map
 
-    HASURA_EVENT_VALIDATION_SCHEMA = None
 
-    HASURA_EVENT_PAYLOAD = {}
+def get_cached_user_database_id(user_id: str) -> int:
+    """
+    Returns the cached database id of a user, or None if it is missing or expired
+    :param user_id: Either the email address or the cognito uuid
+    :type user_id: str
+    :return: The database id
+    :rtype: int
+    """
+    database_id, expiration = USER_DATABASE_ID_CACHE.get(user_id, (None, 0))
+    if time.monotonic() >= expiration:
+        return None
+    return database_id
+
+
+def set_cached_user_database_id(user_id: str, database_id: int) -> None:
+    """
+    Caches the database id of a user for USER_CACHE_TTL_SECONDS
+    :param user_id: Either the email address or the cognito uuid
+    :type user_id: str
+    :param database_id: The user's database id
+    :type database_id: int
+    """
+    USER_DATABASE_ID_CACHE[user_id] = (database_id, time.monotonic() + USER_CACHE_TTL_SECONDS)
+
+
+# Marks the accessors of a MopedEvent that were not computed yet
+UNSET = object()
 
-    MOPED_PRIMARY_KEY_MAP = {}
+# Stands for the raw payload in the serialized mutation, until it is spliced in
+RAW_RECORD_DATA_PLACEHOLDER = "__moped_raw_record_data__"
+
+
+class MopedEvent:
+    """
+    The Moped Event Class. Events are compact: the values read from the payload
+    (table, operation, states, primary key and project id) are looked up once,
+    and the raw JSON body of the payload, when provided, is forwarded as it is
+    instead of being serialized again.
+    """
+
+    __slots__ = (
+        "HASURA_EVENT_VALIDATION_SCHEMA",
+        "_payload",
+        "_raw",
+        "_primary_key_map",
+        "_table",
+        "_operation",
+        "_old_state",
+        "_new_state",
+        "_primary_key",
+        "_project_id",
+    )
 
     MOPED_GRAPHQL_MUTATION = """
         mutation InsertMopedActivityLog (
@@ -34,38 +154,125 @@ class MopedEvent:
           $description:jsonb!,
           $updatedBy:uuid!,
           $operationType:String!,
-          $timestamp:timestamptz
+          $eventId:uuid,
+          $createdAt:timestamptz
         ) {
-          insert_moped_activity_log(objects: {
-            record_project_id: $recordProjectId,
-            record_id: $recordId,
-            record_type: $recordType,
-            record_data: $recordData,
-            description: $description,
-            updated_by: $updatedBy,
-            operation_type: $operationType
-          }) {
+          insert_moped_activity_log(
+            objects: {
+              record_project_id: $recordProjectId,
+              record_id: $recordId,
+              record_type: $recordType,
+              record_data: $recordData,
+              description: $description,
+              updated_by: $updatedBy,
+              operation_type: $operationType,
+              event_id: $eventId,
+              created_at: $createdAt
+            },
+            on_conflict: {constraint: moped_activity_log_event_id_key, update_columns: []}
+          ) {
             affected_rows
           }
-          update_moped_project(where: {project_id: {_eq: $recordId}}, _set: {updated_at: $timestamp}) {
+        }
+    """
+
+    MOPED_GRAPHQL_BATCH_MUTATION = """
+        mutation InsertMopedActivityLogBatch ($objects: [moped_activity_log_insert_input!]!) {
+          insert_moped_activity_log(
+            objects: $objects,
+            on_conflict: {constraint: moped_activity_log_event_id_key, update_columns: []}
+          ) {
             affected_rows
           }
         }
     """
 
-    def __init__(self, payload: dict, load_primary_keys: bool = True):
+    # The moped_activity_log column of every mutation variable
+    MOPED_ACTIVITY_LOG_COLUMNS = {
+        "recordProjectId": "record_project_id",
+        "recordId": "record_id",
+        "recordType": "record_type",
+        "recordData": "record_data",
+        "description": "description",
+        "updatedBy": "updated_by",
+        "operationType": "operation_type",
+        "eventId": "event_id",
+        "createdAt": "created_at",
+    }
+
+    def __init__(self, payload: dict, load_primary_keys: bool = True, raw=None):
         """
         Constructor for Moped Event
         :param payload: The event payload as provided by Lambda/SQS
         :type payload: dict
         :param load_primary_keys: If True, it will download the primary keys from S3. Default: True
         :type load_primary_keys: bool
+        :param raw: The JSON the payload was parsed from (ie. the SQS message body), if available
+        :type raw: str or bytes
         """
-        self.HASURA_EVENT_PAYLOAD = payload
         self.HASURA_EVENT_VALIDATION_SCHEMA = HASURA_EVENT_VALIDATION_SCHEMA
+        self._primary_key_map = {}
+        self.set_payload(payload, raw=raw)
         if load_primary_keys:
             self.load_primary_keys()
 
+    @property
+    def HASURA_EVENT_PAYLOAD(self) -> dict:
+        """
+        The event payload
+        :rtype: dict
+        """
+        return self._payload
+
+    @HASURA_EVENT_PAYLOAD.setter
+    def HASURA_EVENT_PAYLOAD(self, payload: dict) -> None:
+        self.set_payload(payload)
+
+    @property
+    def MOPED_PRIMARY_KEY_MAP(self) -> dict:
+        """
+        The primary key of every table
+        :rtype: dict
+        """
+        return self._primary_key_map
+
+    @MOPED_PRIMARY_KEY_MAP.setter
+    def MOPED_PRIMARY_KEY_MAP(self, primary_key_map: dict) -> None:
+        self._primary_key_map = primary_key_map
+        self._primary_key = UNSET
+
+    def set_payload(self, payload: dict, raw=None) -> None:
+        """
+        Replaces the payload, everything computed from the previous one is discarded
+        :param payload: The event payload
+        :type payload: dict
+        :param raw: The JSON the payload was parsed from, if available
+        :type raw: str or bytes
+        """
+        self._payload = payload
+        self._raw = raw
+        self._table = UNSET
+        self._operation = UNSET
+        self._old_state = UNSET
+        self._new_state = UNSET
+        self._primary_key = UNSET
+        self._project_id = UNSET
+
+    def get_cached(self, slot: str, compute):
+        """
+        Returns the value of an accessor, it is computed on first use
+        :param slot: The slot holding the value
+        :type slot: str
+        :param compute: Computes the value
+        :type compute: Callable
+        :return: The value
+        """
+        value = getattr(self, slot)
+        if value is UNSET:
+            value = compute()
+            setattr(self, slot, value)
+        return value
+
     def __repr__(self) -> str:
         """
         Returns the name of the class as a representation
@@ -76,11 +283,13 @@ class MopedEvent:
 
     def __str__(self) -> str:
         """
-        Returns the value of payload as a string
+        Returns the value of payload as a string, the raw JSON if available
         :return:
         :rtype: str
         """
-        return json.dumps(self.HASURA_EVENT_PAYLOAD)
+        if self._raw is not None:
+            return self._raw.decode("utf-8") if isinstance(self._raw, bytes) else self._raw
+        return codec.dumps(self.HASURA_EVENT_PAYLOAD)
 
     @staticmethod
     def is_valid_uuid(uuid: str) -> bool:
@@ -116,8 +325,24 @@ class MopedEvent:
 
     def get_state(self, mode: str = "new") -> dict:
         """
-        Returns the old state of the payload.
-        :return: The old state of the record as an dictionary
+        Returns the old or new state of the payload, it is looked up once
+        :param mode: old or new
+        :type mode: str
+        :return: The state of the record as an dictionary
+        :rtype: dict
+        """
+        if mode == "new":
+            return self.get_cached("_new_state", lambda: self.read_state("new"))
+        if mode == "old":
+            return self.get_cached("_old_state", lambda: self.read_state("old"))
+        return self.read_state(mode)
+
+    def read_state(self, mode: str) -> dict:
+        """
+        Reads a state from the payload
+        :param mode: old or new
+        :type mode: str
+        :return: The state of the record, an empty dictionary if the payload has none
         :rtype: dict
         """
         try:
@@ -147,9 +372,36 @@ class MopedEvent:
         :return: A dictionary containing the primary key for every table
         :rtype: dict
         """
-        s3 = boto3.Session().client('s3')
-        s3_object = s3.get_object(Bucket="atd-moped-data-events", Key=f"settings/moped_primary_keys_{API_ENVIRONMENT}.json")
-        self.MOPED_PRIMARY_KEY_MAP = json.loads(s3_object['Body'].read())
+        self.MOPED_PRIMARY_KEY_MAP = get_primary_key_map()
+
+    def save_snapshot(self, digest: str, body: bytes) -> dict:
+        """
+        Stores a serialized record state in S3, addressed by its content digest.
+        Identical states are written to the same key, so they are only stored once.
+        :param digest: The sha256 hex digest of the body
+        :type digest: str
+        :param body: The serialized state
+        :type body: bytes
+        :return: The reference to the snapshot
+        :rtype: dict
+        """
+        key = f"snapshots/{API_ENVIRONMENT}/{self.get_event_type()}/{digest}.json"
+        get_s3_client().put_object(Bucket=ACTIVITY_LOG_BUCKET, Key=key, Body=body, ContentType="application/json")
+        return {"bucket": ACTIVITY_LOG_BUCKET, "key": key, "sha256": digest}
+
+    def get_record_data(self) -> dict:
+        """
+        Builds the record_data value according to ACTIVITY_LOG_RECORD_DATA_POLICY
+        :return: The record data for the activity log
+        :rtype: dict
+        """
+        with metrics.span("record_data"):
+            return build_record_data(
+                payload=self.payload(),
+                policy=ACTIVITY_LOG_RECORD_DATA_POLICY,
+                excluded_columns=ACTIVITY_LOG_RECORD_DATA_EXCLUDED_COLUMNS.get(self.get_event_type(), []),
+                save_snapshot=self.save_snapshot,
+            )
 
     @staticmethod
     def get_user_profile(user_id: str) -> dict:
@@ -160,8 +412,7 @@ class MopedEvent:
         :return: The user's profile
         :rtype: dict
         """
-        dynamodb = boto3.client("dynamodb", region_name="us-east-1")
-        return dynamodb.get_item(
+        return get_dynamodb_client().get_item(
             TableName=COGNITO_DYNAMO_TABLE_NAME,
             Key={
                 "user_id": {"S": user_id.replace("azuread_", "")},
@@ -179,8 +430,7 @@ class MopedEvent:
         if not self.is_valid_uuid(user_id):
             raise TypeError("Invalid user id")
 
-        dynamodb = boto3.client("dynamodb", region_name="us-east-1")
-        return dynamodb.query(
+        return get_dynamodb_client().query(
             # Add the name of the index you want to use in your query.
             TableName=COGNITO_DYNAMO_TABLE_NAME,
             IndexName="cognito_uuid_idx",
@@ -202,13 +452,20 @@ class MopedEvent:
         :return:
         :rtype:
         """
+        database_id = get_cached_user_database_id(str(user_id))
+        if database_id is not None:
+            return database_id
 
         try:
-            profile = (self.get_user_profile if "@" in user_id else self.get_user_profile_uuid)(user_id=str(user_id))
-            return int(profile["Item"]["database_id"]["N"] if "Item" in profile else profile["Items"][0]["database_id"]["N"])
+            with metrics.span("user_lookup"):
+                profile = (self.get_user_profile if "@" in user_id else self.get_user_profile_uuid)(user_id=str(user_id))
+            database_id = int(profile["Item"]["database_id"]["N"] if "Item" in profile else profile["Items"][0]["database_id"]["N"])
         except (TypeError, KeyError, IndexError):
             return default
 
+        set_cached_user_database_id(str(user_id), database_id)
+        return database_id
+
     def get_primary_key(self, table: str, default: str = None) -> str:
         """
         Returns the name of a primary key column for a table
@@ -221,6 +478,14 @@ class MopedEvent:
         """
         return self.MOPED_PRIMARY_KEY_MAP.get(table, default)
 
+    def get_record_primary_key(self) -> str:
+        """
+        Returns the name of the primary key column of the modified table, it is looked up once
+        :return: The name of the primary key field, None if it is unknown
+        :rtype: str
+        """
+        return self.get_cached("_primary_key", lambda: self.get_primary_key(table=self.get_event_type()))
+
     def get_event_session_var(self, variable: str, default: str = None) -> str:
         """
         Retrieves the event's session variable value by it's name
@@ -238,62 +503,87 @@ class MopedEvent:
 
     def get_event_type(self) -> str:
         """
-        Safely retrieves the event type from the event payload
+        Safely retrieves the event type from the event payload, it is looked up once
         :return: The name of the table being modified
         :rtype: str
         """
+        return self.get_cached("_table", self.read_event_type)
+
+    def read_event_type(self) -> str:
+        """
+        Reads the event type from the event payload
+        :return: The name of the table being modified, an empty string if not available
+        :rtype: str
+        """
         try:
             return self.HASURA_EVENT_PAYLOAD["table"]["name"]
         except (TypeError, KeyError):
             return ""
 
-    def get_diff(self) -> dict:
+    def get_diff(self) -> list:
         """
-        Generates a dictionary with a list of all different values in the payload old and new state
-        :return: The dictionary containing the diff
-        :rtype: dict
+        Generates a list of all different values in the payload old and new state,
+        nested jsonb changes are described by their JSON pointer path.
+        :return: The list containing the diff
+        :rtype: list
         """
-        change_list = []
-        old_state = self.get_state("old")
-        new_state = self.get_state("new")
-
-        if old_state is None:
-            return change_list
-        else:
-            # Gather a list of keys that present a difference in values
-            keys_with_diff = list(
-                filter(
-                    lambda k: new_state[k] != old_state[k],  # Compare between old and new state
-                    new_state.keys()  # For every key in new_state
-                )
+        with metrics.span("diff"):
+            return diff_states(
+                old_state=self.get_state("old"),
+                new_state=self.get_state("new"),
             )
 
-        for key in keys_with_diff:
-            change_list.append({
-                "field": key,
-                "old": old_state[key] if old_state is not None else "",
-                "new": new_state[key]
-            })
-
-        return change_list
-
     def get_project_id(self) -> int:
         """
         Retrieves the project_id if present in the record
-        :return: The project_id value of the record as an integer (from the new state).
+        :return: The project_id value of the record as an integer (from the new state, or the old state on DELETE).
         :rtype: int
         """
-        return self.get_state("new").get("project_id", 0)
+        return self.get_cached(
+            "_project_id",
+            lambda: (self.get_state("new") or self.get_state("old") or {}).get("project_id", 0)
+        )
+
+    def get_event_id(self, default: str = None) -> str:
+        """
+        Returns the id Hasura gave to the event, it is the same across SQS redeliveries
+        :return: The event id (uuid)
+        :rtype: str
+        """
+        try:
+            return self.HASURA_EVENT_PAYLOAD["id"]
+        except (TypeError, KeyError):
+            return default
+
+    def get_event_timestamp(self) -> str:
+        """
+        Returns the time Hasura created the event, or the current time if not available
+        :return: The ISO timestamp of the event
+        :rtype: str
+        """
+        try:
+            return self.HASURA_EVENT_PAYLOAD["created_at"]
+        except (TypeError, KeyError):
+            return datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
 
     def get_operation_type(self, default: str = None) -> str:
         """
-        Returns the operation type from the hasura payload
+        Returns the operation type from the hasura payload, it is looked up once
         :return str:
         """
+        operation = self.get_cached("_operation", self.read_operation_type)
+        return default if operation is None else operation
+
+    def read_operation_type(self) -> str:
+        """
+        Reads the operation type from the hasura payload
+        :return: INSERT, UPDATE or DELETE, None if not available
+        :rtype: str
+        """
         try:
             return self.HASURA_EVENT_PAYLOAD["event"]["op"]
         except (TypeError, KeyError):
-            return default
+            return None
 
     def get_variables(self) -> dict:
         """
@@ -301,18 +591,60 @@ class MopedEvent:
         :return: The dictionary containing all the variables needed
         :rtype: dict
         """
-        primary_key = self.get_primary_key(table=self.get_event_type())
+        primary_key = self.get_record_primary_key()
         return {
             "recordProjectId": self.get_project_id(),
             "recordId": self.get_state("new")[primary_key],
             "recordType": self.get_event_type(),
-            "recordData": self.payload(),
+            "recordData": self.get_record_data(),
             "description": self.get_diff(),
             "updatedBy": self.get_event_session_var(variable="x-hasura-user-id", default=None),
             "operationType": self.get_operation_type(default=None),
-            "timestamp": datetime.datetime.now(tz=pytz.utc).isoformat(),
+            "eventId": self.get_event_id(default=None),
+            "createdAt": self.get_event_timestamp(),
+        }
+
+    def get_insert_object(self) -> dict:
+        """
+        Builds the moped_activity_log row of the event, for batched inserts
+        :return: The insert object, keyed by column name
+        :rtype: dict
+        """
+        return {
+            self.MOPED_ACTIVITY_LOG_COLUMNS[variable]: value
+            for variable, value in self.get_variables().items()
         }
 
+    def get_request_body(self, variables: dict) -> bytes:
+        """
+        Serializes the GraphQL mutation and its variables. When the record data
+        is the whole payload (the full policy, the default) and its raw JSON is
+        available (the SQS message body), the raw JSON is spliced in instead of
+        serializing the payload again, with either codec. Replacing the payload
+        discards the raw JSON, so it always matches the payload.
+        :param variables: GraphQL variables and values in kay-pair dictionary form
+        :type variables: dict
+        :return: The JSON body of the HTTP request, UTF-8 encoded
+        :rtype: bytes
+        """
+        if self._raw is None or variables.get("recordData", None) is not self.HASURA_EVENT_PAYLOAD:
+            return codec.dumps_bytes(
+                {
+                    "query": self.MOPED_GRAPHQL_MUTATION,
+                    "variables": variables
+                }
+            )
+
+        body = codec.dumps_bytes(
+            {
+                "query": self.MOPED_GRAPHQL_MUTATION,
+                "variables": {**variables, "recordData": RAW_RECORD_DATA_PLACEHOLDER}
+            }
+        )
+        before, after = body.split(codec.dumps_bytes(RAW_RECORD_DATA_PLACEHOLDER), 1)
+        raw = self._raw if isinstance(self._raw, bytes) else self._raw.encode("utf-8")
+        return b"".join([before, raw, after])
+
     def request(self, variables: dict, headers: dict = {}) -> dict:
         """
         Makes the GraphQL query via HTTP
@@ -323,22 +655,75 @@ class MopedEvent:
         :return: The HTTP response from Hasura
         :rtype: dict
         """
-        response = requests.post(
-            url=HASURA_ENDPOINT,
-            headers={
-                **HASURA_HTTP_HEADERS,
-                **headers
-            },
-            data=json.dumps(
-                {
-                    "query": self.MOPED_GRAPHQL_MUTATION,
-                    "variables": variables
-                }
+        import requests
+
+        with metrics.span("hasura_request"), \
+                tracing.start_span("hasura_mutation", attributes={"http.url": HASURA_ENDPOINT}):
+            response = requests.post(
+                url=HASURA_ENDPOINT,
+                headers={
+                    **HASURA_HTTP_HEADERS,
+                    **headers
+                },
+                data=self.get_request_body(variables)
             )
-        )
         response.encoding = "utf-8"
         return response.json()
 
+    @staticmethod
+    def request_batch(objects: list, headers: dict = {}) -> dict:
+        """
+        Inserts many activity log rows in a single GraphQL mutation
+        :param objects: The insert objects, as returned by get_insert_object
+        :type objects: list
+        :param headers: Any additional HTTP Headers
+        :type headers: dict
+        :return: The HTTP response from Hasura
+        :rtype: dict
+        """
+        import requests
+
+        with metrics.span("hasura_request", always=True):
+            response = requests.post(
+                url=HASURA_ENDPOINT,
+                headers={
+                    **HASURA_HTTP_HEADERS,
+                    **headers
+                },
+                data=codec.dumps_bytes(
+                    {
+                        "query": MopedEvent.MOPED_GRAPHQL_BATCH_MUTATION,
+                        "variables": {"objects": objects}
+                    }
+                )
+            )
+        response.encoding = "utf-8"
+        return response.json()
+
+    async def request_async(self, session, variables: dict, headers: dict = {}) -> dict:
+        """
+        Makes the GraphQL query via HTTP without blocking the event loop
+        :param session: The aiohttp session shared by the whole batch
+        :type session: aiohttp.ClientSession
+        :param variables: GraphQL variables and values in kay-pair dictionary form
+        :type variables: dict
+        :param headers: Any additional HTTP Headers
+        :type headers: dict
+        :return: The HTTP response from Hasura
+        :rtype: dict
+        """
+        with metrics.span("hasura_request"), \
+                tracing.start_span("hasura_mutation", attributes={"http.url": HASURA_ENDPOINT}):
+            async with session.post(
+                HASURA_ENDPOINT,
+                headers={
+                    **HASURA_HTTP_HEADERS,
+                    **headers
+                },
+                data=self.get_request_body(variables)
+            ) as response:
+                return await response.json(content_type=None, encoding="utf-8")
+
     def save(self) -> dict:
         """
         Simplifies the request method
@@ -346,3 +731,13 @@ class MopedEvent:
         :rtype: dict
         """
         return self.request(variables=self.get_variables())
+
+    async def save_async(self, session) -> dict:
+        """
+        Simplifies the request_async method
+        :param session: The aiohttp session shared by the whole batch
+        :type session: aiohttp.ClientSession
+        :return: The HTTP response from Hasura
+        :rtype: dict
+        """
+        return await self.request_async(session=session, variables=self.get_variables())
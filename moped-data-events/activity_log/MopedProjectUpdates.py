@@ -0,0 +1,144 @@
+import time
+
+import codec
+from config import (
+    HASURA_HTTP_HEADERS,
+    HASURA_ENDPOINT,
+    PROJECT_UPDATE_WINDOW_SECONDS,
+)
+
+
+class MopedProjectUpdates:
+    """
+    Gathers the projects touched by a batch of events, so that
+    moped_project.updated_at is bumped at most once per project. With a time
+    window, updates that are not due yet stay pending in memory, for the next
+    batch or Scheduled Event handled by the same container: the window is best
+    effort, the pending bumps are lost if the container is recycled before.
+    """
+
+    def __init__(self, window_seconds: int = PROJECT_UPDATE_WINDOW_SECONDS):
+        """
+        Constructor for the project updates
+        :param window_seconds: Minimum time between two bumps of the same project. Default: 0 (once per batch)
+        :type window_seconds: int
+        """
+        self.pending_updates = {}
+        self.last_updated = {}
+        self.window_seconds = window_seconds
+
+    def __len__(self) -> int:
+        """
+        Returns the number of projects waiting to be updated
+        :return: The number of pending projects
+        :rtype: int
+        """
+        return len(self.pending_updates)
+
+    def add(self, project_id: int, timestamp: str) -> None:
+        """
+        Registers a change to a project, only the latest timestamp is kept
+        :param project_id: The project id
+        :type project_id: int
+        :param timestamp: The ISO timestamp of the change
+        :type timestamp: str
+        """
+        if not isinstance(project_id, int) or isinstance(project_id, bool) or project_id <= 0:
+            return
+
+        from dateutil import parser as date_parser
+
+        current = self.pending_updates.get(project_id, None)
+        if current is None or date_parser.isoparse(timestamp) > date_parser.isoparse(current):
+            self.pending_updates[project_id] = timestamp
+
+    def get_due_updates(self, flush: bool = False) -> dict:
+        """
+        Returns the pending updates for projects not bumped within the time window
+        :param flush: True to return every pending update, whatever the time window
+        :type flush: bool
+        :return: A dictionary of project id to timestamp
+        :rtype: dict
+        """
+        now = time.monotonic()
+        return {
+            project_id: timestamp
+            for project_id, timestamp in self.pending_updates.items()
+            if flush or now - self.last_updated.get(project_id, float("-inf")) >= self.window_seconds
+        }
+
+    @staticmethod
+    def get_mutation(project_ids: list) -> str:
+        """
+        Builds a single mutation with one aliased update per project. The updated_at
+        value is only moved forward, an older event never overwrites a newer one.
+        :param project_ids: The list of project ids
+        :type project_ids: list
+        :return: The GraphQL mutation
+        :rtype: str
+        """
+        arguments = ", ".join(
+            f"$projectId{index}: Int!, $timestamp{index}: timestamptz!" for index in range(len(project_ids))
+        )
+        updates = "\n".join(
+            f"""
+          project{index}: update_moped_project(
+            where: {{
+              project_id: {{_eq: $projectId{index}}},
+              _or: [{{updated_at: {{_is_null: true}}}}, {{updated_at: {{_lt: $timestamp{index}}}}}]
+            }},
+            _set: {{updated_at: $timestamp{index}}}
+          ) {{
+            affected_rows
+          }}"""
+            for index in range(len(project_ids))
+        )
+        return f"""
+        mutation UpdateMopedProjectsUpdatedAt ({arguments}) {{{updates}
+        }}
+    """
+
+    def save(self, flush: bool = False) -> dict:
+        """
+        Bumps moped_project.updated_at for every due project in a single request. The
+        updates stay pending, for the next batch, unless Hasura answers without errors.
+        :param flush: True to bump every pending project, whatever the time window
+        :type flush: bool
+        :return: The HTTP response from Hasura, or an empty dictionary if there was nothing to do
+        :rtype: dict
+        """
+        due_updates = self.get_due_updates(flush=flush)
+        if len(due_updates) == 0:
+            return {}
+
+        import requests
+
+        project_ids = list(due_updates.keys())
+        variables = {}
+        for index, project_id in enumerate(project_ids):
+            variables[f"projectId{index}"] = project_id
+            variables[f"timestamp{index}"] = due_updates[project_id]
+
+        response = requests.post(
+            url=HASURA_ENDPOINT,
+            headers=HASURA_HTTP_HEADERS,
+            data=codec.dumps_bytes(
+                {
+                    "query": self.get_mutation(project_ids),
+                    "variables": variables
+                }
+            )
+        )
+        response.encoding = "utf-8"
+        response_body = response.json()
+        if "errors" in response_body:
+            return response_body
+
+        now = time.monotonic()
+        for project_id in project_ids:
+            self.last_updated[project_id] = now
+            # A newer change may have been added meanwhile, it stays pending
+            if self.pending_updates.get(project_id, None) == due_updates[project_id]:
+                del self.pending_updates[project_id]
+
+        return response_body
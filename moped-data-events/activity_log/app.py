@@ -4,27 +4,46 @@
 import json
 import time
 import logging
+from collections import OrderedDict
 
-
-from cerberus import Validator
-
+import codec
+import metrics
+import tracing
+from event_log import format_event, get_loggable
+from claim_check import resolve_records
+from coalesce import coalesce_records
+from diff import has_changes
 from config import (
+    ACTIVITY_LOG_COALESCE_WINDOW_SECONDS,
+    ACTIVITY_LOG_IGNORED_COLUMNS,
     HASURA_EVENT_VALIDATION_SCHEMA,
+    SEEN_EVENT_IDS_MAX_SIZE,
 )
 
-from MopedEvent import MopedEvent
+from MopedEvent import MopedEvent, get_dynamodb_client, get_primary_key_map
+from MopedProjectUpdates import MopedProjectUpdates
 
 # Initialize our logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Projects whose updated_at must be bumped, kept across invocations of a warm container
+project_updates = MopedProjectUpdates()
+
+# Ids of the Hasura events already saved by this container, oldest first
+seen_event_ids = OrderedDict()
+
+# The cerberus validator, created on first use (cerberus is imported with it)
+event_validator = None
+
+
 def raise_critical_error(
         message: str,
         data: dict = None,
         exception_type: object = Exception
 ):
     """
-    Logs an error in Lambda
+    Logs an error in Lambda, with the redacted and capped event data
     :param dict data: The event data
     :param str message: The message to be logged
     :param object exception_type: An optional exception type object
@@ -32,7 +51,7 @@ def raise_critical_error(
     """
     critical_error_message = json.dumps(
         {
-            "event_object": data,
+            "event_object": get_loggable(data),
             "message": message,
         }
     )
@@ -51,8 +70,21 @@ def validate_hasura_event(event: dict) -> tuple:
     if event is None:
         return False, {"event": "Empty document"}
 
-    event_validator = Validator(HASURA_EVENT_VALIDATION_SCHEMA)
-    return event_validator.validate(document=event), event_validator.errors
+    validator = get_event_validator()
+    return validator.validate(document=event), validator.errors
+
+
+def get_event_validator():
+    """
+    Returns the validator of HASURA_EVENT_VALIDATION_SCHEMA, it is created once and reused
+    :return: The cerberus validator
+    :rtype: cerberus.Validator
+    """
+    global event_validator
+    if event_validator is None:
+        from cerberus import Validator
+        event_validator = Validator(HASURA_EVENT_VALIDATION_SCHEMA)
+    return event_validator
 
 
 def get_event_type(event: dict) -> str:
@@ -69,28 +101,113 @@ def get_event_type(event: dict) -> str:
         return ""
 
 
-def process_event(event: dict) -> None:
+def get_ignored_columns(table: str) -> list:
     """
-    Processes a single event from Hasura, it compares the old and new
-    records, and creates a summary for insertion back against Hasura.
+    Returns the columns whose changes alone do not make an event significant
+    :param str table: The table name
+    :return list: The ignored columns of every table, and of this one
+    """
+    return ACTIVITY_LOG_IGNORED_COLUMNS.get("*", []) + ACTIVITY_LOG_IGNORED_COLUMNS.get(table, [])
+
+
+def is_significant_event(event: dict) -> bool:
+    """
+    Returns False for UPDATE events where nothing but the ignored columns changed,
+    it only looks at the payload so it runs before any I/O
+    :param dict event: The single event object
+    :return bool:
+    """
+    try:
+        if event["event"]["op"] != "UPDATE":
+            return True
+        data = event["event"]["data"]
+    except (TypeError, KeyError):
+        return True
+
+    return has_changes(
+        old_state=data.get("old"),
+        new_state=data.get("new"),
+        ignored_columns=get_ignored_columns(get_event_type(event)),
+    )
+
+
+def is_seen_event(event: dict) -> bool:
+    """
+    Returns True if the event was already saved by this container (an SQS redelivery)
+    :param dict event: The single event object
+    :return bool:
+    """
+    try:
+        return event["id"] in seen_event_ids
+    except (TypeError, KeyError):
+        return False
+
+
+def mark_seen_event(event: dict) -> None:
+    """
+    Remembers the id of a saved event, the oldest ids are forgotten past SEEN_EVENT_IDS_MAX_SIZE
     :param dict event: The single event object
-    :return dict:
+    """
+    try:
+        seen_event_ids[event["id"]] = True
+    except (TypeError, KeyError):
+        return
+    while len(seen_event_ids) > SEEN_EVENT_IDS_MAX_SIZE:
+        seen_event_ids.popitem(last=False)
+
+
+def mark_seen_record(record: dict, event: dict) -> None:
+    """
+    Remembers the id of a saved event, and of every event coalesced into it
+    :param dict record: The SQS record
+    :param dict event: The single event object
+    """
+    mark_seen_event(event)
+    for event_id in record.get("coalesced_event_ids", []):
+        mark_seen_event({"id": event_id})
+
+
+def coalesce_batch(records: list) -> list:
+    """
+    Merges the bursts of updates to the same record, if ACTIVITY_LOG_COALESCE_WINDOW_SECONDS is set
+    :param list records: The SQS records of the batch
+    :return list: The records, with a single record per burst
+    """
+    if ACTIVITY_LOG_COALESCE_WINDOW_SECONDS <= 0:
+        return records
+
+    coalesced = coalesce_records(
+        records,
+        primary_key_map=get_primary_key_map(),
+        window_seconds=ACTIVITY_LOG_COALESCE_WINDOW_SECONDS,
+        exclude=is_seen_event,
+    )
+    metrics.increment("coalesced_events", len(records) - len(coalesced))
+    return coalesced
+
+
+def build_moped_event(event: dict, raw: str = None) -> MopedEvent:
+    """
+    Validates a single event from Hasura and builds its MopedEvent object
+    :param dict event: The single event object
+    :param str raw: The JSON the event was parsed from, forwarded as it is when possible
+    :return MopedEvent: The event, ready to be saved, or None if the event is not significant
     """
     # First validate basic format (not actual data)
-    event_format_valid, event_format_errors = validate_hasura_event(event)
+    with metrics.span("validate"):
+        event_format_valid, event_format_errors = validate_hasura_event(event)
 
     if event_format_valid:
         event_type = get_event_type(event)
 
         if event_type != "":
+            # No activity log row for updates that did not change anything meaningful
+            if not is_significant_event(event):
+                print(f"Skipping insignificant event: {event.get('id', '')}")
+                metrics.increment("skipped_events")
+                return None
             # Build event object
-            moped_event = MopedEvent(event)
-            response = moped_event.save()
-            if "errors" in response:
-                raise_critical_error(
-                    message=f"Error while running GraphQL Query: {json.dumps(response)}",
-                    data=event
-                )
+            return MopedEvent(event, raw=raw)
         else:
             raise_critical_error(
                 message=f"Event type not specified",
@@ -103,6 +220,75 @@ def process_event(event: dict) -> None:
         )
 
 
+def check_response(response: dict, event: dict) -> None:
+    """
+    Raises a critical error if the Hasura response contains errors
+    :param dict response: The HTTP response from Hasura
+    :param dict event: The single event object
+    """
+    if "errors" in response:
+        raise_critical_error(
+            message=f"Error while running GraphQL Query: {json.dumps(response)}",
+            data=event
+        )
+
+
+def process_event(event: dict, raw: str = None) -> MopedEvent:
+    """
+    Processes a single event from Hasura, it compares the old and new
+    records, and creates a summary for insertion back against Hasura.
+    :param dict event: The single event object
+    :param str raw: The JSON the event was parsed from (the SQS message body), if available
+    :return MopedEvent: The saved event, None if it was skipped
+    """
+    with metrics.span("process_event"):
+        moped_event = build_moped_event(event, raw=raw)
+        if moped_event is not None:
+            check_response(moped_event.save(), event)
+    return moped_event
+
+
+def is_scheduled_event(event: dict) -> bool:
+    """
+    Returns True if the event is a cloudwatch event (used to keep the function warm)
+    :param dict event: The Lambda event
+    :return bool:
+    """
+    event_source = event.get("source", "none")
+    event_type = event.get("detail-type", "none")
+    return event_source == "aws.events" and event_type == "Scheduled Event"
+
+
+def preload() -> None:
+    """
+    Imports the heavy dependencies and fills the caches, so that the next
+    event handled by this container does not pay for them. Errors are only logged.
+    """
+    try:
+        import requests
+        get_event_validator()
+        get_dynamodb_client()
+        get_primary_key_map()
+    except Exception as e:
+        print(f"Could not preload: {str(e)}")
+
+
+def save_project_updates(flush: bool = False) -> None:
+    """
+    Bumps updated_at for the projects touched by the batch, errors are only logged
+    :param bool flush: True to bump every pending project, whatever PROJECT_UPDATE_WINDOW_SECONDS
+    """
+    try:
+        with metrics.span("project_updates", always=True):
+            response = project_updates.save(flush=flush)
+        if "errors" in response:
+            print(f"Error while updating projects: {json.dumps(response)}")
+    except Exception as e:
+        print(f"Could not update projects: {str(e)}")
+    if len(project_updates) > 0:
+        print(f"Project updates pending in this container: {len(project_updates)}")
+
+
 def handler(event, context):
     """
     Event handler main loop. It handles a single or multiple SQS messages.
@@ -112,31 +298,51 @@ def handler(event, context):
 
     logger.info(f"Function: {context.function_name}")
     logger.info(f"Request ID: {context.aws_request_id}")
-    logger.info(f"Event: {json.dumps(event)}")
+    logger.info(f"Event: {format_event(event)}")
 
     #
     # Check if the event is a cloudwatch event
     #
-    event_source = event.get("source", "none")
-    event_type = event.get("detail-type", "none")
-    if event_source == "aws.events" \
-            and event_type == "Scheduled Event":
-        # Return the event so it shows as a successful transaction
+    if is_scheduled_event(event):
+        # Warm up the container, and return the event so it shows as a successful transaction
+        preload()
+        # The project updates held back by the time window are not left waiting for the next batch
+        save_project_updates(flush=True)
         return event
 
     if "Records" in event:
-        for record in event["Records"]:
-            time_str = time.ctime()
-            if "body" in record:
-                try:
-                    payload = json.loads(record["body"])
-                    process_event(payload)
-                except Exception as e:
-                    print(f"Start Time: {time_str}", str(e))
-                    time_str = time.ctime()
-                    print("Done executing: ", time_str)
-                    raise_critical_error(
-                        message=f"Could not process record: {str(e)}",
-                        data=record,
-                        exception_type=Exception
-                    )
\ No newline at end of file
+        metrics.start_batch()
+        try:
+            for record in coalesce_batch(resolve_records(event["Records"])):
+                time_str = time.ctime()
+                if "body" in record:
+                    try:
+                        metrics.sample_event()
+                        metrics.increment("events")
+                        payload = codec.loads(record["body"])
+                        if is_seen_event(payload):
+                            print(f"Skipping redelivered event: {payload['id']}")
+                            metrics.increment("redelivered_events")
+                            continue
+                        with tracing.trace_record(record, payload):
+                            moped_event = process_event(payload, raw=record["body"])
+                        mark_seen_record(record, payload)
+                        if moped_event is not None:
+                            project_updates.add(
+                                project_id=moped_event.get_project_id(),
+                                timestamp=moped_event.get_event_timestamp(),
+                            )
+                    except Exception as e:
+                        metrics.increment("failed_events")
+                        print(f"Start Time: {time_str}", str(e))
+                        time_str = time.ctime()
+                        print("Done executing: ", time_str)
+                        raise_critical_error(
+                            message=f"Could not process record: {str(e)}",
+                            data=record,
+                            exception_type=Exception
+                        )
+        finally:
+            # One updated_at bump per project for the whole batch
+            save_project_updates()
+            metrics.flush_batch()
\ No newline at end of file
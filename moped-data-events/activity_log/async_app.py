@@ -0,0 +1,153 @@
+#
+# Activity Log SQS Handler (asyncio)
+#
+#   Same as app.handler, but the records of a batch are written to Hasura
+# concurrently (up to ACTIVITY_LOG_CONCURRENCY at a time) over a single
+# pooled HTTP session. Deploy with the handler "async_app.handler".
+#
+import time
+import asyncio
+import logging
+
+import codec
+import metrics
+import tracing
+from event_log import format_event
+from claim_check import resolve_records
+from config import ACTIVITY_LOG_CONCURRENCY
+
+from app import (
+    build_moped_event,
+    check_response,
+    is_scheduled_event,
+    coalesce_batch,
+    is_seen_event,
+    mark_seen_record,
+    preload,
+    project_updates,
+    raise_critical_error,
+    save_project_updates,
+)
+from MopedEvent import MopedEvent, get_primary_key_map
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+async def process_event_async(event: dict, session: "aiohttp.ClientSession", raw: str = None) -> MopedEvent:
+    """
+    Processes a single event from Hasura without blocking the event loop
+    :param dict event: The single event object
+    :param aiohttp.ClientSession session: The HTTP session shared by the batch
+    :param str raw: The JSON the event was parsed from (the SQS message body), if available
+    :return MopedEvent: The saved event, None if it was skipped
+    """
+    with metrics.span("process_event"):
+        moped_event = build_moped_event(event, raw=raw)
+        if moped_event is not None:
+            check_response(await moped_event.save_async(session=session), event)
+    return moped_event
+
+
+async def process_record_async(
+        record: dict,
+        session: "aiohttp.ClientSession",
+        semaphore: asyncio.Semaphore
+) -> MopedEvent:
+    """
+    Processes a single SQS record once the semaphore allows it
+    :param dict record: The SQS record
+    :param aiohttp.ClientSession session: The HTTP session shared by the batch
+    :param asyncio.Semaphore semaphore: Bounds the number of concurrent requests
+    :return MopedEvent: The saved event, None if it was already saved (SQS redelivery) or skipped
+    """
+    # Every record runs in its own task, and so its own sampling context
+    metrics.sample_event()
+    metrics.increment("events")
+    payload = codec.loads(record["body"])
+    if is_seen_event(payload):
+        print(f"Skipping redelivered event: {payload['id']}")
+        metrics.increment("redelivered_events")
+        return None
+
+    async with semaphore:
+        with tracing.trace_record(record, payload):
+            moped_event = await process_event_async(payload, session=session, raw=record["body"])
+    mark_seen_record(record, payload)
+    return moped_event
+
+
+async def process_records_async(records: list, concurrency: int = ACTIVITY_LOG_CONCURRENCY) -> list:
+    """
+    Processes SQS records concurrently, a failed record does not stop the others
+    :param list records: The SQS records, all of them must have a body
+    :param int concurrency: The maximum number of concurrent requests
+    :return list: A MopedEvent, None or an Exception for every record, in order
+    """
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        return await asyncio.gather(
+            *[process_record_async(record, session=session, semaphore=semaphore) for record in records],
+            return_exceptions=True
+        )
+
+
+def handler(event, context):
+    """
+    Event handler main loop. It handles a single or multiple SQS messages.
+    :param dict event: One or many SQS messages
+    :param dict context: Event context
+    """
+
+    logger.info(f"Function: {context.function_name}")
+    logger.info(f"Request ID: {context.aws_request_id}")
+    logger.info(f"Event: {format_event(event)}")
+
+    #
+    # Check if the event is a cloudwatch event
+    #
+    if is_scheduled_event(event):
+        # Warm up the container, and return the event so it shows as a successful transaction
+        preload()
+        import aiohttp
+        # The project updates held back by the time window are not left waiting for the next batch
+        save_project_updates(flush=True)
+        return event
+
+    if "Records" in event:
+        time_str = time.ctime()
+        records = [record for record in event["Records"] if "body" in record]
+        failed_records = []
+
+        metrics.start_batch()
+        try:
+            # Download the primary keys once, before the records run concurrently
+            get_primary_key_map()
+            records = coalesce_batch(resolve_records(records))
+            results = asyncio.run(process_records_async(records))
+
+            for record, result in zip(records, results):
+                if isinstance(result, Exception):
+                    metrics.increment("failed_events")
+                    print(f"Start Time: {time_str}", str(result))
+                    failed_records.append({"record": record, "error": str(result)})
+                elif result is not None:
+                    project_updates.add(
+                        project_id=result.get_project_id(),
+                        timestamp=result.get_event_timestamp(),
+                    )
+        finally:
+            # One updated_at bump per project for the whole batch
+            save_project_updates()
+            metrics.flush_batch()
+
+        if len(failed_records) > 0:
+            print("Done executing: ", time.ctime())
+            raise_critical_error(
+                message=f"Could not process {len(failed_records)} of {len(records)} records",
+                data=failed_records,
+                exception_type=Exception
+            )
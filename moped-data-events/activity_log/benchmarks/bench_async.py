@@ -0,0 +1,79 @@
+#
+# Compares the throughput of app.handler and async_app.handler against a local
+# stub of Hasura. Run from the activity_log folder:
+#
+#   $ python -m benchmarks.bench_async --events 200 --batch-size 10 --latency 0.05
+#
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import generate_batches
+from benchmarks.stub_hasura import StubHasuraServer
+
+
+class BenchmarkContext:
+    function_name = "benchmark"
+    aws_request_id = "benchmark"
+
+
+def run(handler, batches: list) -> float:
+    """
+    Runs every batch through a handler
+    :return: The events per second
+    :rtype: float
+    """
+    events = sum(len(batch["Records"]) for batch in batches)
+    start = time.perf_counter()
+    for batch in batches:
+        handler(batch, BenchmarkContext())
+    return events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async activity log handler throughput")
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub Hasura latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--event-file", default="tests/moped_project/dummy_event_update.json")
+    args = parser.parse_args()
+
+    with StubHasuraServer(latency=args.latency) as server:
+        # The configuration is read at import time
+        os.environ["HASURA_ENDPOINT"] = server.url
+        os.environ["ACTIVITY_LOG_CONCURRENCY"] = str(args.concurrency)
+        os.environ["ACTIVITY_LOG_RECORD_DATA_POLICY"] = "full"
+
+        import MopedEvent
+        import app
+        import async_app
+
+        # Skip S3, the primary keys are known
+        MopedEvent.PRIMARY_KEY_MAP_CACHE = ({"moped_project": "project_id"}, float("inf"))
+
+        with open(args.event_file) as fp:
+            batches = generate_batches(json.load(fp), args.events, args.batch_size)
+
+        sync_rate = run(app.handler, batches)
+        # The same events again, they must not be skipped as redeliveries
+        app.seen_event_ids.clear()
+        async_rate = run(async_app.handler, batches)
+
+    print(json.dumps({
+        "events": args.events,
+        "batch_size": args.batch_size,
+        "latency": args.latency,
+        "concurrency": args.concurrency,
+        "sync_events_per_second": round(sync_rate, 2),
+        "async_events_per_second": round(async_rate, 2),
+        "speedup": round(async_rate / sync_rate, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#
+# Benchmark of the JSON codecs (see codec.py) on the payloads of the handlers:
+# the recorded events of activity_log/tests, with a GeoJSON location column of
+# increasing size. Both codecs are measured when orjson is installed. Run from
+# the activity_log folder:
+#
+#   $ python -m benchmarks.codec --geojson-points 0 1000 10000 --number 50
+#
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import add_geojson
+
+EVENT_FILES = [
+    "tests/moped_project/dummy_event_update.json",
+    "tests/moped_project/dummy_event_insert.json",
+]
+
+
+def get_codecs() -> dict:
+    """
+    Returns the (loads, dumps) functions of every codec available
+    :return: The codec name -> (loads, dumps) tuple
+    :rtype: dict
+    """
+    import codec
+
+    codecs = {"json": (json.loads, codec.dumps_stdlib)}
+    if codec.orjson is not None:
+        codecs["orjson"] = (codec.orjson.loads, lambda value: codec.orjson.dumps(value, default=codec.default))
+    return codecs
+
+
+def measure(payload: dict, number: int) -> dict:
+    """
+    Times the parsing and serialization of a payload with every codec
+    :param payload: The Hasura payload
+    :type payload: dict
+    :param number: The number of times each operation is run
+    :type number: int
+    :return: The codec name -> the mean microseconds of loads and dumps
+    :rtype: dict
+    """
+    body = json.dumps(payload)
+    results = {}
+    for name, (loads, dumps) in get_codecs().items():
+        results[name] = {
+            "loads_us": round(timeit.timeit(lambda: loads(body), number=number) / number * 1e6, 2),
+            "dumps_us": round(timeit.timeit(lambda: dumps(payload), number=number) / number * 1e6, 2),
+        }
+    return results
+
+
+def main(args: list = None) -> dict:
+    parser = argparse.ArgumentParser(description="Benchmark of the JSON codecs on Hasura payloads")
+    parser.add_argument("--geojson-points", type=int, nargs="+", default=[0, 1000, 10000],
+                        help="Coordinates in the GeoJSON column, 0 for none")
+    parser.add_argument("--number", type=int, default=50, help="Runs of every operation")
+    parser.add_argument("--event-files", nargs="+", default=EVENT_FILES)
+    options = parser.parse_args(args)
+
+    scenarios = []
+    for event_file in options.event_files:
+        with open(event_file) as fp:
+            event = json.load(fp)
+        for geojson_points in options.geojson_points:
+            payload = add_geojson(event, geojson_points)
+            scenarios.append({
+                "event_file": event_file,
+                "geojson_points": geojson_points,
+                "payload_bytes": len(json.dumps(payload)),
+                "codecs": measure(payload, options.number),
+            })
+
+    results = {"scenarios": scenarios}
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+#
+# Offline benchmark of the activity log pipeline.
+#
+#   Recorded events (the fixtures of activity_log/tests) go through app.handler
+# against a local stub of Hasura and in-memory stand-ins of S3 and DynamoDB.
+# Every combination of batch size and payload size is a scenario; for each
+# one it reports events per second and the latency of every stage. Run from
+# the activity_log folder:
+#
+#   $ python -m benchmarks.harness --batch-sizes 1 10 --geojson-points 0 10000 --output results.json
+#   $ python -m benchmarks.harness --compare results.json
+#
+import os
+import sys
+import copy
+import json
+import time
+import uuid
+import argparse
+import datetime
+import platform
+import statistics
+from functools import wraps
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_hasura import StubHasuraServer
+from benchmarks.stub_aws import StubBoto3
+
+PRIMARY_KEY_MAP = {"moped_project": "project_id", "moped_proj_features": "feature_id"}
+
+STAGES = ["handler", "process_event", "get_diff", "get_record_data", "save"]
+
+
+class BenchmarkContext:
+    function_name = "benchmark"
+    aws_request_id = "benchmark"
+
+
+class StageTimer:
+    """
+    Collects the durations of every stage, in seconds
+    """
+
+    def __init__(self):
+        self.durations = {stage: [] for stage in STAGES}
+
+    def wrap(self, stage: str, function):
+        """
+        Returns a function that records its duration under a stage
+        :param stage: The stage name
+        :type stage: str
+        :param function: The function to be measured
+        :return: The measured function
+        """
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.durations[stage].append(time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> dict:
+        """
+        Returns the count, mean and percentiles of every stage, in milliseconds
+        :return: The summary of every stage
+        :rtype: dict
+        """
+        summary = {}
+        for stage, durations in self.durations.items():
+            if len(durations) == 0:
+                continue
+            ordered = sorted(durations)
+            summary[stage] = {
+                "count": len(ordered),
+                "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+                "p50_ms": round(get_percentile(ordered, 50) * 1000, 3),
+                "p95_ms": round(get_percentile(ordered, 95) * 1000, 3),
+                "p99_ms": round(get_percentile(ordered, 99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return summary
+
+
+def get_percentile(ordered: list, percentile: float) -> float:
+    """
+    Returns the nearest-rank percentile of sorted values
+    :param ordered: The values, sorted
+    :type ordered: list
+    :param percentile: The percentile, between 0 and 100
+    :type percentile: float
+    :return: The value at the percentile
+    :rtype: float
+    """
+    index = max(0, min(len(ordered) - 1, int(round(percentile / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def add_geojson(event: dict, points: int) -> dict:
+    """
+    Adds a large GeoJSON column (like moped_proj_features.location) to an event,
+    a single coordinate differs between the old and new states
+    :param event: The recorded Hasura event
+    :type event: dict
+    :param points: The number of coordinates in the line string, 0 leaves the event as is
+    :type points: int
+    :return: A copy of the event
+    :rtype: dict
+    """
+    event = copy.deepcopy(event)
+    if points <= 0:
+        return event
+
+    coordinates = [[-97.74 + index * 0.00001, 30.27 + index * 0.00001] for index in range(points)]
+    moved = copy.deepcopy(coordinates)
+    moved[points // 2][1] += 0.0001
+    for state, line in [("old", coordinates), ("new", moved)]:
+        if isinstance(event["event"]["data"].get(state), dict):
+            event["event"]["data"][state]["location"] = {
+                "type": "Feature",
+                "properties": {"renderType": "LineString"},
+                "geometry": {"type": "LineString", "coordinates": line},
+            }
+    return event
+
+
+def generate_batches(event: dict, events: int, batch_size: int) -> list:
+    """
+    Generates SQS batches out of a single recorded event, every record has its
+    own event id so none of them is skipped as a redelivery
+    :param event: The recorded Hasura event
+    :type event: dict
+    :param events: The total number of events
+    :type events: int
+    :param batch_size: The number of records per batch
+    :type batch_size: int
+    :return: A list of SQS events
+    :rtype: list
+    """
+    records = []
+    for index in range(events):
+        record_event = {**event, "id": str(uuid.uuid4())}
+        records.append({"messageId": str(index), "body": json.dumps(record_event)})
+    return [
+        {"Records": records[index:index + batch_size]}
+        for index in range(0, len(records), batch_size)
+    ]
+
+
+def run_scenario(event: dict, events: int, batch_size: int, geojson_points: int) -> dict:
+    """
+    Runs a scenario through app.handler, with every stage measured
+    :param event: The recorded Hasura event
+    :type event: dict
+    :param events: The total number of events
+    :type events: int
+    :param batch_size: The number of records per SQS batch
+    :type batch_size: int
+    :param geojson_points: The size of the GeoJSON column, 0 for none
+    :type geojson_points: int
+    :return: The results of the scenario
+    :rtype: dict
+    """
+    import app
+    import MopedEvent as MopedEventModule
+    from MopedEvent import MopedEvent
+
+    stub_boto3 = StubBoto3(primary_key_map=PRIMARY_KEY_MAP, environment=MopedEventModule.API_ENVIRONMENT)
+    payload = add_geojson(event, geojson_points)
+    batches = generate_batches(payload, events, batch_size)
+    timer = StageTimer()
+
+    originals = {
+        "boto3": MopedEventModule.boto3,
+        "dynamodb": MopedEventModule.DYNAMODB_CLIENT,
+        "s3": MopedEventModule.S3_CLIENT,
+        "process_event": app.process_event,
+        "get_diff": MopedEvent.get_diff,
+        "get_record_data": MopedEvent.get_record_data,
+        "save": MopedEvent.save,
+    }
+    MopedEventModule.boto3 = stub_boto3
+    MopedEventModule.DYNAMODB_CLIENT = stub_boto3.client("dynamodb")
+    MopedEventModule.S3_CLIENT = stub_boto3.client("s3")
+    # The first event of the scenario downloads the primary keys from the S3 stand-in
+    MopedEventModule.PRIMARY_KEY_MAP_CACHE = ({}, 0)
+    app.process_event = timer.wrap("process_event", app.process_event)
+    MopedEvent.get_diff = timer.wrap("get_diff", MopedEvent.get_diff)
+    MopedEvent.get_record_data = timer.wrap("get_record_data", MopedEvent.get_record_data)
+    MopedEvent.save = timer.wrap("save", MopedEvent.save)
+    handler = timer.wrap("handler", app.handler)
+
+    try:
+        start = time.perf_counter()
+        for batch in batches:
+            handler(batch, BenchmarkContext())
+        seconds = time.perf_counter() - start
+    finally:
+        MopedEventModule.boto3 = originals["boto3"]
+        MopedEventModule.DYNAMODB_CLIENT = originals["dynamodb"]
+        MopedEventModule.S3_CLIENT = originals["s3"]
+        app.process_event = originals["process_event"]
+        MopedEvent.get_diff = originals["get_diff"]
+        MopedEvent.get_record_data = originals["get_record_data"]
+        MopedEvent.save = originals["save"]
+
+    return {
+        "batch_size": batch_size,
+        "geojson_points": geojson_points,
+        "payload_bytes": len(json.dumps(payload)),
+        "events": events,
+        "seconds": round(seconds, 3),
+        "events_per_second": round(events / seconds, 2),
+        "stages": timer.summary(),
+    }
+
+
+def compare(results: dict, previous: dict) -> list:
+    """
+    Compares the throughput of the scenarios found in both runs
+    :param results: The results of this run
+    :type results: dict
+    :param previous: The results of a previous run
+    :type previous: dict
+    :return: The ratio of events per second (this run / previous run) of every scenario
+    :rtype: list
+    """
+    previous_rates = {
+        (scenario["batch_size"], scenario["geojson_points"]): scenario["events_per_second"]
+        for scenario in previous["scenarios"]
+    }
+    comparison = []
+    for scenario in results["scenarios"]:
+        key = (scenario["batch_size"], scenario["geojson_points"])
+        if key in previous_rates:
+            comparison.append({
+                "batch_size": key[0],
+                "geojson_points": key[1],
+                "events_per_second": scenario["events_per_second"],
+                "previous_events_per_second": previous_rates[key],
+                "ratio": round(scenario["events_per_second"] / previous_rates[key], 3),
+            })
+    return comparison
+
+
+def main(args: list = None) -> dict:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the activity log pipeline")
+    parser.add_argument("--events", type=int, default=200, help="Events per scenario")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--geojson-points", type=int, nargs="+", default=[0, 1000, 10000],
+                        help="Coordinates in the GeoJSON column, 0 for none")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub Hasura latency in seconds")
+    parser.add_argument("--record-data-policy", default="diff")
+    parser.add_argument("--event-file", default="tests/moped_project/dummy_event_update.json")
+    parser.add_argument("--output", default=None, help="Writes the results to a JSON file")
+    parser.add_argument("--compare", default=None, help="The JSON results of a previous run")
+    options = parser.parse_args(args)
+
+    with StubHasuraServer(latency=options.latency) as server:
+        # The configuration is read at import time
+        os.environ["HASURA_ENDPOINT"] = server.url
+        os.environ["ACTIVITY_LOG_RECORD_DATA_POLICY"] = options.record_data_policy
+
+        with open(options.event_file) as fp:
+            event = json.load(fp)
+
+        scenarios = [
+            run_scenario(event, options.events, batch_size, geojson_points)
+            for batch_size in options.batch_sizes
+            for geojson_points in options.geojson_points
+        ]
+
+    results = {
+        "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "events": options.events,
+            "latency": options.latency,
+            "record_data_policy": options.record_data_policy,
+            "event_file": options.event_file,
+        },
+        "scenarios": scenarios,
+    }
+
+    if options.compare is not None:
+        with open(options.compare) as fp:
+            results["comparison"] = compare(results, json.load(fp))
+
+    if options.output is not None:
+        with open(options.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
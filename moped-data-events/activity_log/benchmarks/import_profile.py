@@ -0,0 +1,68 @@
+#
+# Import-time profile of the Lambda handlers, what every cold start pays before
+# the first event. Run from the activity_log folder:
+#
+#   $ python -m benchmarks.import_profile app async_app --top 15
+#
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ACTIVITY_LOG_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that must only be imported on first use
+DEFERRED_MODULES = ["boto3", "botocore", "cerberus", "requests", "pytz", "dateutil", "aiohttp"]
+
+
+def get_import_profile(modules: list) -> dict:
+    """
+    Imports modules in a fresh interpreter with -X importtime
+    :param modules: The names of the modules to import, ie. ["app"]
+    :type modules: list
+    :return: The cumulative import time (in milliseconds) of every imported module, and the deferred modules loaded
+    :rtype: dict
+    """
+    script = (
+        f"import sys, json; import {', '.join(modules)}; "
+        f"print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=ACTIVITY_LOG_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative) / 1000
+
+    return {
+        "modules": {name: imports.get(name, 0.0) for name in modules},
+        "total_ms": round(sum(imports.get(name, 0.0) for name in modules), 3),
+        "deferred_modules_loaded": json.loads(result.stdout),
+        "imports": imports,
+    }
+
+
+def main(args: list = None) -> dict:
+    parser = argparse.ArgumentParser(description="Import-time profile of the activity log handlers")
+    parser.add_argument("modules", nargs="*", default=["app", "async_app"])
+    parser.add_argument("--top", type=int, default=15, help="The slowest imports to list")
+    options = parser.parse_args(args)
+
+    profile = get_import_profile(options.modules)
+    slowest = sorted(profile.pop("imports").items(), key=lambda item: item[1], reverse=True)
+    profile["slowest_ms"] = {name: round(ms, 3) for name, ms in slowest[:options.top]}
+    print(json.dumps(profile, indent=2))
+    return profile
+
+
+if __name__ == "__main__":
+    main()
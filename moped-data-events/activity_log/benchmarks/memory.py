@@ -0,0 +1,116 @@
+#
+# Memory benchmark of MopedEvent with large payloads (ie. a GeoJSON location).
+#
+#   For every payload size, it measures the memory held by the events of a
+# batch and the peak memory of serializing their mutation (full record data
+# policy), with the raw SQS body forwarded as it is and re-serialized from the
+# parsed payload. Run from the activity_log folder:
+#
+#   $ python -m benchmarks.memory --events 10 --geojson-points 1000 10000 100000
+#
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import add_geojson
+
+PRIMARY_KEY_MAP = {"moped_project": "project_id", "moped_proj_features": "feature_id"}
+
+
+def measure(bodies: list, raw: bool) -> dict:
+    """
+    Measures the events built out of SQS message bodies
+    :param bodies: The message bodies, JSON strings
+    :type bodies: list
+    :param raw: If True, the bodies are given to the events to be forwarded as they are
+    :type raw: bool
+    :return: The memory retained per event, and the peak memory of serializing a request body, in bytes
+    :rtype: dict
+    """
+    from MopedEvent import MopedEvent
+
+    tracemalloc.start()
+    try:
+        events = []
+        for body in bodies:
+            moped_event = MopedEvent(json.loads(body), load_primary_keys=False, raw=body if raw else None)
+            moped_event.MOPED_PRIMARY_KEY_MAP = PRIMARY_KEY_MAP
+            moped_event.get_event_type()
+            moped_event.get_operation_type()
+            moped_event.get_project_id()
+            moped_event.get_record_primary_key()
+            events.append(moped_event)
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # The peak is measured again for the serialization alone (tracemalloc.reset_peak needs Python 3.9)
+    moped_event = events[0]
+    variables = {"recordData": moped_event.HASURA_EVENT_PAYLOAD}
+    tracemalloc.start()
+    try:
+        body = moped_event.get_request_body(variables)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "retained_bytes_per_event": retained // len(bodies),
+        "request_body_peak_bytes": peak,
+        "request_body_bytes": len(body),
+    }
+
+
+def run_scenario(event: dict, events: int, geojson_points: int) -> dict:
+    """
+    Measures a payload size, with and without raw body forwarding
+    :param event: The recorded Hasura event
+    :type event: dict
+    :param events: The number of events held at the same time, like a batch
+    :type events: int
+    :param geojson_points: The size of the GeoJSON column, 0 for none
+    :type geojson_points: int
+    :return: The results of the scenario
+    :rtype: dict
+    """
+    import codec
+
+    payload = add_geojson(event, geojson_points)
+    # Serialized like the moped-api does
+    bodies = [codec.dumps({**payload, "id": str(index)}) for index in range(events)]
+    return {
+        "geojson_points": geojson_points,
+        "payload_bytes": len(bodies[0]),
+        "events": events,
+        "raw": measure(bodies, raw=True),
+        "reserialized": measure(bodies, raw=False),
+    }
+
+
+def main(args: list = None) -> dict:
+    parser = argparse.ArgumentParser(description="Memory benchmark of MopedEvent with large payloads")
+    parser.add_argument("--events", type=int, default=10, help="Events held at the same time")
+    parser.add_argument("--geojson-points", type=int, nargs="+", default=[0, 10000, 100000],
+                        help="Coordinates in the GeoJSON column, 0 for none")
+    parser.add_argument("--event-file", default="tests/moped_project/dummy_event_update.json")
+    options = parser.parse_args(args)
+
+    with open(options.event_file) as fp:
+        event = json.load(fp)
+
+    results = {
+        "scenarios": [
+            run_scenario(event, options.events, geojson_points)
+            for geojson_points in options.geojson_points
+        ]
+    }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
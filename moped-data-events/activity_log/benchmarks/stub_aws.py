@@ -0,0 +1,81 @@
+#
+# In-memory stand-ins for the S3 and DynamoDB clients used by MopedEvent,
+# so the pipeline can be measured without AWS.
+#
+#   stub = StubBoto3(primary_key_map={"moped_project": "project_id"})
+#   MopedEvent.boto3 = stub
+#   MopedEvent.DYNAMODB_CLIENT = stub.client("dynamodb")
+#   MopedEvent.S3_CLIENT = stub.client("s3")
+#
+import io
+import json
+import time
+
+
+class StubS3Client:
+    """
+    Keeps objects in a dictionary, keyed by (bucket, key)
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.objects = {}
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        time.sleep(self.latency)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket: str, Key: str, Body, **kwargs) -> dict:
+        time.sleep(self.latency)
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+        return {}
+
+
+class StubDynamoDBClient:
+    """
+    Answers every user lookup with the same database id
+    """
+
+    def __init__(self, database_id: int = 1, latency: float = 0.0):
+        self.database_id = database_id
+        self.latency = latency
+        self.requests = 0
+
+    def get_item_response(self, user_id: str) -> dict:
+        return {"user_id": {"S": user_id}, "database_id": {"N": str(self.database_id)}}
+
+    def get_item(self, TableName: str, Key: dict, **kwargs) -> dict:
+        self.requests += 1
+        time.sleep(self.latency)
+        return {"Item": self.get_item_response(Key["user_id"]["S"])}
+
+    def query(self, TableName: str, **kwargs) -> dict:
+        self.requests += 1
+        time.sleep(self.latency)
+        return {"Items": [self.get_item_response("user@austintexas.gov")]}
+
+
+class StubBoto3:
+    """
+    Replaces the boto3 module, boto3.Session().client(name) and boto3.client(name)
+    both return the shared stub clients
+    """
+
+    def __init__(self, primary_key_map: dict = None, bucket: str = "atd-moped-data-events",
+                 environment: str = "staging", latency: float = 0.0):
+        self.clients = {
+            "s3": StubS3Client(latency=latency),
+            "dynamodb": StubDynamoDBClient(latency=latency),
+        }
+        if primary_key_map is not None:
+            self.clients["s3"].put_object(
+                Bucket=bucket,
+                Key=f"settings/moped_primary_keys_{environment}.json",
+                Body=json.dumps(primary_key_map),
+            )
+
+    def Session(self) -> "StubBoto3":
+        return self
+
+    def client(self, name: str, **kwargs):
+        return self.clients[name]
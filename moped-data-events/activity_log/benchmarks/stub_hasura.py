@@ -0,0 +1,99 @@
+#
+# Local stub of the Hasura GraphQL endpoint, used by benchmarks and tests.
+#
+#   It accepts any POST, waits a fixed latency to emulate the network and the
+# database, and answers with a successful activity log insertion.
+#
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_HASURA_RESPONSE = {
+    "data": {
+        "insert_moped_activity_log": {
+            "affected_rows": 1
+        }
+    }
+}
+
+
+class StubHasuraServer(ThreadingHTTPServer):
+    """
+    A threaded HTTP server that records the requests it receives
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        """
+        Constructor for the stub server
+        :param latency: Seconds to wait before answering every request
+        :type latency: float
+        :param port: The port to listen on, 0 picks a free one
+        :type port: int
+        """
+        super().__init__(("127.0.0.1", port), StubHasuraRequestHandler)
+        self.latency = latency
+        self.requests = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Returns the GraphQL endpoint url of the server
+        :return: The url
+        :rtype: str
+        """
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/graphql"
+
+    def start(self) -> "StubHasuraServer":
+        """
+        Starts serving in a background thread
+        :return: The server itself
+        :rtype: StubHasuraServer
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops serving and releases the port
+        """
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "StubHasuraServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+class StubHasuraRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers every POST with STUB_HASURA_RESPONSE
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests.append(json.loads(body))
+
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+
+        response = json.dumps(STUB_HASURA_RESPONSE).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args) -> None:
+        # Keep the benchmark output clean
+        pass
@@ -0,0 +1,113 @@
+#
+# Activity Log Claim Check
+#
+#   The moped-api compresses the Hasura payloads that are too large for SQS,
+# and offloads to S3 the ones that are still too large (see moped-api
+# events/helpers.py). The message body is then an envelope instead of the
+# payload:
+#
+#   {"payload_encoding": "gzip+base64", "payload": "<base64 of the gzipped payload>"}
+#   {"payload_encoding": "s3", "bucket": "...", "key": "...", "sha256": "...", "size": 123}
+#
+# The records are resolved at the start of a batch, so the rest of the
+# pipeline only ever sees Hasura payloads.
+#
+import gzip
+import base64
+import hashlib
+
+import codec
+
+PAYLOAD_ENCODING_GZIP = "gzip+base64"
+PAYLOAD_ENCODING_S3 = "s3"
+
+
+def is_envelope(payload) -> bool:
+    """
+    Returns True if a message body is a claim check envelope
+    :param payload: The decoded message body
+    :return: True if the payload must be resolved
+    :rtype: bool
+    """
+    return isinstance(payload, dict) and "payload_encoding" in payload
+
+
+def download_payload(envelope: dict, s3_client=None) -> bytes:
+    """
+    Downloads an offloaded payload, and checks its sha256
+    :param envelope: The S3 pointer
+    :type envelope: dict
+    :param s3_client: The boto3 S3 client, default: the shared client
+    :return: The gzipped payload
+    :rtype: bytes
+    """
+    if s3_client is None:
+        from MopedEvent import get_s3_client
+        s3_client = get_s3_client()
+
+    response = s3_client.get_object(Bucket=envelope["bucket"], Key=envelope["key"])
+    return response["Body"].read()
+
+
+def resolve_payload(payload, s3_client=None):
+    """
+    Returns the Hasura payload of a message body, decompressed or downloaded if needed
+    :param payload: The decoded message body
+    :param s3_client: The boto3 S3 client, default: the shared client
+    :return: The Hasura payload, or the payload itself if it is not an envelope
+    """
+    if not is_envelope(payload):
+        return payload
+
+    encoding = payload["payload_encoding"]
+    if encoding == PAYLOAD_ENCODING_GZIP:
+        data = gzip.decompress(base64.b64decode(payload["payload"]))
+    elif encoding == PAYLOAD_ENCODING_S3:
+        data = gzip.decompress(download_payload(payload, s3_client=s3_client))
+        if hashlib.sha256(data).hexdigest() != payload["sha256"]:
+            raise ValueError(f"The payload of s3://{payload['bucket']}/{payload['key']} does not match its sha256")
+    else:
+        raise ValueError(f"Unknown payload encoding: {encoding}")
+
+    return codec.loads(data)
+
+
+def resolve_record(record: dict, s3_client=None) -> dict:
+    """
+    Returns an SQS record whose body is the Hasura payload
+    :param record: The SQS record
+    :type record: dict
+    :param s3_client: The boto3 S3 client, default: the shared client
+    :return: The record, or a copy of it with the resolved body
+    :rtype: dict
+    """
+    body = record.get("body", None)
+    # The moped-api writes the encoding first, plain payloads are not decoded here
+    if not isinstance(body, str) or not body.startswith('{"payload_encoding"'):
+        return record
+
+    payload = codec.loads(body)
+    if not is_envelope(payload):
+        return record
+
+    return {**record, "body": codec.dumps(resolve_payload(payload, s3_client=s3_client))}
+
+
+def resolve_records(records: list, s3_client=None) -> list:
+    """
+    Resolves the claim checks of a batch. A record that can't be resolved is
+    kept as it is, so it fails validation and is retried by SQS.
+    :param records: The SQS records
+    :type records: list
+    :param s3_client: The boto3 S3 client, default: the shared client
+    :return: The records, with resolved bodies
+    :rtype: list
+    """
+    resolved = []
+    for record in records:
+        try:
+            resolved.append(resolve_record(record, s3_client=s3_client))
+        except Exception as e:
+            print(f"Could not resolve the payload of message {record.get('messageId', '')}: {str(e)}")
+            resolved.append(record)
+    return resolved
@@ -0,0 +1,179 @@
+#
+# Activity Log Coalescing
+#
+#   Inline editing produces bursts of UPDATE events for the same record. Within
+# a batch, consecutive UPDATE events of the same record (table and primary key)
+# by the same user, within ACTIVITY_LOG_COALESCE_WINDOW_SECONDS of the first
+# one, are merged into a single event: the id, created_at and old state of the
+# first event, and everything else (the new state) from the last one. A change
+# to the record by someone else, or an INSERT or DELETE, ends the burst.
+#
+#   The merged row keeps the idempotency key (event id, created_at) of the
+# first event: a redelivery of the same burst, merged or not, maps to the same
+# row. Delivery stays at-least-once: if SQS redelivers a later event of the
+# burst without the first one, it is saved as its own row.
+#
+import codec
+from typing import Callable, Optional
+
+from config import ACTIVITY_LOG_COALESCE_WINDOW_SECONDS
+
+
+def get_record_key(payload: dict, primary_key_map: dict) -> Optional[tuple]:
+    """
+    Returns the key of the record an event changed
+    :param payload: The Hasura payload
+    :type payload: dict
+    :param primary_key_map: The primary key of every table
+    :type primary_key_map: dict
+    :return: A (table, primary key value) tuple, None if it can't be found
+    :rtype: tuple
+    """
+    try:
+        table = payload["table"]["name"]
+        primary_key = primary_key_map[table]
+        state = payload["event"]["data"]["new"] or payload["event"]["data"]["old"]
+        return table, state[primary_key]
+    except (TypeError, KeyError):
+        return None
+
+
+def get_user_id(payload: dict) -> Optional[str]:
+    """
+    Returns the id of the user who made the change
+    :param payload: The Hasura payload
+    :type payload: dict
+    :return: The user id
+    :rtype: str
+    """
+    try:
+        return payload["event"]["session_variables"]["x-hasura-user-id"]
+    except (TypeError, KeyError):
+        return None
+
+
+def is_update(payload: dict) -> bool:
+    """
+    Returns True for UPDATE events, the only ones that are coalesced
+    :param payload: The Hasura payload
+    :type payload: dict
+    :return: True if the event is an update
+    :rtype: bool
+    """
+    try:
+        return payload["event"]["op"] == "UPDATE"
+    except (TypeError, KeyError):
+        return False
+
+
+def get_seconds_between(start: str, end: str) -> float:
+    """
+    Returns the seconds between two ISO timestamps
+    :param start: The first timestamp
+    :type start: str
+    :param end: The last timestamp
+    :type end: str
+    :return: The number of seconds, it is negative if end is before start
+    :rtype: float
+    """
+    from dateutil import parser as date_parser
+
+    return (date_parser.isoparse(end) - date_parser.isoparse(start)).total_seconds()
+
+
+def merge_events(first: dict, last: dict) -> dict:
+    """
+    Merges two events of the same record, the state before the first and after the last
+    :param first: The first Hasura payload
+    :type first: dict
+    :param last: The last Hasura payload
+    :type last: dict
+    :return: A copy of the last payload, with the id, created_at and old state of the first one
+    :rtype: dict
+    """
+    return {
+        **last,
+        # The idempotency key of the activity log row
+        "id": first.get("id", None),
+        "created_at": first.get("created_at", None),
+        "event": {
+            **last["event"],
+            "data": {
+                **last["event"]["data"],
+                "old": first["event"]["data"]["old"],
+            },
+        },
+    }
+
+
+def coalesce_records(
+    records: list,
+    primary_key_map: dict,
+    window_seconds: float = ACTIVITY_LOG_COALESCE_WINDOW_SECONDS,
+    exclude: Callable[[dict], bool] = None,
+) -> list:
+    """
+    Merges the bursts of updates to the same record within an SQS batch. The merged
+    record takes the place of the first one of its burst, and lists the ids of all
+    its events in coalesced_event_ids. Any other record is left as it is.
+    :param records: The SQS records
+    :type records: list
+    :param primary_key_map: The primary key of every table
+    :type primary_key_map: dict
+    :param window_seconds: The maximum time between the first and last event of a burst, 0 disables it
+    :type window_seconds: float
+    :param exclude: Returns True for payloads that must not be merged (ie. redeliveries)
+    :type exclude: Callable
+    :return: The records, with one record per burst
+    :rtype: list
+    """
+    if window_seconds <= 0:
+        return records
+
+    coalesced = []
+    # (table, primary key value) -> the open burst of updates to that record
+    bursts = {}
+
+    for record in records:
+        try:
+            payload = codec.loads(record["body"])
+        except (TypeError, KeyError, ValueError):
+            coalesced.append(record)
+            continue
+
+        key = get_record_key(payload, primary_key_map)
+        if key is None:
+            coalesced.append(record)
+            continue
+
+        can_coalesce = is_update(payload) and not (exclude is not None and exclude(payload))
+        burst = bursts.get(key, None)
+
+        if can_coalesce and burst is not None and burst["user_id"] == get_user_id(payload):
+            try:
+                seconds = get_seconds_between(burst["first"]["created_at"], payload["created_at"])
+            except (TypeError, KeyError, ValueError):
+                seconds = None
+
+            if seconds is not None and 0 <= seconds <= window_seconds:
+                burst["event_ids"].append(payload.get("id", None))
+                coalesced[burst["index"]] = {
+                    **coalesced[burst["index"]],
+                    "body": codec.dumps(merge_events(burst["first"], payload)),
+                    "coalesced_event_ids": burst["event_ids"],
+                }
+                continue
+
+        # Any other change to the record ends its burst, an update starts a new one
+        if can_coalesce:
+            bursts[key] = {
+                "index": len(coalesced),
+                "first": payload,
+                "user_id": get_user_id(payload),
+                "event_ids": [payload.get("id", None)],
+            }
+        else:
+            bursts.pop(key, None)
+        coalesced.append(record)
+
+    return coalesced
@@ -0,0 +1,110 @@
+#
+# Activity Log JSON Codec
+#
+#   Every SQS message body is parsed, and every mutation serialized, on the
+# hot path of the handlers. The codec uses orjson when it is installed and
+# falls back to the standard library, both write compact JSON. Values JSON
+# has no type for (ie. the datetime objects of boto3 responses) are
+# serialized the same way by both: datetime and date as ISO 8601, Decimal as
+# a number, sets and tuples as lists. Integers over 64 bits are left to the
+# standard library when serializing (orjson raises), orjson parses them as
+# floats.
+#
+#   ACTIVITY_LOG_JSON_CODEC: auto (orjson if installed), orjson or json
+#
+import json
+import decimal
+import datetime
+
+from config import ACTIVITY_LOG_JSON_CODEC
+
+JSON_CODECS = ["auto", "orjson", "json"]
+
+
+def load_orjson():
+    """
+    Returns the orjson module if it is installed and allowed by ACTIVITY_LOG_JSON_CODEC
+    :return: The orjson module, or None to use the standard library
+    """
+    if ACTIVITY_LOG_JSON_CODEC == "json":
+        return None
+    try:
+        import orjson
+        return orjson
+    except ImportError:
+        if ACTIVITY_LOG_JSON_CODEC == "orjson":
+            raise
+        return None
+
+
+orjson = load_orjson()
+
+# The codec in use: orjson or json
+JSON_CODEC = "json" if orjson is None else "orjson"
+
+
+def default(value):
+    """
+    Serializes the values JSON has no type for
+    :param value: The value
+    :return: A value JSON can represent
+    """
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode("utf-8")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(value) -> bytes:
+    """
+    Serializes a value to compact UTF-8 JSON
+    :param value: The value
+    :return: The JSON
+    :rtype: bytes
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # ie. integers over 64 bits, the standard library handles them
+            pass
+    return dumps_stdlib(value).encode("utf-8")
+
+
+def dumps(value) -> str:
+    """
+    Serializes a value to compact JSON
+    :param value: The value
+    :return: The JSON
+    :rtype: str
+    """
+    if orjson is not None:
+        return dumps_bytes(value).decode("utf-8")
+    return dumps_stdlib(value)
+
+
+def dumps_stdlib(value) -> str:
+    """
+    Serializes a value to compact JSON with the standard library
+    :param value: The value
+    :return: The JSON
+    :rtype: str
+    """
+    return json.dumps(value, default=default, separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(data):
+    """
+    Parses JSON
+    :param data: The JSON
+    :type data: str or bytes
+    :return: The value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,10 +1,85 @@
 import os
+import json
 
 API_ENVIRONMENT = os.getenv("API_ENVIRONMENT", "STAGING").lower()
 COGNITO_DYNAMO_TABLE_NAME = os.getenv("COGNITO_DYNAMO_TABLE_NAME", "")
 HASURA_ADMIN_SECRET = os.getenv("HASURA_ADMIN_SECRET", "")
 HASURA_ENDPOINT = os.getenv("HASURA_ENDPOINT", "")
 
+# How long a resolved user database id is reused by a warm container
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "300"))
+
+# How long the primary key settings downloaded from S3 are reused by a warm container
+PRIMARY_KEYS_CACHE_TTL_SECONDS = int(os.getenv("PRIMARY_KEYS_CACHE_TTL_SECONDS", "300"))
+
+# How many Hasura event ids a warm container remembers to skip SQS redeliveries
+SEEN_EVENT_IDS_MAX_SIZE = int(os.getenv("SEEN_EVENT_IDS_MAX_SIZE", "10000"))
+
+# How many records of a batch are written to Hasura at the same time by async_app.handler
+ACTIVITY_LOG_CONCURRENCY = int(os.getenv("ACTIVITY_LOG_CONCURRENCY", "5"))
+
+# Past this many nested changes in a jsonb column, the diff reports the whole column
+DIFF_MAX_NESTED_CHANGES = int(os.getenv("DIFF_MAX_NESTED_CHANGES", "50"))
+
+#
+# What gets stored in moped_activity_log.record_data: full, new, diff or snapshot
+#   The editor reads the whole old and new states, only "full" is safe for it yet
+#   ACTIVITY_LOG_RECORD_DATA_EXCLUDED_COLUMNS: ie. {"moped_proj_features": ["location"]}
+#
+ACTIVITY_LOG_RECORD_DATA_POLICY = os.getenv("ACTIVITY_LOG_RECORD_DATA_POLICY", "full").lower()
+ACTIVITY_LOG_RECORD_DATA_EXCLUDED_COLUMNS = json.loads(
+    os.getenv("ACTIVITY_LOG_RECORD_DATA_EXCLUDED_COLUMNS", "{}")
+)
+
+#
+# UPDATE events that only change these columns (or nothing at all) are skipped
+#   ACTIVITY_LOG_IGNORED_COLUMNS: table name -> columns, "*" applies to every table
+#
+ACTIVITY_LOG_IGNORED_COLUMNS = json.loads(
+    os.getenv("ACTIVITY_LOG_IGNORED_COLUMNS", '{"*": ["updated_at", "date_added"]}')
+)
+
+# Consecutive updates to a record by the same user within this many seconds become one row, 0: never
+ACTIVITY_LOG_COALESCE_WINDOW_SECONDS = float(os.getenv("ACTIVITY_LOG_COALESCE_WINDOW_SECONDS", "0"))
+
+# Minimum seconds between two moped_project.updated_at bumps of the same project, 0: once per batch.
+# Best effort: the bumps held back are sent by a later batch or Scheduled Event of the same container.
+PROJECT_UPDATE_WINDOW_SECONDS = int(os.getenv("PROJECT_UPDATE_WINDOW_SECONDS", "0"))
+
+#
+# Per-batch timing metrics
+#   ACTIVITY_LOG_METRICS_FORMAT: emf (CloudWatch Embedded Metric Format), log or off
+#   ACTIVITY_LOG_METRICS_SAMPLE_RATE: The fraction of events whose stages are timed, between 0 and 1
+#
+ACTIVITY_LOG_METRICS_FORMAT = os.getenv("ACTIVITY_LOG_METRICS_FORMAT", "emf").lower()
+ACTIVITY_LOG_METRICS_NAMESPACE = os.getenv("ACTIVITY_LOG_METRICS_NAMESPACE", "Moped/ActivityLog")
+ACTIVITY_LOG_METRICS_SAMPLE_RATE = float(os.getenv("ACTIVITY_LOG_METRICS_SAMPLE_RATE", "1.0"))
+
+#
+# Event logging, the envelope of every SQS batch is always logged
+#   ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE: The fraction of batches whose message bodies are logged, between 0 and 1
+#   ACTIVITY_LOG_LOG_MAX_BYTES: The maximum size of a logged value, longer ones are truncated
+#   ACTIVITY_LOG_LOG_REDACTED_KEYS: Values of keys containing any of these (case-insensitive) are never logged
+#
+ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE = float(os.getenv("ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE", "0"))
+ACTIVITY_LOG_LOG_MAX_BYTES = int(os.getenv("ACTIVITY_LOG_LOG_MAX_BYTES", "4096"))
+ACTIVITY_LOG_LOG_REDACTED_KEYS = json.loads(
+    os.getenv("ACTIVITY_LOG_LOG_REDACTED_KEYS", '["secret", "password", "token", "authorization", "cookie"]')
+)
+
+#
+# Tracing (see tracing.py)
+#   ACTIVITY_LOG_TRACING_EXPORTER: off, log (a JSON line per span) or file (JSON Lines in ACTIVITY_LOG_TRACING_FILE)
+#
+ACTIVITY_LOG_TRACING_EXPORTER = os.getenv("ACTIVITY_LOG_TRACING_EXPORTER", "off").lower()
+ACTIVITY_LOG_TRACING_FILE = os.getenv("ACTIVITY_LOG_TRACING_FILE", "/tmp/activity_log_spans.jsonl")
+ACTIVITY_LOG_TRACING_SERVICE_NAME = os.getenv("ACTIVITY_LOG_TRACING_SERVICE_NAME", "moped-activity-log")
+
+# The JSON codec of the handlers (see codec.py): auto (orjson if installed), orjson or json
+ACTIVITY_LOG_JSON_CODEC = os.getenv("ACTIVITY_LOG_JSON_CODEC", "auto").lower()
+
+ACTIVITY_LOG_BUCKET = os.getenv("ACTIVITY_LOG_BUCKET", "atd-moped-data-events")
+
 # Prep Hasura query
 HASURA_HTTP_HEADERS = {
     "Accept": "*/*",
@@ -0,0 +1,181 @@
+#
+# Activity Log Diff Engine
+#
+# Compares the old and new state of a Hasura event in a single pass,
+# descending into jsonb columns (ie. moped_proj_features.location) so that
+# the values that changed inside a large document are listed with their path.
+#
+from typing import Any
+
+from config import DIFF_MAX_NESTED_CHANGES
+
+# Used to tell apart a missing key from a key with a null value
+MISSING = object()
+
+
+def escape_pointer_token(token: Any) -> str:
+    """
+    Escapes a single JSON-pointer reference token (RFC 6901)
+    :param token: The key or list index
+    :type token: Any
+    :return: The escaped token
+    :rtype: str
+    """
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def is_same_value(old: Any, new: Any) -> bool:
+    """
+    Type-aware equality: booleans never equal numbers (True != 1),
+    but integers and floats compare numerically (1 == 1.0).
+    :param old: The old value
+    :type old: Any
+    :param new: The new value
+    :type new: Any
+    :return: True if both values are the same
+    :rtype: bool
+    """
+    if isinstance(old, bool) or isinstance(new, bool):
+        return type(old) is type(new) and old == new
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        return old == new
+    if type(old) is not type(new):
+        return False
+    return old == new
+
+
+def diff_values(old: Any, new: Any, path: str, changes: list) -> None:
+    """
+    Appends to changes every difference between old and new, descending
+    into dictionaries and equally-sized lists. Anything else that differs
+    (scalars, type changes, lists that grew or shrank) is reported whole
+    at its path.
+    :param old: The old value, or MISSING if the key was added
+    :type old: Any
+    :param new: The new value, or MISSING if the key was removed
+    :type new: Any
+    :param path: The JSON pointer of the value being compared
+    :type path: str
+    :param changes: The list that accumulates (path, old, new) tuples
+    :type changes: list
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, new_value in new.items():
+            diff_values(
+                old.get(key, MISSING), new_value, f"{path}/{escape_pointer_token(key)}", changes
+            )
+        for key, old_value in old.items():
+            if key not in new:
+                diff_values(old_value, MISSING, f"{path}/{escape_pointer_token(key)}", changes)
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for index, (old_value, new_value) in enumerate(zip(old, new)):
+            diff_values(old_value, new_value, f"{path}/{index}", changes)
+    elif old is MISSING or new is MISSING or not is_same_value(old, new):
+        changes.append((path, old, new))
+
+
+def diff_column(field: str, old: Any, new: Any) -> list:
+    """
+    Generates the description entry for a single column: one entry per column.
+    A jsonb column lists the values that changed inside it under "changes",
+    each with its JSON pointer path, instead of its whole old and new values.
+    Scalar columns, and jsonb columns with too many changes, keep the whole
+    old and new values.
+    :param field: The column name
+    :type field: str
+    :param old: The old value, or MISSING if the column was added
+    :type old: Any
+    :param new: The new value, or MISSING if the column was removed
+    :type new: Any
+    :return: A list with the entry of the column, empty if it did not change
+    :rtype: list
+    """
+    entry = {
+        "field": field,
+        "old": None if old is MISSING else old,
+        "new": None if new is MISSING else new,
+    }
+
+    is_structured = isinstance(old, (dict, list)) and isinstance(new, (dict, list))
+
+    if not is_structured:
+        if old is not MISSING and new is not MISSING and is_same_value(old, new):
+            return []
+        return [entry]
+
+    changes = []
+    diff_values(old, new, f"/{escape_pointer_token(field)}", changes)
+    if not changes:
+        return []
+
+    # Too many scattered changes are better described by the whole column alone
+    if len(changes) > DIFF_MAX_NESTED_CHANGES:
+        return [entry]
+
+    return [
+        {
+            "field": field,
+            "changes": [
+                {
+                    "path": path,
+                    "old": None if old_value is MISSING else old_value,
+                    "new": None if new_value is MISSING else new_value,
+                }
+                for path, old_value, new_value in changes
+            ],
+        }
+    ]
+
+
+def diff_states(old_state: dict, new_state: dict, ignored_columns: list = None) -> list:
+    """
+    Generates a list of changes between the old and new state of a record
+    :param old_state: The old state of the record
+    :type old_state: dict
+    :param new_state: The new state of the record
+    :type new_state: dict
+    :param ignored_columns: Columns to leave out of the comparison
+    :type ignored_columns: list
+    :return: The list of changes
+    :rtype: list
+    """
+    if not old_state or not new_state:
+        return []
+
+    ignored_columns = ignored_columns or []
+    change_list = []
+
+    for field, new_value in new_state.items():
+        if field not in ignored_columns:
+            change_list.extend(diff_column(field, old_state.get(field, MISSING), new_value))
+
+    for field, old_value in old_state.items():
+        if field not in new_state and field not in ignored_columns:
+            change_list.extend(diff_column(field, old_value, MISSING))
+
+    return change_list
+
+
+def has_changes(old_state: dict, new_state: dict, ignored_columns: list = None) -> bool:
+    """
+    Returns True if any column other than the ignored ones changed, it stops at
+    the first change. Missing states can't be compared, they count as a change.
+    :param old_state: The old state of the record
+    :type old_state: dict
+    :param new_state: The new state of the record
+    :type new_state: dict
+    :param ignored_columns: Columns to leave out of the comparison
+    :type ignored_columns: list
+    :return: True if the record changed
+    :rtype: bool
+    """
+    if not isinstance(old_state, dict) or not isinstance(new_state, dict):
+        return True
+
+    ignored_columns = ignored_columns or []
+
+    for field, new_value in new_state.items():
+        if field not in ignored_columns and diff_column(field, old_state.get(field, MISSING), new_value):
+            return True
+
+    return any(field not in new_state and field not in ignored_columns for field in old_state)
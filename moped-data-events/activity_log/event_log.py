@@ -0,0 +1,172 @@
+#
+# Activity Log Event Logging
+#
+#   The SQS batches can carry large payloads (ie. GeoJSON columns), logging
+# them whole on every invocation costs CPU time and CloudWatch spend. The
+# envelope of a batch (message ids, receive counts, body sizes) is always
+# logged, the message bodies only for a sampled fraction of the batches
+# (ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE) and with errors. Every logged value is
+# redacted (ACTIVITY_LOG_LOG_REDACTED_KEYS) and capped to
+# ACTIVITY_LOG_LOG_MAX_BYTES, the encoding stops as soon as the cap is reached.
+# A body larger than the cap is not decoded nor redacted at all: it could not
+# be logged whole, and its raw text cannot be cut without leaking what the
+# redaction would hide, so only its size is logged.
+#
+import json
+import random
+
+from config import (
+    ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE,
+    ACTIVITY_LOG_LOG_MAX_BYTES,
+    ACTIVITY_LOG_LOG_REDACTED_KEYS,
+)
+
+REDACTED = "[REDACTED]"
+OMITTED_BODY = "[{} bytes, not logged]"
+
+
+def is_redacted_key(key, redacted_keys: list = ACTIVITY_LOG_LOG_REDACTED_KEYS) -> bool:
+    """
+    Returns True if the value of a key must not be logged
+    :param key: The key of a dictionary
+    :param redacted_keys: The (case-insensitive) parts of the redacted keys
+    :type redacted_keys: list
+    :return: True if the key contains any of the redacted keys
+    :rtype: bool
+    """
+    key = str(key).lower()
+    return any(redacted_key in key for redacted_key in redacted_keys)
+
+
+def redact(value, redacted_keys: list = ACTIVITY_LOG_LOG_REDACTED_KEYS):
+    """
+    Returns a copy of a value without the values of its redacted keys, at any depth
+    :param value: Any JSON value
+    :param redacted_keys: The (case-insensitive) parts of the redacted keys
+    :type redacted_keys: list
+    :return: The redacted copy
+    """
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if is_redacted_key(key, redacted_keys) else redact(item, redacted_keys)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, redacted_keys) for item in value]
+    return value
+
+
+def dumps_capped(value, max_bytes: int = ACTIVITY_LOG_LOG_MAX_BYTES) -> str:
+    """
+    Serializes a value to JSON, up to max_bytes. Only the logged part of the
+    value is encoded, however large the value is.
+    :param value: Any JSON value
+    :param max_bytes: The maximum length of the result, before the truncation marker
+    :type max_bytes: int
+    :return: The JSON string, ending with "...[truncated]" if it was cut
+    :rtype: str
+    """
+    parts = []
+    size = 0
+    for chunk in json.JSONEncoder(default=str).iterencode(value):
+        parts.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            return "".join(parts)[:max_bytes] + "...[truncated]"
+    return "".join(parts)
+
+
+def get_loggable(value, max_bytes: int = ACTIVITY_LOG_LOG_MAX_BYTES):
+    """
+    Returns a redacted value that is safe to log. SQS record bodies are
+    decoded so their content is redacted too, bodies larger than max_bytes
+    are replaced by their size. A value that does not fit in max_bytes is
+    replaced by its truncated JSON string.
+    :param value: Any JSON value, an SQS record, or a list of them
+    :param max_bytes: The maximum size of the logged value
+    :type max_bytes: int
+    :return: The redacted value, or its truncated JSON string
+    """
+    value = redact(decode_bodies(value, max_bytes=max_bytes))
+    encoded = dumps_capped(value, max_bytes=max_bytes)
+    return value if len(encoded) <= max_bytes else encoded
+
+
+def decode_bodies(value, max_bytes: int = ACTIVITY_LOG_LOG_MAX_BYTES):
+    """
+    Decodes the JSON string bodies of SQS records, at any depth
+    :param value: Any JSON value
+    :param max_bytes: The size above which a body is replaced by its size, undecoded
+    :type max_bytes: int
+    :return: A copy of the value, with decoded bodies
+    """
+    if isinstance(value, dict):
+        decoded = {key: decode_bodies(item, max_bytes) for key, item in value.items()}
+        if isinstance(decoded.get("body", None), str):
+            if len(decoded["body"]) > max_bytes:
+                decoded["body"] = OMITTED_BODY.format(len(decoded["body"]))
+                return decoded
+            try:
+                decoded["body"] = json.loads(decoded["body"])
+            except ValueError:
+                pass
+        return decoded
+    if isinstance(value, list):
+        return [decode_bodies(item, max_bytes) for item in value]
+    return value
+
+
+def should_log_bodies(sample_rate: float = ACTIVITY_LOG_LOG_BODY_SAMPLE_RATE) -> bool:
+    """
+    Decides if the message bodies of a batch are logged
+    :param sample_rate: The fraction of batches whose bodies are logged
+    :type sample_rate: float
+    :return: True if the bodies are logged
+    :rtype: bool
+    """
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def get_envelope(event: dict) -> dict:
+    """
+    Returns the metadata of a Lambda event, without any message body
+    :param event: An SQS batch, or a Scheduled Event
+    :type event: dict
+    :return: The number of records, and the id, receive count and body size of every record
+    :rtype: dict
+    """
+    if "Records" not in event:
+        return {key: event.get(key, None) for key in ["source", "detail-type", "time"]}
+
+    records = [
+        {
+            "messageId": record.get("messageId", None),
+            "receiveCount": record.get("attributes", {}).get("ApproximateReceiveCount", None),
+            "bytes": len(record.get("body", "") or ""),
+        }
+        for record in event["Records"]
+    ]
+    return {
+        "records": len(records),
+        "bytes": sum(record["bytes"] for record in records),
+        "messages": records,
+    }
+
+
+def format_event(event: dict, with_bodies: bool = None) -> str:
+    """
+    Returns the log line of a Lambda event: its envelope, and its redacted
+    records (capped) if the bodies are logged
+    :param event: The Lambda event
+    :type event: dict
+    :param with_bodies: True to log the bodies, default: sampled
+    :type with_bodies: bool
+    :return: A JSON string
+    :rtype: str
+    """
+    document = get_envelope(event)
+    if with_bodies is None:
+        with_bodies = should_log_bodies()
+    if with_bodies:
+        document["Records"] = get_loggable(event.get("Records", []))
+    return json.dumps(document)
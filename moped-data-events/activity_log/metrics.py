@@ -0,0 +1,213 @@
+#
+# Activity Log Metrics
+#
+#   Timing spans around every stage of the pipeline, aggregated per SQS batch
+# and emitted once per batch as a single log line, either in CloudWatch
+# Embedded Metric Format (emf) or as plain structured JSON (log).
+#
+#   metrics.start_batch()
+#   metrics.sample_event()
+#   with metrics.span("diff"):
+#       ...
+#   metrics.increment("skipped_events")
+#   metrics.flush_batch()
+#
+# Spans are only recorded for a sampled fraction of the events
+# (ACTIVITY_LOG_METRICS_SAMPLE_RATE), counters are always recorded.
+# The sampling decision is held in a context variable, so the concurrent
+# records of async_app are sampled independently.
+#
+import json
+import time
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import (
+    API_ENVIRONMENT,
+    ACTIVITY_LOG_METRICS_FORMAT,
+    ACTIVITY_LOG_METRICS_NAMESPACE,
+    ACTIVITY_LOG_METRICS_SAMPLE_RATE,
+)
+
+METRICS_FORMATS = ["emf", "log", "off"]
+
+# The metrics of the batch being handled, None outside of a batch
+CURRENT_BATCH = None
+
+# True if the spans of the current event are recorded
+EVENT_SAMPLED = ContextVar("EVENT_SAMPLED", default=False)
+
+
+class BatchMetrics:
+    """
+    The span durations (in seconds) and counters of a single batch
+    """
+
+    def __init__(self, sample_rate: float = ACTIVITY_LOG_METRICS_SAMPLE_RATE):
+        """
+        Constructor for the batch metrics
+        :param sample_rate: The fraction of events whose spans are recorded, between 0 and 1
+        :type sample_rate: float
+        """
+        self.sample_rate = sample_rate
+        self.durations = {}
+        self.counters = {}
+
+    def add_duration(self, stage: str, seconds: float) -> None:
+        """
+        Records the duration of a stage
+        :param stage: The stage name
+        :type stage: str
+        :param seconds: The duration
+        :type seconds: float
+        """
+        self.durations.setdefault(stage, []).append(seconds)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """
+        Adds to a counter
+        :param name: The counter name
+        :type name: str
+        :param value: The amount to add
+        :type value: int
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def get_summary(self) -> dict:
+        """
+        Returns the counters, and the count and percentiles (in milliseconds) of every stage
+        :return: A dictionary of metric name to value
+        :rtype: dict
+        """
+        summary = dict(self.counters)
+        for stage, durations in self.durations.items():
+            ordered = sorted(durations)
+            summary[f"{stage}_count"] = len(ordered)
+            for percentile in [50, 95, 99]:
+                summary[f"{stage}_p{percentile}"] = round(get_percentile(ordered, percentile) * 1000, 3)
+            summary[f"{stage}_max"] = round(ordered[-1] * 1000, 3)
+        return summary
+
+
+def get_percentile(ordered: list, percentile: float) -> float:
+    """
+    Returns the nearest-rank percentile of sorted values
+    :param ordered: The values, sorted
+    :type ordered: list
+    :param percentile: The percentile, between 0 and 100
+    :type percentile: float
+    :return: The value at the percentile
+    :rtype: float
+    """
+    index = max(0, min(len(ordered) - 1, int(round(percentile / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def start_batch(sample_rate: float = ACTIVITY_LOG_METRICS_SAMPLE_RATE) -> BatchMetrics:
+    """
+    Starts collecting the metrics of a new batch
+    :param sample_rate: The fraction of events whose spans are recorded
+    :type sample_rate: float
+    :return: The metrics of the batch
+    :rtype: BatchMetrics
+    """
+    global CURRENT_BATCH
+    CURRENT_BATCH = BatchMetrics(sample_rate=sample_rate) if ACTIVITY_LOG_METRICS_FORMAT != "off" else None
+    return CURRENT_BATCH
+
+
+def sample_event() -> bool:
+    """
+    Decides if the spans of the event about to be processed are recorded
+    :return: True if the event is sampled
+    :rtype: bool
+    """
+    sampled = CURRENT_BATCH is not None and random.random() < CURRENT_BATCH.sample_rate
+    EVENT_SAMPLED.set(sampled)
+    return sampled
+
+
+@contextmanager
+def span(stage: str, always: bool = False):
+    """
+    Measures the duration of a stage, if the current event is sampled
+    :param stage: The stage name (ie. diff, hasura_request)
+    :type stage: str
+    :param always: Records the span even if the event is not sampled, for once-per-batch stages
+    :type always: bool
+    """
+    batch = CURRENT_BATCH
+    if batch is None or not (always or EVENT_SAMPLED.get()):
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        batch.add_duration(stage, time.perf_counter() - start)
+
+
+def increment(name: str, value: int = 1) -> None:
+    """
+    Adds to a counter of the current batch
+    :param name: The counter name (ie. skipped_events)
+    :type name: str
+    :param value: The amount to add
+    :type value: int
+    """
+    if CURRENT_BATCH is not None:
+        CURRENT_BATCH.increment(name, value)
+
+
+def get_emf_document(summary: dict, timestamp: float = None) -> dict:
+    """
+    Builds a CloudWatch Embedded Metric Format document
+    :param summary: A dictionary of metric name to value
+    :type summary: dict
+    :param timestamp: The epoch time in seconds, default: now
+    :type timestamp: float
+    :return: The EMF document
+    :rtype: dict
+    """
+    return {
+        "_aws": {
+            "Timestamp": int((timestamp or time.time()) * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": ACTIVITY_LOG_METRICS_NAMESPACE,
+                    "Dimensions": [["Environment"]],
+                    "Metrics": [
+                        {
+                            "Name": name,
+                            "Unit": "Milliseconds" if name.endswith(("_p50", "_p95", "_p99", "_max")) else "Count",
+                        }
+                        for name in summary
+                    ],
+                }
+            ],
+        },
+        "Environment": API_ENVIRONMENT,
+        **summary,
+    }
+
+
+def flush_batch() -> dict:
+    """
+    Emits the metrics of the current batch as a single log line, and ends the batch
+    :return: The emitted document, or an empty dictionary if there was nothing to emit
+    :rtype: dict
+    """
+    global CURRENT_BATCH
+    batch, CURRENT_BATCH = CURRENT_BATCH, None
+    if batch is None:
+        return {}
+
+    summary = batch.get_summary()
+    if len(summary) == 0:
+        return {}
+
+    document = get_emf_document(summary) if ACTIVITY_LOG_METRICS_FORMAT == "emf" else {"metrics": summary}
+    print(json.dumps(document))
+    return document
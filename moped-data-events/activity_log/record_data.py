@@ -0,0 +1,174 @@
+#
+# Activity Log Record Data
+#
+# Builds the value stored in moped_activity_log.record_data. Every policy keeps
+# the shape of the Hasura payload ({"event": {"data": {"old": ..., "new": ...}}})
+# so that the editor can keep reading record_data.event.data.new:
+#
+#   full:     The whole payload, as provided by Hasura
+#   new:      Only the new state, the old state is dropped
+#   diff:     The whole new state, plus only the old values that changed
+#             (removed columns included), and the names of the columns the
+#             new state added. This is lossless, the old state is
+#             `(new || old) - added_columns` in postgres, see get_old_state.
+#   snapshot: Same as diff, but the new state is stored once in S3 by its
+#             sha256 and record_data only keeps a reference to it.
+#
+import json
+import hashlib
+from typing import Callable, Optional
+
+from diff import is_same_value
+
+RECORD_DATA_POLICIES = ["full", "new", "diff", "snapshot"]
+
+
+def strip_columns(state: Optional[dict], columns: list) -> Optional[dict]:
+    """
+    Returns a copy of a record state without the given columns
+    :param state: The old or new state of a record
+    :type state: dict
+    :param columns: The list of column names to remove
+    :type columns: list
+    :return: The state without the columns
+    :rtype: dict
+    """
+    if not isinstance(state, dict):
+        return state
+    return {key: value for key, value in state.items() if key not in columns}
+
+
+def get_changed_old_state(old_state: Optional[dict], new_state: Optional[dict]) -> Optional[dict]:
+    """
+    Returns only the old values that are not the same in the new state
+    :param old_state: The old state of the record
+    :type old_state: dict
+    :param new_state: The new state of the record
+    :type new_state: dict
+    :return: The old values that changed
+    :rtype: dict
+    """
+    if not isinstance(old_state, dict) or not isinstance(new_state, dict):
+        return old_state
+    return {
+        key: value
+        for key, value in old_state.items()
+        if key not in new_state or not is_same_value(value, new_state[key])
+    }
+
+
+def get_added_columns(old_state: Optional[dict], new_state: Optional[dict]) -> list:
+    """
+    Returns the columns of the new state that the old state does not have
+    :param old_state: The old state of the record
+    :type old_state: dict
+    :param new_state: The new state of the record
+    :type new_state: dict
+    :return: The column names
+    :rtype: list
+    """
+    if not isinstance(old_state, dict) or not isinstance(new_state, dict):
+        return []
+    return [key for key in new_state if key not in old_state]
+
+
+def get_old_state(record_data: dict, new_state: dict = None) -> Optional[dict]:
+    """
+    Rebuilds the whole old state of the record data of any policy but new
+    :param record_data: The record data, as built by build_record_data
+    :type record_data: dict
+    :param new_state: The new state, if it is not in the record data (ie. a snapshot)
+    :type new_state: dict
+    :return: The old state
+    :rtype: dict
+    """
+    data = record_data.get("event", {}).get("data", {})
+    old_state = data.get("old")
+    new_state = data.get("new") if new_state is None else new_state
+    if record_data.get("record_data_policy") not in ["diff", "snapshot"] or not isinstance(old_state, dict):
+        return old_state
+
+    added_columns = record_data.get("added_columns", [])
+    return {
+        key: value
+        for key, value in {**(new_state or {}), **old_state}.items()
+        if key not in added_columns
+    }
+
+
+def get_snapshot_digest(state: dict) -> (str, bytes):
+    """
+    Serializes a state in canonical form and calculates its content address
+    :param state: The record state
+    :type state: dict
+    :return: A tuple with the sha256 hex digest and the serialized state
+    :rtype: tuple
+    """
+    body = json.dumps(state, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(body).hexdigest(), body
+
+
+def build_record_data(
+    payload: dict,
+    policy: str = "full",
+    excluded_columns: list = None,
+    save_snapshot: Callable[[str, bytes], dict] = None,
+) -> dict:
+    """
+    Builds the record_data value for the activity log according to a policy
+    :param payload: The Hasura event payload
+    :type payload: dict
+    :param policy: One of RECORD_DATA_POLICIES
+    :type policy: str
+    :param excluded_columns: Columns to remove from the old and new states
+    :type excluded_columns: list
+    :param save_snapshot: Persists a serialized state given its digest, returns its reference
+    :type save_snapshot: Callable
+    :return: The record data
+    :rtype: dict
+    """
+    if policy not in RECORD_DATA_POLICIES:
+        raise ValueError(f"Invalid record data policy: {policy}")
+
+    excluded_columns = excluded_columns or []
+
+    if policy == "full" and len(excluded_columns) == 0:
+        return payload
+
+    event = payload.get("event", {})
+    data = event.get("data", {})
+    old_state = strip_columns(data.get("old"), excluded_columns)
+    new_state = strip_columns(data.get("new"), excluded_columns)
+    snapshot = None
+    added_columns = []
+
+    if policy == "new":
+        old_state = None
+    elif policy in ["diff", "snapshot"]:
+        added_columns = get_added_columns(old_state, new_state)
+        old_state = get_changed_old_state(old_state, new_state)
+
+    if policy == "snapshot" and isinstance(new_state, dict) and save_snapshot is not None:
+        digest, body = get_snapshot_digest(new_state)
+        snapshot = save_snapshot(digest, body)
+        new_state = None
+
+    record_data = {
+        **payload,
+        "event": {
+            **event,
+            "data": {"old": old_state, "new": new_state},
+        },
+        "record_data_policy": policy,
+    }
+
+    if len(excluded_columns) > 0:
+        record_data["excluded_columns"] = excluded_columns
+
+    if len(added_columns) > 0:
+        record_data["added_columns"] = added_columns
+
+    if snapshot is not None:
+        record_data["snapshot"] = snapshot
+
+    return record_data
@@ -0,0 +1,437 @@
+#
+# Activity Log Replay
+#
+#   Runs recorded Hasura events through MopedEvent, outside of Lambda, to
+# backfill the activity log after an outage. Events are read from JSON Lines
+# files (one Hasura payload or SQS message per line) or from DLQ exports
+# (the output of `aws sqs receive-message`), built across a process pool and
+# written to Hasura in batches. Inserts are idempotent on the event id, so a
+# replay can safely overlap events that were already saved.
+#
+#   python replay.py events.jsonl dlq.json --checkpoint replay.checkpoint
+#   python replay.py events.jsonl --dry-run
+#
+import os
+import sys
+import json
+import time
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+
+import MopedEvent as MopedEventModule
+from claim_check import resolve_payload
+from app import validate_hasura_event, get_event_type, is_significant_event
+from MopedEvent import MopedEvent, get_primary_key_map
+from MopedProjectUpdates import MopedProjectUpdates
+
+# The primary keys used by the worker processes, set by init_worker
+WORKER_PRIMARY_KEY_MAP = {}
+
+# A recorded item that could not be read (ie. a truncated line), it is reported as an error row
+UnreadablePayload = namedtuple("UnreadablePayload", ["source", "error"])
+
+
+def get_payload(item) -> dict:
+    """
+    Returns the Hasura payload out of a recorded item, claim checks are resolved
+    :param item: A Hasura payload, an SQS record ("body") or a DLQ message ("Body")
+    :type item: dict
+    :return: The Hasura payload
+    :rtype: dict
+    """
+    if isinstance(item, dict):
+        for key in ["body", "Body"]:
+            if isinstance(item.get(key, None), str):
+                return resolve_payload(json.loads(item[key]))
+    return resolve_payload(item)
+
+
+def read_payload(read, source: str):
+    """
+    Reads a recorded item, without stopping the replay if it can't be read
+    :param read: Returns the Hasura payload
+    :type read: Callable
+    :param source: Where the item is, ie. events.jsonl:12
+    :type source: str
+    :return: The payload, or an UnreadablePayload
+    :rtype: dict
+    """
+    try:
+        return read()
+    except Exception as e:
+        return UnreadablePayload(source=source, error=f"Could not read {source}: {str(e)}")
+
+
+def read_payloads(path: str) -> Iterator[dict]:
+    """
+    Streams the Hasura payloads of a file. A .json file is read as a DLQ
+    export ({"Messages": [...]}), or a list of payloads; any other file is
+    read as JSON Lines. Items that can't be read are streamed as UnreadablePayload.
+    :param path: The path to the file
+    :type path: str
+    :return: The payloads, in file order
+    :rtype: Iterator[dict]
+    """
+    with open(path) as file:
+        if path.endswith(".json"):
+            document = json.load(file)
+            if isinstance(document, dict):
+                document = document.get("Messages", [document])
+            for index, item in enumerate(document):
+                yield read_payload(lambda: get_payload(item), f"{path}[{index}]")
+            return
+
+        for number, line in enumerate(file, start=1):
+            if line.strip() != "":
+                yield read_payload(lambda: get_payload(json.loads(line)), f"{path}:{number}")
+
+
+def read_all_payloads(paths: list) -> Iterator[dict]:
+    """
+    Streams the payloads of every file, in order
+    :param paths: The paths to the files
+    :type paths: list
+    :return: The payloads
+    :rtype: Iterator[dict]
+    """
+    for path in paths:
+        yield from read_payloads(path)
+
+
+def read_batches(payloads: Iterator[dict], batch_size: int) -> Iterator[list]:
+    """
+    Groups the payloads in lists of batch_size
+    :param payloads: The payloads
+    :type payloads: Iterator[dict]
+    :param batch_size: The size of a batch
+    :type batch_size: int
+    :return: The batches
+    :rtype: Iterator[list]
+    """
+    batch = []
+    for payload in payloads:
+        batch.append(payload)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def init_worker(primary_key_map: dict) -> None:
+    """
+    Initializes a worker process with the primary keys loaded once by the parent
+    :param primary_key_map: The primary key of every table
+    :type primary_key_map: dict
+    """
+    global WORKER_PRIMARY_KEY_MAP
+    WORKER_PRIMARY_KEY_MAP = primary_key_map
+    MopedEventModule.PRIMARY_KEY_MAP_CACHE = (primary_key_map, float("inf"))
+
+
+def build_result(payload: dict, dry_run: bool = False) -> dict:
+    """
+    Validates a payload and builds its activity log row
+    :param payload: The Hasura payload, or an UnreadablePayload
+    :type payload: dict
+    :param dry_run: Only builds the columns printed by a dry run, nothing is stored (ie. snapshots)
+    :type dry_run: bool
+    :return: The event id, and either the insert object, the error, or skipped for insignificant events
+    :rtype: dict
+    """
+    if isinstance(payload, UnreadablePayload):
+        return {"event_id": None, "error": payload.error}
+
+    event_id = payload.get("id", None) if isinstance(payload, dict) else None
+    try:
+        valid, errors = validate_hasura_event(payload)
+        if not valid:
+            raise ValueError(f"Invalid event format: {json.dumps(errors)}")
+        if get_event_type(payload) == "":
+            raise ValueError("Event type not specified")
+        if not is_significant_event(payload):
+            return {"event_id": event_id, "skipped": True}
+
+        moped_event = MopedEvent(payload, load_primary_keys=False)
+        moped_event.MOPED_PRIMARY_KEY_MAP = WORKER_PRIMARY_KEY_MAP
+        if dry_run:
+            # get_insert_object would build record_data, which saves snapshots under the snapshot policy
+            return {"event_id": event_id, "object": {
+                "record_type": moped_event.get_event_type(),
+                "record_id": moped_event.get_state("new")[moped_event.get_record_primary_key()],
+                "description": moped_event.get_diff(),
+            }}
+        return {"event_id": event_id, "object": moped_event.get_insert_object()}
+    except Exception as e:
+        return {"event_id": event_id, "error": str(e)}
+
+
+def build_results(payloads: list, dry_run: bool = False) -> list:
+    """
+    Builds the activity log rows of a batch, runs in a worker process
+    :param payloads: The Hasura payloads of the batch
+    :type payloads: list
+    :param dry_run: Only builds the columns printed by a dry run
+    :type dry_run: bool
+    :return: A result for every payload, in order
+    :rtype: list
+    """
+    return [build_result(payload, dry_run=dry_run) for payload in payloads]
+
+
+def process_batches(
+    batches: Iterator[list], workers: int, primary_key_map: dict, dry_run: bool = False
+) -> Iterator[list]:
+    """
+    Builds the rows of every batch across a process pool, in order. Only a few
+    batches per worker are in flight, so memory does not grow with the input.
+    :param batches: The batches of payloads
+    :type batches: Iterator[list]
+    :param workers: The number of processes, 1 builds the rows in this process
+    :type workers: int
+    :param primary_key_map: The primary key of every table
+    :type primary_key_map: dict
+    :param dry_run: Only builds the columns printed by a dry run
+    :type dry_run: bool
+    :return: The results of every batch
+    :rtype: Iterator[list]
+    """
+    if workers <= 1:
+        init_worker(primary_key_map)
+        for batch in batches:
+            yield build_results(batch, dry_run=dry_run)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(primary_key_map,)
+    ) as executor:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(executor.submit(build_results, batch, dry_run))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while len(in_flight) > 0:
+            yield in_flight.popleft().result()
+
+
+def read_checkpoint(path: str, inputs: list) -> int:
+    """
+    Returns how many payloads of the inputs were already replayed
+    :param path: The path to the checkpoint file, None for no checkpoint
+    :type path: str
+    :param inputs: The input files, they must be the same as in the checkpoint
+    :type inputs: list
+    :return: The number of payloads to skip
+    :rtype: int
+    """
+    if path is None or not os.path.exists(path):
+        return 0
+
+    with open(path) as file:
+        checkpoint = json.load(file)
+
+    if checkpoint["inputs"] != inputs:
+        raise ValueError(f"The checkpoint {path} was written for other inputs: {checkpoint['inputs']}")
+
+    return checkpoint["position"]
+
+
+def write_checkpoint(path: str, inputs: list, position: int) -> None:
+    """
+    Records how many payloads were replayed, the file is replaced atomically
+    :param path: The path to the checkpoint file, None for no checkpoint
+    :type path: str
+    :param inputs: The input files
+    :type inputs: list
+    :param position: The number of payloads replayed
+    :type position: int
+    """
+    if path is None:
+        return
+
+    with open(path + ".tmp", "w") as file:
+        json.dump({"inputs": inputs, "position": position}, file)
+    os.replace(path + ".tmp", path)
+
+
+def save_batch(objects: list) -> int:
+    """
+    Inserts the rows of a batch, a row per event id
+    :param objects: The insert objects
+    :type objects: list
+    :return: The number of inserted rows, events saved before are not inserted again
+    :rtype: int
+    """
+    unique_objects = list({obj["event_id"]: obj for obj in objects}.values())
+    response = MopedEvent.request_batch(unique_objects)
+    if "errors" in response:
+        raise RuntimeError(f"Error while running GraphQL Query: {json.dumps(response)}")
+    return response["data"]["insert_moped_activity_log"]["affected_rows"]
+
+
+def save_project_updates(project_updates: MopedProjectUpdates, flush: bool = False, output=sys.stdout) -> bool:
+    """
+    Bumps updated_at for the projects touched by the replay. A failed request
+    keeps the updates pending, they are retried with the next batch.
+    :param project_updates: The pending project updates
+    :type project_updates: MopedProjectUpdates
+    :param flush: True to bump every pending project, whatever PROJECT_UPDATE_WINDOW_SECONDS
+    :type flush: bool
+    :param output: Where the errors are written
+    :return: True if Hasura answered without errors, or there was nothing to do
+    :rtype: bool
+    """
+    try:
+        response = project_updates.save(flush=flush)
+    except Exception as e:
+        print(json.dumps({"error": f"Could not update projects: {str(e)}"}), file=output)
+        return False
+    if "errors" in response:
+        print(json.dumps({"error": f"Error while updating projects: {json.dumps(response)}"}), file=output)
+        return False
+    return True
+
+
+def replay(
+    inputs: list,
+    batch_size: int = 100,
+    workers: int = 1,
+    checkpoint: str = None,
+    dry_run: bool = False,
+    primary_key_map: dict = None,
+    report_every: float = 5.0,
+    output=sys.stdout,
+    report=sys.stderr,
+) -> dict:
+    """
+    Replays the events of the input files into the activity log
+    :param inputs: The input files
+    :type inputs: list
+    :param batch_size: Events per batch, and per insert mutation
+    :type batch_size: int
+    :param workers: The number of processes building the rows
+    :type workers: int
+    :param checkpoint: The checkpoint file, replays resume from it
+    :type checkpoint: str
+    :param dry_run: Prints the diff of every event instead of saving it
+    :type dry_run: bool
+    :param primary_key_map: The primary key of every table, default: downloaded from S3
+    :type primary_key_map: dict
+    :param report_every: Seconds between two throughput reports
+    :type report_every: float
+    :param output: Where the dry run diffs and the errors are written
+    :param report: Where the throughput reports are written
+    :return: The summary of the replay, pending_project_updates counts the projects left without their updated_at
+    :rtype: dict
+    """
+    skip = 0 if dry_run else read_checkpoint(checkpoint, inputs)
+    position = skip
+    summary = {
+        "skipped": skip,
+        "processed": 0,
+        "inserted": 0,
+        "insignificant": 0,
+        "errors": 0,
+        "project_update_errors": 0,
+    }
+    project_updates = MopedProjectUpdates()
+    started = time.monotonic()
+    last_report = started
+
+    payloads = read_all_payloads(inputs)
+    for _ in range(skip):
+        next(payloads, None)
+
+    batches = read_batches(payloads, batch_size)
+    for results in process_batches(batches, workers, primary_key_map or get_primary_key_map(), dry_run=dry_run):
+        objects = []
+        for result in results:
+            if "error" in result:
+                summary["errors"] += 1
+                print(json.dumps({"event_id": result["event_id"], "error": result["error"]}), file=output)
+            elif "skipped" in result:
+                summary["insignificant"] += 1
+            elif dry_run:
+                print(json.dumps({
+                    "event_id": result["event_id"],
+                    "record_type": result["object"]["record_type"],
+                    "record_id": result["object"]["record_id"],
+                    "description": result["object"]["description"],
+                }), file=output)
+            else:
+                objects.append(result["object"])
+
+        if len(objects) > 0:
+            summary["inserted"] += save_batch(objects)
+            for obj in objects:
+                project_updates.add(project_id=obj["record_project_id"], timestamp=obj["created_at"])
+            if not save_project_updates(project_updates, output=output):
+                summary["project_update_errors"] += 1
+
+        summary["processed"] += len(results)
+        position += len(results)
+        if not dry_run:
+            write_checkpoint(checkpoint, inputs, position)
+
+        now = time.monotonic()
+        if now - last_report >= report_every:
+            last_report = now
+            print(
+                f"Replayed {summary['processed']} events, "
+                f"{summary['processed'] / (now - started):.1f} events/s, {summary['errors']} errors",
+                file=report
+            )
+
+    if len(project_updates) > 0 and not save_project_updates(project_updates, flush=True, output=output):
+        summary["project_update_errors"] += 1
+    summary["pending_project_updates"] = len(project_updates)
+
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    summary["events_per_second"] = round(summary["processed"] / summary["seconds"], 1) if summary["seconds"] else 0
+    return summary
+
+
+def main(args: list = None) -> dict:
+    """
+    Command line entry point
+    :param args: The command line arguments, default: sys.argv
+    :type args: list
+    :return: The summary of the replay
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description="Replays recorded Hasura events into moped_activity_log")
+    parser.add_argument("inputs", nargs="+", help="JSON Lines files, or .json DLQ exports")
+    parser.add_argument("--batch-size", type=int, default=100, help="Events per insert mutation")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes building the rows")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file, to resume an interrupted replay")
+    parser.add_argument("--dry-run", action="store_true", help="Prints the diffs, nothing is saved")
+    parser.add_argument("--primary-keys", default=None, help="A local copy of moped_primary_keys_<env>.json")
+    parser.add_argument("--report-every", type=float, default=5.0, help="Seconds between progress reports")
+    options = parser.parse_args(args)
+
+    primary_key_map = None
+    if options.primary_keys is not None:
+        with open(options.primary_keys) as file:
+            primary_key_map = json.load(file)
+
+    summary = replay(
+        inputs=options.inputs,
+        batch_size=options.batch_size,
+        workers=options.workers,
+        checkpoint=options.checkpoint,
+        dry_run=options.dry_run,
+        primary_key_map=primary_key_map,
+        report_every=options.report_every,
+    )
+    print(json.dumps(summary), file=sys.stderr)
+    if summary["pending_project_updates"] > 0:
+        sys.exit(1)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+/*
+    Compacts existing UPDATE rows to the "diff" record data policy:
+    the new state is kept whole, the old state keeps only the values
+    that changed, and added_columns lists the columns the new state
+    added. The old state can always be rebuilt as
+    (new || old) - added_columns.
+
+    Opt-in, not a migration: run it by hand only once the editor reads
+    record_data_policy (ProjectActivityLogDialog shows event.data.old as
+    the whole previous state). expand_record_data.sql reverts it.
+*/
+UPDATE moped_activity_log
+SET record_data = jsonb_set(
+        record_data,
+        '{event,data,old}',
+        COALESCE(
+            (
+                SELECT jsonb_object_agg(old_state.key, old_state.value)
+                FROM jsonb_each(record_data -> 'event' -> 'data' -> 'old') AS old_state
+                WHERE (record_data -> 'event' -> 'data' -> 'new' -> old_state.key) IS DISTINCT FROM old_state.value
+            ),
+            '{}'::jsonb
+        )
+    ) || '{"record_data_policy": "diff"}'::jsonb || COALESCE(
+        (
+            SELECT jsonb_build_object('added_columns', jsonb_agg(new_state.key))
+            FROM jsonb_each(record_data -> 'event' -> 'data' -> 'new') AS new_state
+            WHERE NOT (record_data -> 'event' -> 'data' -> 'old') ? new_state.key
+            HAVING count(*) > 0
+        ),
+        '{}'::jsonb
+    )
+WHERE operation_type = 'UPDATE'
+  AND NOT record_data ? 'record_data_policy'
+  AND jsonb_typeof(record_data -> 'event' -> 'data' -> 'old') = 'object'
+  AND jsonb_typeof(record_data -> 'event' -> 'data' -> 'new') = 'object';
+
+COMMENT ON COLUMN moped_activity_log.record_data IS 'The change payload as provided by Hasura, reduced according to record_data_policy';
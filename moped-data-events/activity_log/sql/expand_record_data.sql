@@ -0,0 +1,14 @@
+-- Reverts compact_record_data.sql
+-- Rebuild the full old state from the new state, the values that changed and the added columns
+UPDATE moped_activity_log
+SET record_data = jsonb_set(
+        record_data,
+        '{event,data,old}',
+        ((record_data -> 'event' -> 'data' -> 'new') || (record_data -> 'event' -> 'data' -> 'old'))
+            - ARRAY(SELECT jsonb_array_elements_text(COALESCE(record_data -> 'added_columns', '[]'::jsonb)))
+    ) - 'record_data_policy' - 'added_columns'
+WHERE record_data ->> 'record_data_policy' = 'diff'
+  AND jsonb_typeof(record_data -> 'event' -> 'data' -> 'old') = 'object'
+  AND jsonb_typeof(record_data -> 'event' -> 'data' -> 'new') = 'object';
+
+COMMENT ON COLUMN moped_activity_log.record_data IS 'The change payload as provided by Hasura';
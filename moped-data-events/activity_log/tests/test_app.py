@@ -95,3 +95,63 @@ class TestApp:
         # Make sure it gets called
         app.get_event_type.assert_called_once_with(self.event_update)
         mocker.stopall()
+
+    def test_seen_events(self) -> None:
+        """
+        Makes sure that redelivered events are remembered, up to a limit
+        """
+        app.seen_event_ids.clear()
+        assert not app.is_seen_event(self.event_update)
+        app.mark_seen_event(self.event_update)
+        assert app.is_seen_event(self.event_update)
+        assert not app.is_seen_event(None)
+        app.mark_seen_event(None)
+
+        for index in range(app.SEEN_EVENT_IDS_MAX_SIZE):
+            app.mark_seen_event({"id": str(index)})
+        assert len(app.seen_event_ids) == app.SEEN_EVENT_IDS_MAX_SIZE
+        assert not app.is_seen_event(self.event_update)
+        app.seen_event_ids.clear()
+
+    def test_app_handler_skips_seen_events(self, mocker: MockerFixture) -> None:
+        """
+        Makes sure that a redelivered event never reaches process_event
+        """
+        mocker.patch.object(app, 'process_event', autospec=True)
+        mocker.patch.object(app, 'save_project_updates', autospec=True)
+        app.seen_event_ids.clear()
+        app.mark_seen_event(self.event_update)
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        app.handler(create_sqs_event(self.event_update), context)
+        app.process_event.assert_not_called()
+        app.seen_event_ids.clear()
+
+    def test_is_significant_event(self) -> None:
+        """
+        Makes sure that updates of ignored columns alone are not significant
+        """
+        assert app.is_significant_event(self.event_update)
+        assert app.is_significant_event(self.event_insert)
+
+        event = json.loads(json.dumps(self.event_update))
+        event["event"]["data"]["old"] = {**event["event"]["data"]["new"], "updated_at": "2021-01-01T00:00:00+00:00"}
+        assert not app.is_significant_event(event)
+
+        event["event"]["data"]["old"] = dict(event["event"]["data"]["new"])
+        assert not app.is_significant_event(event)
+
+    def test_app_handler_skips_insignificant_events(self, mocker: MockerFixture) -> None:
+        """
+        Makes sure that a no-op update never builds a MopedEvent (no S3, DynamoDB or Hasura)
+        """
+        moped_event = mocker.patch.object(app, 'MopedEvent', autospec=True)
+        mocker.patch.object(app, 'save_project_updates', autospec=True)
+        app.seen_event_ids.clear()
+        app.metrics.start_batch()
+        event = json.loads(json.dumps(self.event_update))
+        event["event"]["data"]["old"] = dict(event["event"]["data"]["new"])
+
+        assert app.process_event(event) is None
+        moped_event.assert_not_called()
+        assert app.metrics.CURRENT_BATCH.counters["skipped_events"] == 1
+        app.metrics.flush_batch()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+import uuid
+import asyncio
+import pytest
+from pytest_mock import MockerFixture
+
+import MopedEvent as MopedEventModule
+import app
+import async_app
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+
+class TestAsyncApp:
+
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer(latency=0.01).start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+        cls.server.stop()
+
+    @pytest.fixture(autouse=True)
+    def stub_hasura(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", ({"moped_project": "project_id"}, float("inf")))
+        mocker.patch.object(async_app, "save_project_updates", autospec=True)
+        app.seen_event_ids.clear()
+        self.server.requests.clear()
+
+    def create_records(self, count: int) -> list:
+        """
+        Creates SQS records out of the update event, each one with its own event id
+        """
+        records = []
+        for _ in range(count):
+            event = {**self.event_update, "id": str(uuid.uuid4())}
+            records.extend(create_sqs_event(event)["Records"])
+        return records
+
+    def test_process_records_async(self) -> None:
+        records = self.create_records(8)
+        results = asyncio.run(async_app.process_records_async(records, concurrency=4))
+        assert len(results) == 8
+        assert all(isinstance(result, MopedEventModule.MopedEvent) for result in results)
+        assert len(self.server.requests) == 8
+
+    def test_process_records_async_isolates_errors(self) -> None:
+        records = self.create_records(3)
+        records.insert(1, {"body": json.dumps({"invalid": "event"})})
+        results = asyncio.run(async_app.process_records_async(records, concurrency=2))
+        assert isinstance(results[1], Exception)
+        assert all(isinstance(result, MopedEventModule.MopedEvent) for result in results[:1] + results[2:])
+        assert len(self.server.requests) == 3
+
+    def test_process_records_async_skips_redeliveries(self) -> None:
+        records = self.create_records(2)
+        asyncio.run(async_app.process_records_async(records, concurrency=2))
+        results = asyncio.run(async_app.process_records_async(records, concurrency=2))
+        assert results == [None, None]
+        assert len(self.server.requests) == 2
+
+    def test_handler(self) -> None:
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        event = create_sqs_event(self.event_update)
+        event["Records"].append({"body": json.dumps({"invalid": "event"})})
+        with pytest.raises(Exception):
+            async_app.handler(event, context)
+        assert len(self.server.requests) == 1
+        async_app.save_project_updates.assert_called_once()
+
+    def test_handler_scheduled_event(self) -> None:
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        event = {"source": "aws.events", "detail-type": "Scheduled Event"}
+        assert async_app.handler(event, context) == event
+        async_app.save_project_updates.assert_called_once_with(flush=True)
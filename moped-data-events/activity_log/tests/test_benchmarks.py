@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import pytest
+from pytest_mock import MockerFixture
+
+import codec
+import MopedEvent as MopedEventModule
+import MopedProjectUpdates as MopedProjectUpdatesModule
+import app
+from benchmarks.harness import add_geojson, compare, generate_batches, run_scenario
+from benchmarks.memory import run_scenario as run_memory_scenario
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+
+class TestBenchmarks:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer().start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+        cls.server.stop()
+
+    @pytest.fixture(autouse=True)
+    def stub_hasura(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedProjectUpdatesModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", ({}, 0))
+        app.seen_event_ids.clear()
+
+    def test_generate_batches(self) -> None:
+        batches = generate_batches(self.event_update, events=25, batch_size=10)
+        assert [len(batch["Records"]) for batch in batches] == [10, 10, 5]
+        ids = {json.loads(record["body"])["id"] for batch in batches for record in batch["Records"]}
+        assert len(ids) == 25
+
+    def test_add_geojson(self) -> None:
+        event = add_geojson(self.event_update, points=100)
+        old_location = event["event"]["data"]["old"]["location"]
+        new_location = event["event"]["data"]["new"]["location"]
+        assert len(new_location["geometry"]["coordinates"]) == 100
+        assert old_location != new_location
+        assert "location" not in self.event_update["event"]["data"]["new"]
+
+    def test_run_scenario(self) -> None:
+        result = run_scenario(self.event_update, events=6, batch_size=4, geojson_points=50)
+        assert result["events"] == 6
+        assert result["stages"]["handler"]["count"] == 2
+        assert result["stages"]["process_event"]["count"] == 6
+        assert result["stages"]["get_diff"]["count"] == 6
+        assert result["stages"]["save"]["count"] == 6
+        # Every event was sent to Hasura, plus one project update per batch
+        assert len(self.server.requests) == 8
+        # The AWS stand-ins are removed once the scenario is over
+        assert MopedEventModule.DYNAMODB_CLIENT is None or not hasattr(MopedEventModule.DYNAMODB_CLIENT, "requests")
+
+    def test_compare(self) -> None:
+        scenario = {"batch_size": 10, "geojson_points": 0, "events_per_second": 200.0}
+        previous = {"scenarios": [{**scenario, "events_per_second": 100.0}]}
+        assert compare({"scenarios": [scenario]}, previous)[0]["ratio"] == 2.0
+
+    def test_memory_scenario(self, mocker: MockerFixture) -> None:
+        # The raw JSON is only spliced in with the standard library codec
+        mocker.patch.object(codec, "orjson", None)
+        result = run_memory_scenario(self.event_update, events=2, geojson_points=1000)
+        assert result["raw"]["request_body_bytes"] == result["reserialized"]["request_body_bytes"]
+        # Forwarding the raw body does not serialize the GeoJSON again
+        assert result["raw"]["request_body_peak_bytes"] < result["reserialized"]["request_body_peak_bytes"]
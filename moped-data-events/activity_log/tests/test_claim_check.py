@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+import gzip
+import base64
+import hashlib
+import pytest
+from pytest_mock import MockerFixture
+
+import MopedEvent as MopedEventModule
+import app
+import async_app
+from claim_check import resolve_payload, resolve_record, resolve_records
+from benchmarks.stub_aws import StubS3Client
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+
+def create_gzip_envelope(payload: dict) -> dict:
+    return {
+        "payload_encoding": "gzip+base64",
+        "payload": base64.b64encode(gzip.compress(json.dumps(payload).encode("utf-8"))).decode("ascii"),
+    }
+
+
+def create_s3_envelope(payload: dict, s3_client: StubS3Client, sha256: str = None) -> dict:
+    data = json.dumps(payload).encode("utf-8")
+    s3_client.put_object(Bucket="atd-moped-data-events", Key="claim-check/test.json.gz", Body=gzip.compress(data))
+    return {
+        "payload_encoding": "s3",
+        "bucket": "atd-moped-data-events",
+        "key": "claim-check/test.json.gz",
+        "sha256": sha256 or hashlib.sha256(data).hexdigest(),
+        "size": len(data),
+    }
+
+
+class TestClaimCheck:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+
+    def test_resolve_plain_payload(self) -> None:
+        assert resolve_payload(self.event_update) is self.event_update
+        record = {"messageId": "1", "body": json.dumps(self.event_update)}
+        assert resolve_record(record) is record
+
+    def test_resolve_gzip(self) -> None:
+        record = {"messageId": "1", "body": json.dumps(create_gzip_envelope(self.event_update))}
+        resolved = resolve_record(record)
+        assert json.loads(resolved["body"]) == self.event_update
+        assert resolved["messageId"] == "1"
+
+    def test_resolve_s3(self) -> None:
+        s3_client = StubS3Client()
+        envelope = create_s3_envelope(self.event_update, s3_client)
+        assert resolve_payload(envelope, s3_client=s3_client) == self.event_update
+
+    def test_resolve_s3_checksum(self) -> None:
+        s3_client = StubS3Client()
+        envelope = create_s3_envelope(self.event_update, s3_client, sha256="0" * 64)
+        with pytest.raises(ValueError):
+            resolve_payload(envelope, s3_client=s3_client)
+
+    def test_unknown_encoding(self) -> None:
+        with pytest.raises(ValueError):
+            resolve_payload({"payload_encoding": "zstd", "payload": ""})
+
+    def test_unresolved_records_are_kept(self) -> None:
+        record = {"messageId": "1", "body": json.dumps({"payload_encoding": "s3", "bucket": "b", "key": "k"})}
+        assert resolve_records([record], s3_client=StubS3Client()) == [record]
+
+
+class TestClaimCheckHandler:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer().start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.server.stop()
+
+    def test_handler_resolves_envelopes(self, mocker: MockerFixture) -> None:
+        s3_client = StubS3Client()
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "S3_CLIENT", s3_client)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", ({"moped_project": "project_id"}, float("inf")))
+        mocker.patch.object(async_app, "save_project_updates", autospec=True)
+        app.seen_event_ids.clear()
+        self.server.requests.clear()
+
+        gzip_event = {**self.event_update, "id": "f0f0f0f0-0000-4000-8000-000000000001"}
+        s3_event = {**self.event_update, "id": "f0f0f0f0-0000-4000-8000-000000000002"}
+        records = [
+            {"messageId": "1", "body": json.dumps(create_gzip_envelope(gzip_event))},
+            {"messageId": "2", "body": json.dumps(create_s3_envelope(s3_event, s3_client))},
+        ]
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        async_app.handler({"Records": records}, context)
+
+        assert sorted(request["variables"]["eventId"] for request in self.server.requests) == [
+            gzip_event["id"], s3_event["id"]
+        ]
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+import copy
+import uuid
+import pytest
+from pytest_mock import MockerFixture
+
+import MopedEvent as MopedEventModule
+import app
+import async_app
+from coalesce import coalesce_records
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+PRIMARY_KEY_MAP = {"moped_project": "project_id"}
+
+
+class TestCoalesce:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer().start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+        cls.server.stop()
+
+    @pytest.fixture(autouse=True)
+    def stub_hasura(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", (PRIMARY_KEY_MAP, float("inf")))
+        mocker.patch.object(async_app, "save_project_updates", autospec=True)
+        app.seen_event_ids.clear()
+        self.server.requests.clear()
+
+    def create_update(self, name: str, seconds: int, user_id: str = None, project_id: int = 1) -> dict:
+        """
+        Creates an update of the project name, made some seconds after 2021-01-19T21:27:00
+        """
+        event = copy.deepcopy(self.event_update)
+        event["id"] = str(uuid.uuid4())
+        event["created_at"] = f"2021-01-19T21:27:{seconds:02d}.000000Z"
+        event["event"]["data"]["old"]["project_id"] = project_id
+        event["event"]["data"]["new"]["project_id"] = project_id
+        event["event"]["data"]["new"]["project_name"] = name
+        if user_id is not None:
+            event["event"]["session_variables"]["x-hasura-user-id"] = user_id
+        return event
+
+    def create_records(self, events: list) -> list:
+        return [{"body": json.dumps(event)} for event in events]
+
+    def test_coalesce_burst(self) -> None:
+        events = [self.create_update("a", 0), self.create_update("b", 5), self.create_update("c", 9)]
+        records = coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)
+        assert len(records) == 1
+        merged = json.loads(records[0]["body"])
+        assert merged["event"]["data"]["old"] == events[0]["event"]["data"]["old"]
+        assert merged["event"]["data"]["new"]["project_name"] == "c"
+        # The idempotency key of the first event
+        assert merged["id"] == events[0]["id"]
+        assert merged["created_at"] == events[0]["created_at"]
+        assert records[0]["coalesced_event_ids"] == [event["id"] for event in events]
+
+    def test_coalesce_redelivery(self) -> None:
+        events = [self.create_update("a", 0), self.create_update("b", 5), self.create_update("c", 9)]
+        merged = json.loads(coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)[0]["body"])
+
+        # The same burst, or its first event alone, maps to the same row
+        for redelivery in [events, events[:2], events[:1]]:
+            records = coalesce_records(self.create_records(redelivery), PRIMARY_KEY_MAP, window_seconds=10)
+            redelivered = json.loads(records[0]["body"])
+            assert (redelivered["id"], redelivered["created_at"]) == (merged["id"], merged["created_at"])
+
+        # At-least-once: the later events redelivered without the first one make a row of their own
+        records = coalesce_records(self.create_records(events[1:]), PRIMARY_KEY_MAP, window_seconds=10)
+        assert json.loads(records[0]["body"])["id"] == events[1]["id"]
+
+    def test_coalesce_disabled(self) -> None:
+        records = self.create_records([self.create_update("a", 0), self.create_update("b", 1)])
+        assert coalesce_records(records, PRIMARY_KEY_MAP, window_seconds=0) is records
+
+    def test_coalesce_window(self) -> None:
+        events = [self.create_update("a", 0), self.create_update("b", 5), self.create_update("c", 20)]
+        records = coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)
+        assert len(records) == 2
+        assert json.loads(records[1]["body"])["id"] == events[2]["id"]
+
+    def test_coalesce_keys(self) -> None:
+        events = [
+            self.create_update("a", 0),
+            self.create_update("b", 1, project_id=2),
+            self.create_update("c", 2),
+            self.create_update("d", 3, project_id=2),
+        ]
+        records = coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)
+        assert [json.loads(record["body"])["event"]["data"]["new"]["project_name"] for record in records] == ["c", "d"]
+
+    def test_other_user_ends_burst(self) -> None:
+        events = [
+            self.create_update("a", 0),
+            self.create_update("b", 1, user_id="b4f0e6a0-5f50-11eb-8ea9-371fc07428f6"),
+            self.create_update("c", 2),
+        ]
+        records = coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)
+        assert len(records) == 3
+
+    def test_insert_ends_burst(self) -> None:
+        insert = self.create_update("b", 1)
+        insert["event"]["op"] = "INSERT"
+        events = [self.create_update("a", 0), insert, self.create_update("c", 2)]
+        records = coalesce_records(self.create_records(events), PRIMARY_KEY_MAP, window_seconds=10)
+        assert len(records) == 3
+
+    def test_invalid_records_are_kept(self) -> None:
+        records = [{"body": "not json"}, {"messageId": "no body"}]
+        assert coalesce_records(records, PRIMARY_KEY_MAP, window_seconds=10) == records
+
+    def test_handler_coalesces(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(app, "ACTIVITY_LOG_COALESCE_WINDOW_SECONDS", 10)
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        events = [self.create_update("a", 0), self.create_update("b", 5), self.create_update("c", 9)]
+        async_app.handler({"Records": self.create_records(events)}, context)
+
+        assert len(self.server.requests) == 1
+        variables = self.server.requests[0]["variables"]
+        assert variables["eventId"] == events[0]["id"]
+        assert any(
+            change["field"] == "project_name" and change["new"] == "c" for change in variables["description"]
+        )
+        assert all(app.is_seen_event(event) for event in events)
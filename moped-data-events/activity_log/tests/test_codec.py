@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+import json
+import decimal
+import datetime
+import pytest
+from pytest_mock import MockerFixture
+
+import codec
+from benchmarks.codec import measure
+
+from .helpers import *
+
+
+class TestCodec:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+
+    @pytest.fixture(params=["orjson", "json"])
+    def json_codec(self, request, mocker: MockerFixture) -> str:
+        if request.param == "json":
+            mocker.patch.object(codec, "orjson", None)
+        elif codec.orjson is None:
+            pytest.skip("orjson is not installed")
+        return request.param
+
+    def test_round_trip(self, json_codec: str) -> None:
+        body = codec.dumps(self.event_update)
+        assert codec.loads(body) == self.event_update
+        assert codec.loads(codec.dumps_bytes(self.event_update)) == self.event_update
+        assert codec.loads(body.encode("utf-8")) == self.event_update
+
+    def test_compact_utf8(self, json_codec: str) -> None:
+        assert codec.dumps({"name": "Lamar — Ñ", "ids": [1, 2]}) == '{"name":"Lamar — Ñ","ids":[1,2]}'
+        assert codec.dumps_bytes({"name": "Ñ"}) == '{"name":"Ñ"}'.encode("utf-8")
+
+    def test_default(self, json_codec: str) -> None:
+        value = {
+            "created": datetime.datetime(2021, 7, 1, 12, 30, tzinfo=datetime.timezone.utc),
+            "day": datetime.date(2021, 7, 1),
+            "count": decimal.Decimal("3"),
+            "ratio": decimal.Decimal("0.5"),
+            "tags": ("a", "b"),
+        }
+        assert codec.loads(codec.dumps(value)) == {
+            "created": "2021-07-01T12:30:00+00:00",
+            "day": "2021-07-01",
+            "count": 3,
+            "ratio": 0.5,
+            "tags": ["a", "b"],
+        }
+        with pytest.raises(TypeError):
+            codec.dumps({"value": object()})
+
+    def test_large_integers(self, json_codec: str) -> None:
+        # Over 64 bits, orjson leaves them to the standard library
+        value = {"id": 2 ** 70 + 1, "at": datetime.date(2021, 7, 1)}
+        assert codec.dumps(value) == '{"id":1180591620717411303425,"at":"2021-07-01"}'
+        assert codec.dumps_bytes(value) == b'{"id":1180591620717411303425,"at":"2021-07-01"}'
+
+    def test_benchmark(self) -> None:
+        results = measure(self.event_update, number=2)
+        assert "json" in results
+        assert results["json"]["loads_us"] > 0
+        assert ("orjson" in results) == (codec.orjson is not None)
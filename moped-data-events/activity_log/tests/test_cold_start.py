@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+from pytest_mock import MockerFixture
+
+import app
+import async_app
+from benchmarks.import_profile import get_import_profile
+
+# Imported on first use only, they made up most of the cold start
+HEAVY_MODULES = ["cerberus", "boto3", "botocore", "requests", "dateutil", "aiohttp"]
+
+
+class TestColdStart:
+    def test_heavy_dependencies_are_deferred(self) -> None:
+        # Checked in a fresh interpreter, on sys.modules rather than timings
+        for module in ["app", "async_app"]:
+            loaded = get_import_profile([module])["deferred_modules_loaded"]
+            assert [name for name in HEAVY_MODULES if name in loaded] == []
+
+    def test_scheduled_event_preloads(self, mocker: MockerFixture) -> None:
+        get_primary_key_map = mocker.patch.object(app, "get_primary_key_map")
+        get_dynamodb_client = mocker.patch.object(app, "get_dynamodb_client")
+        mocker.patch.object(app, "event_validator", None)
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        event = {"source": "aws.events", "detail-type": "Scheduled Event"}
+
+        assert async_app.handler(event, context) == event
+        get_primary_key_map.assert_called_once()
+        get_dynamodb_client.assert_called_once()
+        assert app.event_validator is not None
+
+    def test_preload_errors_are_logged(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(app, "get_primary_key_map", side_effect=RuntimeError("No credentials"))
+        mocker.patch.object(app, "get_dynamodb_client")
+        app.preload()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+from diff import diff_states, has_changes, is_same_value
+
+from .helpers import *
+
+
+class TestDiff:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+
+    def test_diff_scalar_columns(self) -> None:
+        data = self.event_update["event"]["data"]
+        diff = diff_states(data["old"], data["new"])
+        assert [change["field"] for change in diff] == ["project_priority", "project_name"]
+        assert "changes" not in diff[0]
+
+    def test_diff_empty_states(self) -> None:
+        assert diff_states(None, {"project_id": 1}) == []
+        assert diff_states({"project_id": 1}, None) == []
+        assert diff_states({}, {}) == []
+
+    def test_diff_added_and_removed_columns(self) -> None:
+        diff = diff_states({"a": 1, "b": 2}, {"a": 1, "c": 3})
+        assert diff == [
+            {"field": "c", "old": None, "new": 3},
+            {"field": "b", "old": 2, "new": None},
+        ]
+
+    def test_diff_ignored_columns(self) -> None:
+        diff = diff_states(
+            {"updated_at": "2021-01-01", "name": "a"},
+            {"updated_at": "2021-01-02", "name": "a"},
+            ignored_columns=["updated_at"],
+        )
+        assert diff == []
+
+    def test_diff_type_aware(self) -> None:
+        assert is_same_value(1, 1.0)
+        assert not is_same_value(True, 1)
+        assert not is_same_value("1", 1)
+        assert diff_states({"capitally_funded": 1}, {"capitally_funded": True}) != []
+
+    def test_diff_nested_json_pointer(self) -> None:
+        coordinates = [[-97.7 + i * 0.001, 30.2] for i in range(500)]
+        moved = [list(point) for point in coordinates]
+        moved[42][1] = 30.3
+        old_state = {"location": {"type": "Feature", "properties": {"a/b": 1}, "geometry": {"coordinates": coordinates}}}
+        new_state = {"location": {"type": "Feature", "properties": {"a/b": 2}, "geometry": {"coordinates": moved}}}
+
+        diff = diff_states(old_state, new_state)
+        # One entry per column, with the changed values instead of the whole documents
+        assert diff == [
+            {
+                "field": "location",
+                "changes": [
+                    {"path": "/location/properties/a~1b", "old": 1, "new": 2},
+                    {"path": "/location/geometry/coordinates/42/1", "old": 30.2, "new": 30.3},
+                ],
+            },
+        ]
+
+    def test_diff_nested_list_resized(self) -> None:
+        diff = diff_states({"ids": {"list": [1, 2]}}, {"ids": {"list": [1, 2, 3]}})
+        assert diff[0]["changes"] == [{"path": "/ids/list", "old": [1, 2], "new": [1, 2, 3]}]
+        assert diff_states({"ids": {"list": [1, 2]}}, {"ids": {"list": [1, 2]}}) == []
+
+    def test_diff_nested_too_many_changes(self) -> None:
+        old_state = {"location": {"coordinates": list(range(100))}}
+        new_state = {"location": {"coordinates": list(range(100, 200))}}
+        diff = diff_states(old_state, new_state)
+        assert diff == [{"field": "location", "old": old_state["location"], "new": new_state["location"]}]
+
+    def test_has_changes(self) -> None:
+        data = self.event_update["event"]["data"]
+        assert has_changes(data["old"], data["new"])
+        assert not has_changes(data["new"], dict(data["new"]))
+        assert not has_changes({"updated_at": 1, "a": 1}, {"updated_at": 2, "a": 1}, ignored_columns=["updated_at"])
+        assert has_changes({"a": 1, "b": 2}, {"a": 1})
+        assert has_changes({"a": {"b": [1, 2]}}, {"a": {"b": [1, True]}})
+        assert has_changes(None, {"a": 1})
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import json
+import pytest
+
+import app
+import event_log
+from event_log import (
+    REDACTED,
+    OMITTED_BODY,
+    redact,
+    dumps_capped,
+    get_loggable,
+    get_envelope,
+    format_event,
+)
+
+
+class TestEventLog:
+    def create_batch(self, points: int = 0) -> dict:
+        body = {
+            "id": "e3bd46b2-2a80-486a-b1d2-99be709b73d5",
+            "event": {"data": {"new": {"location": [[-97.74, 30.27]] * points}}},
+            "headers": {"Authorization": "Bearer abc", "x-hasura-admin-secret": "hunter2"},
+        }
+        return {
+            "Records": [
+                {
+                    "messageId": "1",
+                    "attributes": {"ApproximateReceiveCount": "2"},
+                    "body": json.dumps(body),
+                }
+            ]
+        }
+
+    def test_redact(self) -> None:
+        value = {"a": 1, "nested": [{"Password": "x", "b": {"api_token": "y"}}]}
+        assert redact(value) == {"a": 1, "nested": [{"Password": REDACTED, "b": {"api_token": REDACTED}}]}
+        assert value["nested"][0]["Password"] == "x"
+
+    def test_dumps_capped(self) -> None:
+        assert dumps_capped({"a": 1}, max_bytes=100) == '{"a": 1}'
+        capped = dumps_capped({"a": "x" * 1000}, max_bytes=100)
+        assert capped.startswith('{"a": "xxx')
+        assert capped.endswith("...[truncated]")
+        assert len(capped) == 100 + len("...[truncated]")
+
+    def test_get_loggable(self) -> None:
+        record = self.create_batch()["Records"][0]
+        loggable = get_loggable(record)
+        assert loggable["body"]["headers"] == {"Authorization": REDACTED, "x-hasura-admin-secret": REDACTED}
+        assert isinstance(get_loggable({"a": "x" * 1000}, max_bytes=200), str)
+
+    def test_get_loggable_large_body(self, mocker) -> None:
+        record = self.create_batch(points=1000)["Records"][0]
+        loads = mocker.spy(event_log.json, "loads")
+        loggable = get_loggable(record, max_bytes=200)
+        # Neither decoded nor redacted, only its size is logged
+        assert loads.call_count == 0
+        assert loggable["body"] == OMITTED_BODY.format(len(record["body"]))
+        assert loggable["messageId"] == "1"
+
+    def test_envelope(self) -> None:
+        envelope = get_envelope(self.create_batch(points=100))
+        assert envelope["records"] == 1
+        assert envelope["messages"][0]["messageId"] == "1"
+        assert envelope["messages"][0]["receiveCount"] == "2"
+        assert envelope["bytes"] == envelope["messages"][0]["bytes"] > 1000
+        assert get_envelope({"source": "aws.events", "detail-type": "Scheduled Event"})["source"] == "aws.events"
+
+    def test_format_event(self) -> None:
+        batch = self.create_batch(points=1000)
+        line = format_event(batch, with_bodies=False)
+        assert "Records" not in json.loads(line)
+        assert "location" not in line
+
+        line = format_event(batch, with_bodies=True)
+        assert len(line) < event_log.ACTIVITY_LOG_LOG_MAX_BYTES + 1000
+        assert "hunter2" not in format_event(self.create_batch(), with_bodies=True)
+
+    def test_critical_error_is_capped(self, capsys) -> None:
+        record = self.create_batch(points=10000)["Records"][0]
+        with pytest.raises(Exception, match="Could not process record"):
+            app.raise_critical_error(message="Could not process record", data=record)
+        output = capsys.readouterr().out
+        assert json.loads(output)["message"] == "Could not process record"
+        assert len(output) < event_log.ACTIVITY_LOG_LOG_MAX_BYTES + 1000
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import uuid
+import pytest
+from pytest_mock import MockerFixture
+
+import MopedEvent as MopedEventModule
+import app
+import async_app
+import metrics
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+
+class TestMetrics:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer().start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+        cls.server.stop()
+
+    @pytest.fixture(autouse=True)
+    def reset_metrics(self, mocker: MockerFixture) -> None:
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", ({"moped_project": "project_id"}, float("inf")))
+        mocker.patch.object(async_app, "save_project_updates", autospec=True)
+        app.seen_event_ids.clear()
+        metrics.CURRENT_BATCH = None
+
+    def test_span_sampled(self) -> None:
+        batch = metrics.start_batch(sample_rate=1.0)
+        metrics.sample_event()
+        with metrics.span("diff"):
+            pass
+        metrics.increment("events", 2)
+        summary = batch.get_summary()
+        assert summary["diff_count"] == 1
+        assert summary["events"] == 2
+        assert {"diff_p50", "diff_p95", "diff_p99", "diff_max"} <= set(summary)
+
+    def test_span_not_sampled(self) -> None:
+        batch = metrics.start_batch(sample_rate=0.0)
+        metrics.sample_event()
+        with metrics.span("diff"):
+            pass
+        with metrics.span("project_updates", always=True):
+            pass
+        metrics.increment("events")
+        assert batch.get_summary().keys() == {
+            "events", "project_updates_count", "project_updates_p50",
+            "project_updates_p95", "project_updates_p99", "project_updates_max",
+        }
+
+    def test_span_outside_batch(self) -> None:
+        with metrics.span("diff"):
+            pass
+        metrics.increment("events")
+        assert metrics.flush_batch() == {}
+
+    def test_percentiles(self) -> None:
+        batch = metrics.BatchMetrics()
+        for index in range(1, 101):
+            batch.add_duration("save", index / 1000)
+        summary = batch.get_summary()
+        assert summary["save_p50"] == 50.0
+        assert summary["save_p99"] == 99.0
+        assert summary["save_max"] == 100.0
+
+    def test_emf_document(self) -> None:
+        document = metrics.get_emf_document({"events": 3, "diff_p50": 1.5}, timestamp=1625097600)
+        definition = document["_aws"]["CloudWatchMetrics"][0]
+        assert document["_aws"]["Timestamp"] == 1625097600000
+        assert definition["Dimensions"] == [["Environment"]]
+        assert {"Name": "diff_p50", "Unit": "Milliseconds"} in definition["Metrics"]
+        assert {"Name": "events", "Unit": "Count"} in definition["Metrics"]
+        assert document["events"] == 3
+
+    def test_async_handler_emits_batch_metrics(self, capsys) -> None:
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        records = []
+        for _ in range(3):
+            records.extend(create_sqs_event({**self.event_update, "id": str(uuid.uuid4())})["Records"])
+        async_app.handler({"Records": records}, context)
+
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{\"_aws\"")]
+        assert len(lines) == 1
+        assert lines[0]["events"] == 3
+        assert lines[0]["process_event_count"] == 3
+        assert lines[0]["hasura_request_count"] == 3
+        assert lines[0]["diff_count"] == 3
+        assert lines[0]["validate_count"] == 3
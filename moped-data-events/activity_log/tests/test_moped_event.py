@@ -1,5 +1,10 @@
 #!/usr/bin/env python
 import pdb
+import pytest
+from pytest_mock import MockerFixture
+
+import codec
+import MopedEvent as MopedEventModule
 from MopedEvent import MopedEvent
 
 from .helpers import *
@@ -188,3 +193,87 @@ class TestMopedEvent:
         assert "insert_moped_activity_log" in response["data"]
         assert "affected_rows" in response["data"]["insert_moped_activity_log"]
         assert response["data"]["insert_moped_activity_log"]["affected_rows"] == 1
+
+    def test_get_project_id(self) -> None:
+        moped_event = MopedEvent(payload=self.event_update, load_primary_keys=False)
+        assert moped_event.get_project_id() == 1
+
+        # On DELETE the new state is null, the project id comes from the old state
+        event_delete = load_json_file("tests/moped_project/dummy_event_update.json")
+        event_delete["event"]["op"] = "DELETE"
+        event_delete["event"]["data"]["new"] = None
+        moped_event = MopedEvent(payload=event_delete, load_primary_keys=False)
+        assert moped_event.get_project_id() == 1
+
+        moped_event = MopedEvent(payload=None, load_primary_keys=False)
+        assert moped_event.get_project_id() == 0
+
+    def test_get_event_timestamp(self) -> None:
+        moped_event = MopedEvent(payload=self.event_update, load_primary_keys=False)
+        assert moped_event.get_event_timestamp() == "2021-01-19T21:27:10.223965Z"
+
+        moped_event = MopedEvent(payload=None, load_primary_keys=False)
+        assert moped_event.get_event_timestamp() != ""
+
+    def test_get_user_database_id_cache(self, mocker: MockerFixture) -> None:
+        MopedEventModule.USER_DATABASE_ID_CACHE.clear()
+        dynamodb = mocker.MagicMock()
+        dynamodb.query.return_value = {"Items": [{"database_id": {"N": "5"}}]}
+        mocker.patch.object(MopedEventModule, "get_dynamodb_client", return_value=dynamodb)
+
+        moped_event = MopedEvent(payload=self.event_update, load_primary_keys=False)
+        user_id = moped_event.get_event_session_var("x-hasura-user-id")
+        assert moped_event.get_user_database_id(user_id) == 5
+        assert moped_event.get_user_database_id(user_id) == 5
+        assert dynamodb.query.call_count == 1
+
+        # Expired entries are resolved again
+        MopedEventModule.USER_DATABASE_ID_CACHE[user_id] = (5, 0)
+        assert moped_event.get_user_database_id(user_id) == 5
+        assert dynamodb.query.call_count == 2
+        MopedEventModule.USER_DATABASE_ID_CACHE.clear()
+
+    def test_get_event_id(self) -> None:
+        moped_event = MopedEvent(payload=self.event_update, load_primary_keys=False)
+        assert moped_event.get_event_id() == self.event_update["id"]
+        assert "on_conflict" in moped_event.MOPED_GRAPHQL_MUTATION
+
+        moped_event = MopedEvent(payload=None, load_primary_keys=False)
+        assert moped_event.get_event_id() is None
+
+    def test_cached_accessors(self) -> None:
+        moped_event = MopedEvent(payload=self.event_update, load_primary_keys=False)
+        assert not hasattr(moped_event, "__dict__")
+        moped_event.MOPED_PRIMARY_KEY_MAP = {"moped_project": "project_id"}
+        assert moped_event.get_event_type() == "moped_project"
+        assert moped_event.get_operation_type() == "UPDATE"
+        assert moped_event.get_record_primary_key() == "project_id"
+        assert moped_event.get_state("new") is self.event_update["event"]["data"]["new"]
+
+        # A new payload or primary key map discards what was computed
+        moped_event.HASURA_EVENT_PAYLOAD = self.event_insert
+        assert moped_event.get_operation_type() == "INSERT"
+        assert moped_event.get_state("old") is None
+        moped_event.MOPED_PRIMARY_KEY_MAP = {}
+        assert moped_event.get_record_primary_key() is None
+
+        moped_event.HASURA_EVENT_PAYLOAD = None
+        assert moped_event.get_operation_type("none") == "none"
+        assert moped_event.get_event_type() == ""
+
+    @pytest.mark.parametrize("orjson", [None, codec.orjson])
+    def test_get_request_body_raw(self, mocker: MockerFixture, orjson) -> None:
+        mocker.patch.object(codec, "orjson", orjson)
+        raw = json.dumps(self.event_update, indent=1)
+        moped_event = MopedEvent(payload=json.loads(raw), load_primary_keys=False, raw=raw)
+        assert str(moped_event) == raw
+
+        # The whole payload is the record data: the raw JSON is forwarded as it is
+        body = moped_event.get_request_body({"recordId": 1, "recordData": moped_event.HASURA_EVENT_PAYLOAD})
+        assert raw.encode("utf-8") in body
+        assert json.loads(body)["variables"] == {"recordId": 1, "recordData": self.event_update}
+
+        # Anything else is serialized
+        body = moped_event.get_request_body({"recordId": 1, "recordData": {"diff": {}}})
+        assert raw.encode("utf-8") not in body
+        assert json.loads(body)["variables"]["recordData"] == {"diff": {}}
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import pytest
+from pytest_mock import MockerFixture
+
+from MopedProjectUpdates import MopedProjectUpdates
+
+
+class TestMopedProjectUpdates:
+
+    def test_add_keeps_latest_timestamp(self) -> None:
+        project_updates = MopedProjectUpdates()
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:10.223965Z")
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:12.000000Z")
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:11.000000Z")
+        project_updates.add(project_id=2, timestamp="2021-01-19T21:27:10.223965Z")
+        assert len(project_updates) == 2
+        assert project_updates.pending_updates[1] == "2021-01-19T21:27:12.000000Z"
+
+    def test_add_ignores_records_without_project(self) -> None:
+        project_updates = MopedProjectUpdates()
+        project_updates.add(project_id=0, timestamp="2021-01-19T21:27:10.223965Z")
+        project_updates.add(project_id=None, timestamp="2021-01-19T21:27:10.223965Z")
+        project_updates.add(project_id=True, timestamp="2021-01-19T21:27:10.223965Z")
+        assert len(project_updates) == 0
+        assert project_updates.save() == {}
+
+    def test_get_mutation(self) -> None:
+        mutation = MopedProjectUpdates.get_mutation([1, 2])
+        assert mutation.count("update_moped_project(") == 2
+        assert "$projectId1: Int!" in mutation
+        assert "updated_at: {_lt: $timestamp1}" in mutation
+
+    def test_save_single_request(self, mocker: MockerFixture) -> None:
+        post = mocker.patch("requests.post", autospec=True)
+        post.return_value.json.return_value = {"data": {}}
+        project_updates = MopedProjectUpdates()
+        for project_id in [1, 2, 1, 2, 1]:
+            project_updates.add(project_id=project_id, timestamp="2021-01-19T21:27:10.223965Z")
+
+        project_updates.save()
+        assert post.call_count == 1
+        assert len(project_updates) == 0
+
+    def test_save_time_window(self, mocker: MockerFixture) -> None:
+        post = mocker.patch("requests.post", autospec=True)
+        post.return_value.json.return_value = {"data": {}}
+        project_updates = MopedProjectUpdates(window_seconds=60)
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:10.223965Z")
+        project_updates.save()
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:20.223965Z")
+
+        # Still within the window, the update stays pending
+        assert project_updates.save() == {}
+        assert post.call_count == 1
+        assert len(project_updates) == 1
+
+        # The Scheduled Event flushes it
+        project_updates.save(flush=True)
+        assert post.call_count == 2
+        assert len(project_updates) == 0
+        assert b'"timestamp0":"2021-01-19T21:27:20.223965Z"' in post.call_args[1]["data"]
+
+    def test_save_keeps_pending_on_error(self, mocker: MockerFixture) -> None:
+        post = mocker.patch("requests.post", autospec=True)
+        post.return_value.json.return_value = {"errors": [{"message": "database query error"}]}
+        project_updates = MopedProjectUpdates()
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:10.223965Z")
+
+        assert "errors" in project_updates.save()
+        assert len(project_updates) == 1
+
+        # The next batch retries it
+        post.return_value.json.return_value = {"data": {}}
+        project_updates.save()
+        assert post.call_count == 2
+        assert len(project_updates) == 0
+
+    def test_save_keeps_pending_on_invalid_response(self, mocker: MockerFixture) -> None:
+        post = mocker.patch("requests.post", autospec=True)
+        post.return_value.json.side_effect = ValueError("Expecting value")
+        project_updates = MopedProjectUpdates()
+        project_updates.add(project_id=1, timestamp="2021-01-19T21:27:10.223965Z")
+
+        with pytest.raises(ValueError):
+            project_updates.save()
+        assert len(project_updates) == 1
+
+    def test_state_is_not_shared(self) -> None:
+        first, second = MopedProjectUpdates(), MopedProjectUpdates()
+        first.add(project_id=1, timestamp="2021-01-19T21:27:10.223965Z")
+        assert len(second) == 0
+        assert "pending_updates" not in vars(MopedProjectUpdates)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import pytest
+
+from record_data import build_record_data, get_old_state, get_snapshot_digest
+
+from .helpers import *
+
+
+class TestRecordData:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.event_insert = load_json_file("tests/moped_project/dummy_event_insert.json")
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+        cls.event_insert = None
+
+    def test_full(self) -> None:
+        assert build_record_data(self.event_update, policy="full") is self.event_update
+
+    def test_invalid_policy(self) -> None:
+        with pytest.raises(ValueError):
+            build_record_data(self.event_update, policy="everything")
+
+    def test_new(self) -> None:
+        record_data = build_record_data(self.event_update, policy="new")
+        assert record_data["event"]["data"]["old"] is None
+        assert record_data["event"]["data"]["new"] == self.event_update["event"]["data"]["new"]
+        assert record_data["record_data_policy"] == "new"
+        assert record_data["id"] == self.event_update["id"]
+
+    def test_diff(self) -> None:
+        record_data = build_record_data(self.event_update, policy="diff")
+        new_state = record_data["event"]["data"]["new"]
+        old_state = record_data["event"]["data"]["old"]
+        assert new_state == self.event_update["event"]["data"]["new"]
+        assert old_state == {"project_priority": "Low", "project_name": "Project name old state"}
+        # The old state can be rebuilt from the new one
+        assert get_old_state(record_data) == self.event_update["event"]["data"]["old"]
+        # The original payload is left untouched
+        assert len(self.event_update["event"]["data"]["old"]) > 2
+
+    def test_diff_added_and_removed_columns(self) -> None:
+        payload = {
+            "event": {
+                "op": "UPDATE",
+                "data": {
+                    "old": {"project_id": 1, "project_name": "a", "removed": "x"},
+                    "new": {"project_id": 1, "project_name": "b", "added": "y"},
+                },
+            },
+        }
+        record_data = build_record_data(payload, policy="diff")
+        assert record_data["event"]["data"]["old"] == {"project_name": "a", "removed": "x"}
+        assert record_data["added_columns"] == ["added"]
+        assert get_old_state(record_data) == payload["event"]["data"]["old"]
+
+        record_data = build_record_data(payload, policy="snapshot", save_snapshot=lambda digest, body: {"sha256": digest})
+        assert get_old_state(record_data, new_state=payload["event"]["data"]["new"]) == payload["event"]["data"]["old"]
+
+        # Without added columns, the key is left out
+        assert "added_columns" not in build_record_data(self.event_update, policy="diff")
+        assert get_old_state(build_record_data(self.event_update, policy="full")) == self.event_update["event"]["data"]["old"]
+
+    def test_diff_insert(self) -> None:
+        record_data = build_record_data(self.event_insert, policy="diff")
+        assert record_data["event"]["data"]["old"] is None
+        assert record_data["event"]["data"]["new"] == self.event_insert["event"]["data"]["new"]
+
+    def test_excluded_columns(self) -> None:
+        record_data = build_record_data(self.event_update, policy="full", excluded_columns=["project_description"])
+        assert "project_description" not in record_data["event"]["data"]["new"]
+        assert "project_description" not in record_data["event"]["data"]["old"]
+        assert record_data["excluded_columns"] == ["project_description"]
+
+    def test_snapshot(self) -> None:
+        snapshots = {}
+
+        def save_snapshot(digest: str, body: bytes) -> dict:
+            snapshots[digest] = body
+            return {"key": digest}
+
+        record_data = build_record_data(self.event_update, policy="snapshot", save_snapshot=save_snapshot)
+        digest, body = get_snapshot_digest(self.event_update["event"]["data"]["new"])
+        assert snapshots == {digest: body}
+        assert record_data["snapshot"] == {"key": digest}
+        assert record_data["event"]["data"]["new"] is None
+        assert record_data["event"]["data"]["old"]["project_priority"] == "Low"
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import io
+import copy
+import uuid
+
+import pytest
+from pytest_mock import MockerFixture
+
+import replay
+from MopedEvent import MopedEvent
+from MopedProjectUpdates import MopedProjectUpdates
+
+from .helpers import *
+
+PRIMARY_KEY_MAP = {"moped_project": "project_id"}
+
+
+class TestReplay:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.event_update = None
+
+    def create_events(self, count: int) -> list:
+        events = []
+        for _ in range(count):
+            event = copy.deepcopy(self.event_update)
+            event["id"] = str(uuid.uuid4())
+            events.append(event)
+        return events
+
+    @pytest.fixture(autouse=True)
+    def stub_hasura(self, mocker: MockerFixture) -> None:
+        self.batches = []
+
+        def request_batch(objects: list, headers: dict = {}) -> dict:
+            self.batches.append(objects)
+            return {"data": {"insert_moped_activity_log": {"affected_rows": len(objects)}}}
+
+        mocker.patch.object(MopedEvent, "request_batch", side_effect=request_batch)
+        mocker.patch.object(MopedProjectUpdates, "save", return_value={})
+
+    def test_get_insert_object(self) -> None:
+        moped_event = MopedEvent(self.event_update, load_primary_keys=False)
+        moped_event.MOPED_PRIMARY_KEY_MAP = PRIMARY_KEY_MAP
+        insert_object = moped_event.get_insert_object()
+        assert insert_object["record_id"] == 1
+        assert insert_object["record_type"] == "moped_project"
+        assert insert_object["event_id"] == self.event_update["id"]
+        assert insert_object["created_at"] == self.event_update["created_at"]
+        assert len(insert_object["description"]) == 2
+
+    def test_read_payloads(self, tmp_path) -> None:
+        events = self.create_events(3)
+        jsonl = tmp_path / "events.jsonl"
+        jsonl.write_text(
+            json.dumps(events[0]) + "\n\n" + json.dumps({"body": json.dumps(events[1])}) + "\n"
+        )
+        dlq = tmp_path / "dlq.json"
+        dlq.write_text(json.dumps({"Messages": [{"MessageId": "1", "Body": json.dumps(events[2])}]}))
+
+        payloads = list(replay.read_all_payloads([str(jsonl), str(dlq)]))
+        assert payloads == events
+
+    def test_replay(self, tmp_path) -> None:
+        events = self.create_events(25)
+        invalid = {"id": "not-an-event"}
+        path = tmp_path / "events.jsonl"
+        path.write_text("\n".join(json.dumps(event) for event in events[:10] + [invalid] + events[10:]))
+        output = io.StringIO()
+
+        summary = replay.replay(
+            [str(path)], batch_size=10, primary_key_map=PRIMARY_KEY_MAP, output=output, report=io.StringIO()
+        )
+        assert summary["processed"] == 26
+        assert summary["inserted"] == 25
+        assert summary["errors"] == 1
+        assert [len(batch) for batch in self.batches] == [10, 9, 6]
+        assert json.loads(output.getvalue())["event_id"] == "not-an-event"
+
+    def test_replay_process_pool(self, tmp_path) -> None:
+        events = self.create_events(20)
+        path = tmp_path / "events.jsonl"
+        path.write_text("\n".join(json.dumps(event) for event in events))
+
+        summary = replay.replay([str(path)], batch_size=3, workers=2, primary_key_map=PRIMARY_KEY_MAP)
+        assert summary["inserted"] == 20
+        assert [obj["event_id"] for batch in self.batches for obj in batch] == [event["id"] for event in events]
+
+    def test_replay_checkpoint(self, tmp_path) -> None:
+        events = self.create_events(12)
+        path = tmp_path / "events.jsonl"
+        path.write_text("\n".join(json.dumps(event) for event in events))
+        checkpoint = str(tmp_path / "replay.checkpoint")
+        replay.write_checkpoint(checkpoint, [str(path)], 5)
+
+        summary = replay.replay([str(path)], batch_size=4, checkpoint=checkpoint, primary_key_map=PRIMARY_KEY_MAP)
+        assert summary["skipped"] == 5
+        assert summary["processed"] == 7
+        assert self.batches[0][0]["event_id"] == events[5]["id"]
+        assert replay.read_checkpoint(checkpoint, [str(path)]) == 12
+
+        with pytest.raises(ValueError):
+            replay.read_checkpoint(checkpoint, ["other.jsonl"])
+
+    def test_replay_dry_run(self, tmp_path) -> None:
+        path = tmp_path / "events.jsonl"
+        path.write_text(json.dumps(self.event_update))
+        output = io.StringIO()
+
+        summary = replay.replay([str(path)], dry_run=True, primary_key_map=PRIMARY_KEY_MAP, output=output)
+        assert summary["inserted"] == 0
+        assert self.batches == []
+        diff = json.loads(output.getvalue())
+        assert diff["record_id"] == 1
+        assert [change["field"] for change in diff["description"]] == ["project_priority", "project_name"]
+
+    def test_replay_dry_run_saves_no_snapshot(self, tmp_path, mocker: MockerFixture) -> None:
+        path = tmp_path / "events.jsonl"
+        path.write_text(json.dumps(self.event_update))
+        mocker.patch("MopedEvent.ACTIVITY_LOG_RECORD_DATA_POLICY", "snapshot")
+        save_snapshot = mocker.patch.object(MopedEvent, "save_snapshot")
+
+        summary = replay.replay([str(path)], dry_run=True, primary_key_map=PRIMARY_KEY_MAP, output=io.StringIO())
+        assert summary["errors"] == 0
+        assert save_snapshot.call_count == 0
+
+    def test_replay_malformed_line(self, tmp_path) -> None:
+        events = self.create_events(3)
+        path = tmp_path / "events.jsonl"
+        path.write_text(json.dumps(events[0]) + "\n" + json.dumps(events[1])[:40] + "\n" + json.dumps(events[2]))
+        checkpoint = str(tmp_path / "replay.checkpoint")
+        output = io.StringIO()
+
+        summary = replay.replay(
+            [str(path)], batch_size=10, checkpoint=checkpoint, primary_key_map=PRIMARY_KEY_MAP, output=output
+        )
+        assert summary["processed"] == 3
+        assert summary["inserted"] == 2
+        assert summary["errors"] == 1
+        assert f"{path}:2" in json.loads(output.getvalue())["error"]
+        assert replay.read_checkpoint(checkpoint, [str(path)]) == 3
+
+    def test_replay_project_update_errors(self, tmp_path, mocker: MockerFixture) -> None:
+        events = self.create_events(4)
+        path = tmp_path / "events.jsonl"
+        path.write_text("\n".join(json.dumps(event) for event in events))
+        primary_keys = tmp_path / "primary_keys.json"
+        primary_keys.write_text(json.dumps(PRIMARY_KEY_MAP))
+        args = [str(path), "--workers", "1", "--batch-size", "2", "--primary-keys", str(primary_keys)]
+
+        # The real save, against a Hasura that denies the mutation
+        mocker.stopall()
+        mocker.patch.object(MopedEvent, "request_batch", side_effect=lambda objects, headers={}: {
+            "data": {"insert_moped_activity_log": {"affected_rows": len(objects)}}
+        })
+        post = mocker.patch("requests.post", autospec=True)
+        post.return_value.json.return_value = {"errors": [{"message": "denied"}]}
+        output = io.StringIO()
+        summary = replay.replay(
+            [str(path)], batch_size=2, primary_key_map=PRIMARY_KEY_MAP, output=output, report=io.StringIO()
+        )
+        # One failed request per batch, and the final flush
+        assert summary["project_update_errors"] == 3
+        assert summary["pending_project_updates"] == 1
+        assert "denied" in output.getvalue().splitlines()[0]
+
+        with pytest.raises(SystemExit) as exit_info:
+            replay.main(args)
+        assert exit_info.value.code == 1
+
+        post.return_value.json.return_value = {"data": {}}
+        summary = replay.main(args)
+        assert summary["project_update_errors"] == 0
+        assert summary["pending_project_updates"] == 0
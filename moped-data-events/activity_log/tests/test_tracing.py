@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import time
+import pytest
+from pytest_mock import MockerFixture
+
+import MopedEvent as MopedEventModule
+import app
+import async_app
+import tracing
+from tracing import parse_traceparent, get_record_parent, start_span
+from benchmarks.stub_hasura import StubHasuraServer
+
+from .helpers import *
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+SPAN_ID = "00f067aa0ba902b7"
+
+
+class TestTracing:
+    @classmethod
+    def setup_class(cls) -> None:
+        cls.event_update = load_json_file("tests/moped_project/dummy_event_update.json")
+        cls.server = StubHasuraServer().start()
+
+    @classmethod
+    def teardown_class(cls) -> None:
+        cls.server.stop()
+
+    @pytest.fixture
+    def spans_file(self, mocker: MockerFixture, tmp_path) -> str:
+        path = str(tmp_path / "spans.jsonl")
+        mocker.patch.object(tracing, "ACTIVITY_LOG_TRACING_EXPORTER", "file")
+        mocker.patch.object(tracing, "ACTIVITY_LOG_TRACING_FILE", path)
+        return path
+
+    @staticmethod
+    def read_spans(path: str) -> dict:
+        with open(path) as file:
+            return {span["name"]: span for span in [json.loads(line)["span"] for line in file]}
+
+    def test_parse_traceparent(self) -> None:
+        assert parse_traceparent(f"00-{TRACE_ID}-{SPAN_ID}-01") == (TRACE_ID, SPAN_ID)
+        assert parse_traceparent(f"00-{TRACE_ID.upper()}-{SPAN_ID}-00") == (TRACE_ID, SPAN_ID)
+        assert parse_traceparent(f"00-{'0' * 32}-{SPAN_ID}-01") is None
+        assert parse_traceparent("00-abc-def-01") is None
+        assert parse_traceparent(None) is None
+
+    def test_record_parent(self) -> None:
+        record = {"messageAttributes": {"traceparent": {"stringValue": f"00-{TRACE_ID}-{SPAN_ID}-01"}}}
+        assert get_record_parent(record, self.event_update) == (TRACE_ID, SPAN_ID)
+        # Without the message attribute, the trace of the Hasura event
+        assert get_record_parent({}, self.event_update) == (
+            f"{11127784579935739002:032x}", f"{17956528671663401255:016x}"
+        )
+        assert get_record_parent({}, {}) is None
+
+    def test_nested_spans(self, spans_file: str) -> None:
+        with start_span("parent", parent=(TRACE_ID, SPAN_ID)) as parent:
+            with start_span("child") as child:
+                pass
+        assert child.trace_id == TRACE_ID
+        assert child.parent_span_id == parent.span_id
+        assert parent.parent_span_id == SPAN_ID
+        assert tracing.CURRENT_SPAN.get() is None
+        assert set(self.read_spans(spans_file)) == {"parent", "child"}
+
+    def test_exporter_off(self, mocker: MockerFixture, tmp_path) -> None:
+        mocker.patch.object(tracing, "ACTIVITY_LOG_TRACING_FILE", str(tmp_path / "spans.jsonl"))
+        with start_span("ignored"):
+            pass
+        assert not (tmp_path / "spans.jsonl").exists()
+
+    def test_handler_spans(self, mocker: MockerFixture, spans_file: str) -> None:
+        mocker.patch.object(MopedEventModule, "HASURA_ENDPOINT", self.server.url)
+        mocker.patch.object(MopedEventModule, "PRIMARY_KEY_MAP_CACHE", ({"moped_project": "project_id"}, float("inf")))
+        mocker.patch.object(async_app, "save_project_updates", autospec=True)
+        app.seen_event_ids.clear()
+
+        record = {
+            "messageId": "1",
+            "body": json.dumps(self.event_update),
+            "attributes": {"SentTimestamp": str(int(time.time() * 1000) - 10000)},
+            "messageAttributes": {
+                "traceparent": {"stringValue": f"00-{TRACE_ID}-{SPAN_ID}-01", "dataType": "String"}
+            },
+        }
+        context = type("Context", (), {"function_name": "test", "aws_request_id": "test"})
+        async_app.handler({"Records": [record]}, context)
+
+        spans = self.read_spans(spans_file)
+        assert {span["traceId"] for span in spans.values()} == {TRACE_ID}
+        assert spans["sqs_queue"]["parentSpanId"] == SPAN_ID
+        assert spans["sqs_queue"]["durationMs"] >= 10000
+        assert spans["process_event"]["parentSpanId"] == SPAN_ID
+        assert spans["hasura_mutation"]["parentSpanId"] == spans["process_event"]["spanId"]
+        assert spans["process_event"]["attributes"]["hasura.event_id"] == self.event_update["id"]
@@ -0,0 +1,285 @@
+#
+# Activity Log Tracing
+#
+#   OpenTelemetry-compatible spans, without the OpenTelemetry SDK. A trace
+# starts with the Hasura event (trace_context), continues in the moped-api
+# events_process endpoint, travels through SQS in the W3C `traceparent`
+# message attribute, and ends around the activity log mutation:
+#
+#   hasura_delivery (moped-api)   Hasura event created -> events_process
+#   events_process  (moped-api)   payload -> SQS
+#   sqs_queue                     sent to SQS -> received by the Lambda
+#   process_event                 validation, diff and save
+#     hasura_mutation             the insert into moped_activity_log
+#
+#   Span ids are always generated, so the trace is propagated even when
+# nothing is exported. ACTIVITY_LOG_TRACING_EXPORTER selects the exporter:
+# off (default), log (a JSON line per span in CloudWatch) or file (JSON Lines
+# appended to ACTIVITY_LOG_TRACING_FILE). Spans use the OTLP/JSON field names.
+#
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import (
+    ACTIVITY_LOG_TRACING_EXPORTER,
+    ACTIVITY_LOG_TRACING_FILE,
+    ACTIVITY_LOG_TRACING_SERVICE_NAME,
+)
+
+TRACING_EXPORTERS = ["off", "log", "file"]
+
+# The span of the code being run, the parent of any new span
+CURRENT_SPAN = ContextVar("CURRENT_SPAN", default=None)
+
+# Serializes the writes of the file exporter
+EXPORT_LOCK = threading.Lock()
+
+
+class Span:
+    """
+    A single timed operation of a trace, ids are lowercase hex strings
+    """
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str = None, attributes: dict = None,
+                 start_time: int = None):
+        """
+        Constructor for the span
+        :param name: The name of the operation
+        :type name: str
+        :param trace_id: The id of the trace, 32 hex characters
+        :type trace_id: str
+        :param parent_span_id: The id of the parent span, 16 hex characters
+        :type parent_span_id: str
+        :param attributes: Any attributes of the operation
+        :type attributes: dict
+        :param start_time: The start time, in nanoseconds since the epoch, default: now
+        :type start_time: int
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_span_id = parent_span_id
+        self.attributes = dict(attributes or {})
+        self.start_time = start_time if start_time is not None else time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def get_traceparent(self) -> str:
+        """
+        Returns the W3C traceparent header of this span
+        :return: The traceparent, ie. 00-<trace id>-<span id>-01
+        :rtype: str
+        """
+        return format_traceparent(self.trace_id, self.span_id)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the span in OTLP/JSON form
+        :return: The span
+        :rtype: dict
+        """
+        return {
+            "resource": {"service.name": ACTIVITY_LOG_TRACING_SERVICE_NAME},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_time,
+            "endTimeUnixNano": self.end_time,
+            "durationMs": round((self.end_time - self.start_time) / 1e6, 3) if self.end_time else None,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+def new_trace_id() -> str:
+    """
+    Returns a random trace id
+    :return: 32 hex characters
+    :rtype: str
+    """
+    return os.urandom(16).hex()
+
+
+def new_span_id() -> str:
+    """
+    Returns a random span id
+    :return: 16 hex characters
+    :rtype: str
+    """
+    return os.urandom(8).hex()
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    """
+    Returns a W3C traceparent header, always sampled
+    :param trace_id: 32 hex characters
+    :type trace_id: str
+    :param span_id: 16 hex characters
+    :type span_id: str
+    :return: The traceparent
+    :rtype: str
+    """
+    return f"00-{trace_id}-{span_id}-01"
+
+
+def parse_traceparent(traceparent: str):
+    """
+    Returns the trace and parent span ids of a W3C traceparent header
+    :param traceparent: The traceparent, ie. 00-<trace id>-<span id>-01
+    :type traceparent: str
+    :return: A (trace id, span id) tuple, None if the header is not valid
+    :rtype: tuple
+    """
+    try:
+        version, trace_id, span_id, flags = traceparent.strip().lower().split("-")
+        int(trace_id, 16), int(span_id, 16)
+    except (AttributeError, ValueError):
+        return None
+    if len(trace_id) != 32 or len(span_id) != 16 or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id
+
+
+def get_hasura_parent(payload: dict):
+    """
+    Returns the trace of a Hasura event. Hasura sends 64-bit integers, they
+    become the lower half of a 128-bit trace id.
+    :param payload: The Hasura payload
+    :type payload: dict
+    :return: A (trace id, span id) tuple, None if the event has no trace context
+    :rtype: tuple
+    """
+    try:
+        trace_context = payload["event"]["trace_context"]
+        return f"{int(trace_context['trace_id']):032x}", f"{int(trace_context['span_id']):016x}"
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def get_record_parent(record: dict, payload: dict = None):
+    """
+    Returns the trace an SQS record belongs to: its traceparent message
+    attribute, or else the trace context of its Hasura event
+    :param record: The SQS record
+    :type record: dict
+    :param payload: The Hasura payload of the record
+    :type payload: dict
+    :return: A (trace id, span id) tuple, None if there is no trace
+    :rtype: tuple
+    """
+    attribute = (record.get("messageAttributes", None) or {}).get("traceparent", None) or {}
+    parent = parse_traceparent(attribute.get("stringValue", None))
+    if parent is None and payload is not None:
+        parent = get_hasura_parent(payload)
+    return parent
+
+
+def export_span(span: Span, exporter: str = None) -> None:
+    """
+    Writes a finished span with the configured exporter, errors are only printed
+    :param span: The finished span
+    :type span: Span
+    :param exporter: off, log or file, default: ACTIVITY_LOG_TRACING_EXPORTER
+    :type exporter: str
+    """
+    exporter = exporter or ACTIVITY_LOG_TRACING_EXPORTER
+    if exporter == "off":
+        return
+
+    try:
+        line = json.dumps({"span": span.to_dict()}, default=str)
+        if exporter == "file":
+            with EXPORT_LOCK:
+                with open(ACTIVITY_LOG_TRACING_FILE, "a") as file:
+                    file.write(line + "\n")
+        else:
+            print(line)
+    except Exception as e:
+        print(f"Could not export span {span.name}: {str(e)}")
+
+
+@contextmanager
+def start_span(name: str, parent: tuple = None, attributes: dict = None):
+    """
+    Runs a block in a new span, child of the given parent or of the current span
+    :param name: The name of the operation
+    :type name: str
+    :param parent: A (trace id, span id) tuple, default: the current span, or a new trace
+    :type parent: tuple
+    :param attributes: Any attributes of the operation
+    :type attributes: dict
+    :return: The span, attributes can be added to it
+    """
+    if parent is None:
+        current = CURRENT_SPAN.get()
+        parent = (current.trace_id, current.span_id) if current is not None else (new_trace_id(), None)
+
+    span = Span(name, trace_id=parent[0], parent_span_id=parent[1], attributes=attributes)
+    token = CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.error = str(e)
+        raise
+    finally:
+        span.end_time = time.time_ns()
+        CURRENT_SPAN.reset(token)
+        export_span(span)
+
+
+def record_span(name: str, parent: tuple, start_time: int, end_time: int, attributes: dict = None) -> Span:
+    """
+    Exports a span of an operation that was not measured here, ie. the time in the queue
+    :param name: The name of the operation
+    :type name: str
+    :param parent: A (trace id, span id) tuple
+    :type parent: tuple
+    :param start_time: The start time, in nanoseconds since the epoch
+    :type start_time: int
+    :param end_time: The end time, in nanoseconds since the epoch
+    :type end_time: int
+    :param attributes: Any attributes of the operation
+    :type attributes: dict
+    :return: The exported span
+    :rtype: Span
+    """
+    span = Span(name, trace_id=parent[0], parent_span_id=parent[1], attributes=attributes, start_time=start_time)
+    span.end_time = end_time
+    export_span(span)
+    return span
+
+
+@contextmanager
+def trace_record(record: dict, payload: dict):
+    """
+    Runs the processing of an SQS record in a process_event span of the trace
+    of its event, preceded by a sqs_queue span for the time the message waited in SQS
+    :param record: The SQS record
+    :type record: dict
+    :param payload: The Hasura payload of the record
+    :type payload: dict
+    :return: The process_event span
+    """
+    parent = get_record_parent(record, payload) or (new_trace_id(), None)
+    attributes = {
+        "hasura.event_id": payload.get("id", None) if isinstance(payload, dict) else None,
+        "messaging.message_id": record.get("messageId", None),
+    }
+
+    sent_timestamp = (record.get("attributes", None) or {}).get("SentTimestamp", None)
+    if sent_timestamp is not None:
+        record_span(
+            "sqs_queue",
+            parent=parent,
+            start_time=int(sent_timestamp) * 1000000,
+            end_time=time.time_ns(),
+            attributes=attributes,
+        )
+
+    with start_span("process_event", parent=parent, attributes=attributes) as span:
+        yield span
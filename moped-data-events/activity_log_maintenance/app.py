@@ -0,0 +1,48 @@
+#
+# Activity Log Maintenance Handler
+#
+#   Runs on a schedule (CloudWatch Events), it keeps the monthly
+# partitions of moped_activity_log ahead of time and, if enabled,
+# moves old rows to the cold archive, then drops or detaches the
+# old partitions.
+#
+import json
+import logging
+
+from config import (
+    ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS,
+    ACTIVITY_LOG_ARCHIVE_SINK,
+)
+from archive import archive_activity_log, get_archive_horizon
+from partitions import create_future_partitions, detach_old_partitions
+from sinks import get_sink
+
+# Initialize our logger
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def handler(event, context):
+    """
+    Maintenance entry point, every invocation is a maintenance run
+    :param dict event: The scheduled event
+    :param dict context: Event context
+    """
+    logger.info(f"Function: {context.function_name}")
+    logger.info(f"Request ID: {context.aws_request_id}")
+
+    partitions = {"created": create_future_partitions()}
+    result = {"partitions": partitions}
+
+    if ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS > 0:
+        result["archive"] = archive_activity_log(
+            get_sink(ACTIVITY_LOG_ARCHIVE_SINK),
+            before=get_archive_horizon(ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS),
+        )
+        logger.info(f"Archive: {json.dumps(result['archive'])}")
+
+    # After the archive, so the partitions it emptied are dropped instead of detached
+    partitions.update(detach_old_partitions())
+    logger.info(f"Partitions: {json.dumps(partitions)}")
+
+    return result
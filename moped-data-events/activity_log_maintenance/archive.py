@@ -0,0 +1,408 @@
+#
+# Cold archive of moped_activity_log
+#
+#   Rows older than a horizon are read in keyset order (created_at, activity_id),
+# one chunk at a time. Every chunk is written as a gzipped JSON Lines file named
+# after the sha256 of its contents, and only then deleted from the table in its
+# own transaction. Memory use is bounded by the chunk size, not the table size.
+#
+#   python archive.py archive --sink s3://bucket/prefix --months 24
+#   python archive.py restore --sink s3://bucket/prefix --prefix 2019/07
+#
+import os
+import gzip
+import json
+import hashlib
+import argparse
+import datetime
+from typing import Iterator
+
+from config import (
+    ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS,
+    ACTIVITY_LOG_ARCHIVE_SINK,
+    ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE,
+    ACTIVITY_LOG_ARCHIVE_MAX_CHUNKS,
+)
+from hasura import run_query
+from partitions import add_months, get_month_start
+from sinks import get_sink
+
+ARCHIVE_COLUMNS = [
+    "activity_id",
+    "created_at",
+    "record_id",
+    "record_type",
+    "record_project_id",
+    "operation_type",
+    "updated_by",
+    "event_id",
+    "description",
+    "record_data",
+]
+
+GRAPHQL_ARCHIVE_CHUNK = """
+    query ArchiveActivityLogChunk($where: moped_activity_log_bool_exp!, $limit: Int!) {
+      moped_activity_log(
+        where: $where,
+        order_by: [{created_at: asc}, {activity_id: asc}],
+        limit: $limit
+      ) {
+        %s
+      }
+    }
+""" % "\n        ".join(ARCHIVE_COLUMNS)
+
+GRAPHQL_DELETE_CHUNK = """
+    mutation DeleteActivityLogChunk($activityIds: [uuid!]!, $from: timestamptz!, $to: timestamptz!) {
+      delete_moped_activity_log(
+        where: {activity_id: {_in: $activityIds}, created_at: {_gte: $from, _lte: $to}}
+      ) {
+        affected_rows
+      }
+    }
+"""
+
+GRAPHQL_RESTORE_CHUNK = """
+    mutation RestoreActivityLogChunk($objects: [moped_activity_log_insert_input!]!) {
+      insert_moped_activity_log(
+        objects: $objects,
+        on_conflict: {constraint: moped_activity_log_pk, update_columns: []}
+      ) {
+        affected_rows
+      }
+    }
+"""
+
+
+GRAPHQL_EXISTING_EVENTS = """
+    query ExistingActivityLogEvents($eventIds: [uuid!]!) {
+      moped_activity_log(where: {event_id: {_in: $eventIds}}) {
+        event_id
+      }
+    }
+"""
+
+
+def get_archive_horizon(months: int, today: datetime.date = None) -> str:
+    """
+    Returns the timestamp before which rows are archived, the start of a month (UTC)
+    :param months: The number of whole months to keep
+    :type months: int
+    :param today: The current date, default: today (UTC)
+    :type today: datetime.date
+    :return: The ISO timestamp of the horizon
+    :rtype: str
+    """
+    month = add_months(get_month_start(today or datetime.datetime.utcnow().date()), -months)
+    return f"{month.isoformat()}T00:00:00+00:00"
+
+
+def get_chunk_where(before: str, cursor: dict = None) -> dict:
+    """
+    Returns the filter of the next chunk, rows after the last row of the previous chunk
+    :param before: The archive horizon
+    :type before: str
+    :param cursor: The last row of the previous chunk, None for the first chunk
+    :type cursor: dict
+    :return: The moped_activity_log_bool_exp
+    :rtype: dict
+    """
+    where = {"created_at": {"_lt": before}}
+    if cursor is None:
+        return where
+
+    return {
+        "_and": [
+            where,
+            {
+                "_or": [
+                    {"created_at": {"_gt": cursor["created_at"]}},
+                    {
+                        "created_at": {"_eq": cursor["created_at"]},
+                        "activity_id": {"_gt": cursor["activity_id"]},
+                    },
+                ]
+            },
+        ]
+    }
+
+
+def fetch_chunk(before: str, cursor: dict = None, limit: int = ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE) -> list:
+    """
+    Reads the next chunk of rows older than the horizon
+    :param before: The archive horizon
+    :type before: str
+    :param cursor: The last row of the previous chunk
+    :type cursor: dict
+    :param limit: The chunk size
+    :type limit: int
+    :return: The rows, in keyset order
+    :rtype: list
+    """
+    data = run_query(GRAPHQL_ARCHIVE_CHUNK, {"where": get_chunk_where(before, cursor), "limit": limit})
+    return data["moped_activity_log"]
+
+
+def serialize_chunk(rows: list) -> (str, bytes):
+    """
+    Serializes rows as gzipped JSON Lines. The digest is the sha256 of the
+    uncompressed lines, the gzip header has no timestamp so the same rows
+    always produce the same file.
+    :param rows: The rows of the chunk
+    :type rows: list
+    :return: A tuple with the sha256 hex digest and the compressed file
+    :rtype: tuple
+    """
+    body = "".join(
+        json.dumps(row, sort_keys=True, separators=(",", ":")) + "\n" for row in rows
+    ).encode("utf-8")
+    return hashlib.sha256(body).hexdigest(), gzip.compress(body, mtime=0)
+
+
+def get_chunk_key(rows: list, digest: str) -> str:
+    """
+    Returns the archive key of a chunk, grouped by the month of its first row
+    :param rows: The rows of the chunk
+    :type rows: list
+    :param digest: The sha256 of the chunk
+    :type digest: str
+    :return: The key, ie. 2019/07/<sha256>.jsonl.gz
+    :rtype: str
+    """
+    created_at = rows[0]["created_at"]
+    return f"{created_at[0:4]}/{created_at[5:7]}/{digest}.jsonl.gz"
+
+
+def get_key_digest(key: str) -> str:
+    """
+    Returns the sha256 a file was named after
+    :param key: The archive key
+    :type key: str
+    :return: The sha256 hex digest
+    :rtype: str
+    """
+    return os.path.basename(key)[:-len(".jsonl.gz")]
+
+
+def delete_chunk(rows: list) -> int:
+    """
+    Deletes the rows of an archived chunk in a single transaction
+    :param rows: The rows of the chunk, in keyset order
+    :type rows: list
+    :return: The number of deleted rows
+    :rtype: int
+    """
+    data = run_query(
+        GRAPHQL_DELETE_CHUNK,
+        {
+            "activityIds": [row["activity_id"] for row in rows],
+            "from": rows[0]["created_at"],
+            "to": rows[-1]["created_at"],
+        }
+    )
+    return data["delete_moped_activity_log"]["affected_rows"]
+
+
+def archive_activity_log(
+    sink,
+    before: str,
+    chunk_size: int = ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE,
+    max_chunks: int = ACTIVITY_LOG_ARCHIVE_MAX_CHUNKS,
+    delete: bool = True,
+) -> dict:
+    """
+    Archives the rows older than the horizon, one chunk at a time. A chunk is
+    only deleted once its file is written; if a run stops in between, the next
+    run reads the same rows and overwrites the same file.
+    :param sink: Where the files are written
+    :type sink: LocalSink or S3Sink
+    :param before: The archive horizon
+    :type before: str
+    :param chunk_size: Rows per file and per delete transaction
+    :type chunk_size: int
+    :param max_chunks: The maximum number of chunks in this run, 0 for no limit
+    :type max_chunks: int
+    :param delete: Deletes the archived rows, False only writes the files
+    :type delete: bool
+    :return: The files written, the number of archived and deleted rows
+    :rtype: dict
+    """
+    files = []
+    archived = 0
+    deleted = 0
+    cursor = None
+
+    while max_chunks <= 0 or len(files) < max_chunks:
+        rows = fetch_chunk(before, cursor=cursor, limit=chunk_size)
+        if len(rows) == 0:
+            break
+
+        digest, body = serialize_chunk(rows)
+        files.append(sink.write(get_chunk_key(rows, digest), body))
+        archived += len(rows)
+
+        if delete:
+            deleted += delete_chunk(rows)
+
+        cursor = rows[-1]
+        if len(rows) < chunk_size:
+            break
+
+    return {"files": files, "archived": archived, "deleted": deleted}
+
+
+def read_archive(sink, key: str) -> Iterator[dict]:
+    """
+    Streams the rows of an archive file
+    :param sink: Where the file is stored
+    :type sink: LocalSink or S3Sink
+    :param key: The archive key
+    :type key: str
+    :return: The rows, one at a time
+    :rtype: Iterator[dict]
+    """
+    with gzip.GzipFile(fileobj=sink.open(key), mode="rb") as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def verify_archive(sink, key: str) -> int:
+    """
+    Checks that a file still matches the sha256 it was named after
+    :param sink: Where the file is stored
+    :type sink: LocalSink or S3Sink
+    :param key: The archive key
+    :type key: str
+    :return: The number of rows in the file
+    :rtype: int
+    """
+    sha256 = hashlib.sha256()
+    count = 0
+    with gzip.GzipFile(fileobj=sink.open(key), mode="rb") as file:
+        for line in file:
+            sha256.update(line)
+            count += 1
+
+    if sha256.hexdigest() != get_key_digest(key):
+        raise ValueError(f"Archive file does not match its digest: {key}")
+
+    return count
+
+
+def get_new_events(rows: list) -> list:
+    """
+    Returns the rows whose event is not logged yet. The insert can only skip
+    conflicts on moped_activity_log_pk, but (event_id, created_at) is unique
+    too: a single row with an event that is already logged would fail the
+    whole chunk. Rows without an event id are always kept.
+    :param rows: The archived rows
+    :type rows: list
+    :return: The rows to insert, at most one per event id
+    :rtype: list
+    """
+    event_ids = list({row["event_id"] for row in rows if row.get("event_id", None)})
+    if len(event_ids) == 0:
+        return rows
+
+    data = run_query(GRAPHQL_EXISTING_EVENTS, {"eventIds": event_ids})
+    seen = {row["event_id"] for row in data["moped_activity_log"]}
+    new_rows = []
+    for row in rows:
+        event_id = row.get("event_id", None)
+        if event_id in seen:
+            continue
+        if event_id:
+            seen.add(event_id)
+        new_rows.append(row)
+    return new_rows
+
+
+def restore_chunk(rows: list) -> int:
+    """
+    Inserts archived rows back, rows or events that already exist are left untouched
+    :param rows: The archived rows
+    :type rows: list
+    :return: The number of inserted rows
+    :rtype: int
+    """
+    rows = get_new_events(rows)
+    if len(rows) == 0:
+        return 0
+
+    data = run_query(GRAPHQL_RESTORE_CHUNK, {"objects": rows})
+    return data["insert_moped_activity_log"]["affected_rows"]
+
+
+def restore_activity_log(sink, prefix: str = "", chunk_size: int = ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE) -> dict:
+    """
+    Restores archive files into moped_activity_log. Every file is verified
+    before any of its rows is inserted, restoring twice is harmless.
+    :param sink: Where the files are stored
+    :type sink: LocalSink or S3Sink
+    :param prefix: Only the files whose key starts with this prefix (ie. 2019/07)
+    :type prefix: str
+    :param chunk_size: Rows per insert transaction
+    :type chunk_size: int
+    :return: The files read, the number of archived and restored rows
+    :rtype: dict
+    """
+    files = []
+    archived = 0
+    restored = 0
+
+    for key in sink.list(prefix):
+        archived += verify_archive(sink, key)
+        rows = []
+        for row in read_archive(sink, key):
+            rows.append(row)
+            if len(rows) == chunk_size:
+                restored += restore_chunk(rows)
+                rows = []
+        if len(rows) > 0:
+            restored += restore_chunk(rows)
+        files.append(key)
+
+    return {"files": files, "archived": archived, "restored": restored}
+
+
+def main(args: list = None) -> dict:
+    """
+    Command line entry point
+    :param args: The command line arguments, default: sys.argv
+    :type args: list
+    :return: The result of the command
+    :rtype: dict
+    """
+    parser = argparse.ArgumentParser(description="Archives and restores moped_activity_log")
+    parser.add_argument("--sink", default=ACTIVITY_LOG_ARCHIVE_SINK, help="s3://bucket/prefix or a directory")
+    parser.add_argument("--chunk-size", type=int, default=ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = commands.add_parser("archive", help="Archives and deletes old rows")
+    archive_parser.add_argument("--months", type=int, default=ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS,
+                                help="Whole months to keep")
+    archive_parser.add_argument("--max-chunks", type=int, default=0, help="0 for no limit")
+    archive_parser.add_argument("--keep-rows", action="store_true", help="Writes the files without deleting")
+
+    restore_parser = commands.add_parser("restore", help="Restores archived rows")
+    restore_parser.add_argument("--prefix", default="", help="ie. 2019/07")
+
+    options = parser.parse_args(args)
+    sink = get_sink(options.sink)
+
+    if options.command == "archive":
+        if options.months <= 0:
+            parser.error("--months must be greater than 0")
+        return archive_activity_log(
+            sink,
+            before=get_archive_horizon(options.months),
+            chunk_size=options.chunk_size,
+            max_chunks=options.max_chunks,
+            delete=not options.keep_rows,
+        )
+
+    return restore_activity_log(sink, prefix=options.prefix, chunk_size=options.chunk_size)
+
+
+if __name__ == "__main__":
+    print(json.dumps(main()))
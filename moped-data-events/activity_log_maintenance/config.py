@@ -0,0 +1,35 @@
+import os
+
+API_ENVIRONMENT = os.getenv("API_ENVIRONMENT", "STAGING").lower()
+HASURA_ADMIN_SECRET = os.getenv("HASURA_ADMIN_SECRET", "")
+# The GraphQL endpoint (ie. https://moped-hasura.../v1/graphql), same as activity_log
+HASURA_ENDPOINT = os.getenv("HASURA_ENDPOINT", "")
+
+# Prep Hasura query
+HASURA_HTTP_HEADERS = {
+    "Accept": "*/*",
+    "Content-Type": "application/json",
+    "X-Hasura-Admin-Secret": HASURA_ADMIN_SECRET,
+}
+
+#
+# Partitions of moped_activity_log
+#   ACTIVITY_LOG_PARTITION_MONTHS_AHEAD: How many future monthly partitions must exist
+#   ACTIVITY_LOG_DETACH_AFTER_MONTHS: Partitions older than this are detached, 0: never
+#
+ACTIVITY_LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("ACTIVITY_LOG_PARTITION_MONTHS_AHEAD", "3"))
+ACTIVITY_LOG_DETACH_AFTER_MONTHS = int(os.getenv("ACTIVITY_LOG_DETACH_AFTER_MONTHS", "0"))
+
+#
+# Cold archive of moped_activity_log
+#   ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS: Rows older than this are archived and deleted, 0: never
+#   ACTIVITY_LOG_ARCHIVE_SINK: s3://bucket/prefix or a local directory
+#   ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE: Rows per file, and per delete transaction
+#   ACTIVITY_LOG_ARCHIVE_MAX_CHUNKS: Chunks per run, keeps a run within the Lambda timeout
+#
+ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS = int(os.getenv("ACTIVITY_LOG_ARCHIVE_AFTER_MONTHS", "0"))
+ACTIVITY_LOG_ARCHIVE_SINK = os.getenv(
+    "ACTIVITY_LOG_ARCHIVE_SINK", f"s3://atd-moped-data-events/archive/{API_ENVIRONMENT}/moped_activity_log"
+)
+ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE = int(os.getenv("ACTIVITY_LOG_ARCHIVE_CHUNK_SIZE", "1000"))
+ACTIVITY_LOG_ARCHIVE_MAX_CHUNKS = int(os.getenv("ACTIVITY_LOG_ARCHIVE_MAX_CHUNKS", "100"))
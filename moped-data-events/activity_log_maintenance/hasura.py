@@ -0,0 +1,80 @@
+import json
+
+import requests
+
+from config import (
+    HASURA_HTTP_HEADERS,
+    HASURA_ENDPOINT,
+)
+
+
+def get_query_endpoint() -> str:
+    """
+    Returns the Hasura query endpoint (run_sql) out of the GraphQL endpoint
+    :return: The url of the /v1/query endpoint
+    :rtype: str
+    """
+    if HASURA_ENDPOINT == "":
+        raise RuntimeError("Missing HASURA_ENDPOINT")
+    return HASURA_ENDPOINT.rsplit("/v1/graphql", 1)[0] + "/v1/query"
+
+
+def run_query(query: str, variables: dict = None) -> dict:
+    """
+    Runs a GraphQL query or mutation against Hasura
+    :param query: The GraphQL query
+    :type query: str
+    :param variables: The query variables
+    :type variables: dict
+    :return: The data returned by the query
+    :rtype: dict
+    """
+    if HASURA_ENDPOINT == "":
+        raise RuntimeError("Missing HASURA_ENDPOINT")
+
+    response = requests.post(
+        url=HASURA_ENDPOINT,
+        headers=HASURA_HTTP_HEADERS,
+        data=json.dumps(
+            {
+                "query": query,
+                "variables": variables or {}
+            }
+        )
+    )
+    response.encoding = "utf-8"
+    response_json = response.json()
+
+    if "errors" in response_json:
+        raise RuntimeError(f"Error while running query: {json.dumps(response_json)}")
+
+    return response_json["data"]
+
+
+def run_sql(query: str) -> list:
+    """
+    Runs a PostgreSQL query through Hasura, in a single transaction
+    :param query: The PostgreSQL query to be executed
+    :type query: str
+    :return: The rows returned by the query, without the header row
+    :rtype: list
+    """
+    response = requests.post(
+        url=get_query_endpoint(),
+        headers=HASURA_HTTP_HEADERS,
+        data=json.dumps(
+            {
+                "type": "run_sql",
+                "args": {
+                    "sql": query
+                }
+            }
+        )
+    )
+    response.encoding = "utf-8"
+    response_json = response.json()
+
+    if "error" in response_json:
+        raise RuntimeError(f"Error while running SQL: {json.dumps(response_json)}")
+
+    return (response_json.get("result", None) or [])[1:]
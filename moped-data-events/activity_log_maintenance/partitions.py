@@ -0,0 +1,196 @@
+#
+# Partition management for moped_activity_log
+#
+#   The table is partitioned by month on created_at. Partitions are created a
+# few months ahead of time (so inserts never land in the default partition)
+# and, optionally, old partitions are dropped once the cold archive emptied
+# them, or detached from the table.
+#
+#   If the job did not run in time, the rows of a month without a partition
+# land in the default partition. The partitions of those months are created
+# too: moped_activity_log_create_partition moves the rows out of the default
+# partition in the same transaction, which Postgres requires.
+#
+import re
+import json
+import datetime
+
+from config import (
+    ACTIVITY_LOG_PARTITION_MONTHS_AHEAD,
+    ACTIVITY_LOG_DETACH_AFTER_MONTHS,
+)
+from hasura import run_sql
+
+PARTITION_NAME_PATTERN = re.compile(r"^moped_activity_log_y(\d{4})m(\d{2})$")
+
+DEFAULT_PARTITION = "moped_activity_log_default"
+
+
+def get_month_start(date: datetime.date) -> datetime.date:
+    """
+    Returns the first day of the month of a date
+    :param date: Any date
+    :type date: datetime.date
+    :return: The first day of the month
+    :rtype: datetime.date
+    """
+    return datetime.date(date.year, date.month, 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    """
+    Moves the first day of a month by a number of months
+    :param month: The first day of a month
+    :type month: datetime.date
+    :param months: The number of months, it can be negative
+    :type months: int
+    :return: The first day of the resulting month
+    :rtype: datetime.date
+    """
+    month_index = month.year * 12 + month.month - 1 + months
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def get_partition_name(month: datetime.date) -> str:
+    """
+    Returns the name of the partition of a month, same as moped_activity_log_create_partition
+    :param month: Any date within the month
+    :type month: datetime.date
+    :return: The partition name, ie. moped_activity_log_y2021m07
+    :rtype: str
+    """
+    return f"moped_activity_log_y{month.year:04d}m{month.month:02d}"
+
+
+def get_partition_month(partition_name: str) -> datetime.date:
+    """
+    Returns the month of a monthly partition
+    :param partition_name: The partition name
+    :type partition_name: str
+    :return: The first day of the month, None if it is not a monthly partition (ie. the default)
+    :rtype: datetime.date
+    """
+    match = PARTITION_NAME_PATTERN.match(partition_name)
+    if match is None:
+        return None
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def list_partitions() -> list:
+    """
+    Returns the names of the partitions attached to moped_activity_log
+    :return: The list of partition names
+    :rtype: list
+    """
+    rows = run_sql("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'moped_activity_log'
+        ORDER BY child.relname;
+    """)
+    return [row[0] for row in rows]
+
+
+def list_default_months() -> list:
+    """
+    Returns the months of the rows in the default partition
+    :return: The first day of every month, oldest first
+    :rtype: list
+    """
+    rows = run_sql(f"""
+        SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date
+        FROM public.{DEFAULT_PARTITION}
+        ORDER BY 1;
+    """)
+    return [datetime.date.fromisoformat(row[0][:10]) for row in rows]
+
+
+def create_future_partitions(months_ahead: int = ACTIVITY_LOG_PARTITION_MONTHS_AHEAD, today: datetime.date = None) -> list:
+    """
+    Makes sure the partitions for the current month and the next months exist, and
+    the partitions of the months with rows in the default partition (they are moved)
+    :param months_ahead: How many months after the current one
+    :type months_ahead: int
+    :param today: The current date, default: today (UTC)
+    :type today: datetime.date
+    :return: The names of the partitions that were missing
+    :rtype: list
+    """
+    current_month = get_month_start(today or datetime.datetime.utcnow().date())
+    months = [add_months(current_month, months) for months in range(months_ahead + 1)]
+    existing = set(list_partitions())
+    if DEFAULT_PARTITION in existing:
+        months = sorted(set(months) | set(list_default_months()))
+    missing = [month for month in months if get_partition_name(month) not in existing]
+
+    if len(missing) > 0:
+        run_sql(
+            "SELECT moped_activity_log_create_partition(month) FROM unnest(ARRAY[{months}]::date[]) AS month;".format(
+                months=", ".join(f"'{month.isoformat()}'" for month in missing)
+            )
+        )
+
+    return [get_partition_name(month) for month in missing]
+
+
+def is_empty(partition_name: str) -> bool:
+    """
+    Checks if a partition has no rows, ie. the cold archive moved them all
+    :param partition_name: The partition name
+    :type partition_name: str
+    :return: True if it is empty
+    :rtype: bool
+    """
+    rows = run_sql(f'SELECT NOT EXISTS (SELECT 1 FROM public."{partition_name}");')
+    return rows[0][0] == "t"
+
+
+def detach_old_partitions(detach_after_months: int = ACTIVITY_LOG_DETACH_AFTER_MONTHS, today: datetime.date = None) -> dict:
+    """
+    Removes the partitions whose whole month is older than the retention. The
+    empty partitions (archived, see archive.py) are dropped. The others are
+    detached: a detached partition is a regular table, its rows are no longer in
+    moped_activity_log, and it is left for the database administrators to
+    archive and drop (the cold archive only reads moped_activity_log).
+    :param detach_after_months: The number of months to keep, 0 keeps everything
+    :type detach_after_months: int
+    :param today: The current date, default: today (UTC)
+    :type today: datetime.date
+    :return: The names of the detached and of the dropped partitions
+    :rtype: dict
+    """
+    result = {"detached": [], "dropped": []}
+    if detach_after_months <= 0:
+        return result
+
+    cutoff = add_months(get_month_start(today or datetime.datetime.utcnow().date()), -detach_after_months)
+    for partition_name in list_partitions():
+        month = get_partition_month(partition_name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        if is_empty(partition_name):
+            run_sql(f'DROP TABLE public."{partition_name}";')
+            result["dropped"].append(partition_name)
+        else:
+            run_sql(f'ALTER TABLE public.moped_activity_log DETACH PARTITION public."{partition_name}";')
+            result["detached"].append(partition_name)
+
+    return result
+
+
+def run_partition_maintenance() -> dict:
+    """
+    Creates future partitions, and drops or detaches old ones
+    :return: The created, detached and dropped partitions
+    :rtype: dict
+    """
+    return {
+        "created": create_future_partitions(),
+        **detach_old_partitions(),
+    }
+
+
+if __name__ == "__main__":
+    print(json.dumps(run_partition_maintenance()))
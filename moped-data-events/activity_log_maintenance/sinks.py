@@ -0,0 +1,163 @@
+#
+# Archive sinks, where the archived files of moped_activity_log are stored
+#
+#   s3://bucket/prefix  An S3 bucket and key prefix
+#   /some/directory     A local directory
+#
+import os
+from typing import BinaryIO, Iterator
+
+import boto3
+
+
+class LocalSink:
+    """
+    Stores archive files in a local directory
+    """
+
+    def __init__(self, directory: str):
+        """
+        Constructor for the local sink
+        :param directory: The root directory of the archive
+        :type directory: str
+        """
+        self.directory = directory
+
+    def __str__(self) -> str:
+        return self.directory
+
+    def write(self, key: str, body: bytes) -> str:
+        """
+        Writes a file, the file is renamed into place once fully written
+        :param key: The relative path of the file
+        :type key: str
+        :param body: The file contents
+        :type body: bytes
+        :return: The full path of the file
+        :rtype: str
+        """
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as file:
+            file.write(body)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)
+        return path
+
+    def open(self, key: str) -> BinaryIO:
+        """
+        Opens a file for streaming
+        :param key: The relative path of the file
+        :type key: str
+        :return: The binary file object
+        :rtype: BinaryIO
+        """
+        return open(os.path.join(self.directory, key), "rb")
+
+    def list(self, prefix: str = "") -> Iterator[str]:
+        """
+        Lists the archive files, in key order
+        :param prefix: Only the keys that start with this prefix (ie. 2021/07)
+        :type prefix: str
+        :return: The relative paths of the files
+        :rtype: Iterator[str]
+        """
+        keys = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, "/")
+                if key.endswith(".jsonl.gz") and key.startswith(prefix):
+                    keys.append(key)
+        return iter(sorted(keys))
+
+
+class S3Sink:
+    """
+    Stores archive files in an S3 bucket
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", client=None):
+        """
+        Constructor for the S3 sink
+        :param bucket: The bucket name
+        :type bucket: str
+        :param prefix: The key prefix of the archive, without a trailing slash
+        :type prefix: str
+        :param client: The boto3 S3 client, default: a new client
+        """
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = client or boto3.client("s3")
+
+    def __str__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def get_object_key(self, key: str) -> str:
+        """
+        Returns the S3 key of an archive file
+        :param key: The relative key of the file
+        :type key: str
+        :return: The S3 key
+        :rtype: str
+        """
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def write(self, key: str, body: bytes) -> str:
+        """
+        Uploads a file
+        :param key: The relative key of the file
+        :type key: str
+        :param body: The file contents
+        :type body: bytes
+        :return: The S3 url of the file
+        :rtype: str
+        """
+        object_key = self.get_object_key(key)
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=object_key,
+            Body=body,
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )
+        return f"s3://{self.bucket}/{object_key}"
+
+    def open(self, key: str) -> BinaryIO:
+        """
+        Opens a file for streaming
+        :param key: The relative key of the file
+        :type key: str
+        :return: The streaming body of the object
+        :rtype: BinaryIO
+        """
+        return self.client.get_object(Bucket=self.bucket, Key=self.get_object_key(key))["Body"]
+
+    def list(self, prefix: str = "") -> Iterator[str]:
+        """
+        Lists the archive files, in key order
+        :param prefix: Only the keys that start with this prefix (ie. 2021/07)
+        :type prefix: str
+        :return: The relative keys of the files
+        :rtype: Iterator[str]
+        """
+        root = f"{self.prefix}/" if self.prefix else ""
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=root + prefix):
+            for s3_object in page.get("Contents", []):
+                if s3_object["Key"].endswith(".jsonl.gz"):
+                    yield s3_object["Key"][len(root):]
+
+
+def get_sink(url: str):
+    """
+    Returns the sink for an archive location
+    :param url: Either s3://bucket/prefix or a local directory
+    :type url: str
+    :return: The sink
+    :rtype: LocalSink or S3Sink
+    """
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3Sink(bucket=bucket, prefix=prefix)
+    return LocalSink(directory=url)
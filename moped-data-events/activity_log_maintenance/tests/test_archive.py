@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+import gzip
+import json
+import datetime
+
+import pytest
+from pytest_mock import MockerFixture
+
+import archive
+from archive import (
+    archive_activity_log,
+    get_archive_horizon,
+    get_chunk_where,
+    restore_activity_log,
+    serialize_chunk,
+)
+from sinks import LocalSink, get_sink
+
+
+class FakeActivityLog:
+    """
+    Answers the archive queries and mutations out of a list of rows
+    """
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.deletes = 0
+
+    @staticmethod
+    def matches(row: dict, where: dict) -> bool:
+        if "_and" in where:
+            return all(FakeActivityLog.matches(row, condition) for condition in where["_and"])
+        if "_or" in where:
+            return any(FakeActivityLog.matches(row, condition) for condition in where["_or"])
+        operators = {"_lt": str.__lt__, "_gt": str.__gt__, "_eq": str.__eq__}
+        return all(
+            operators[operator](row[column], value)
+            for column, condition in where.items()
+            for operator, value in condition.items()
+        )
+
+    def run_query(self, query: str, variables: dict) -> dict:
+        if "ArchiveActivityLogChunk" in query:
+            rows = sorted(
+                [row for row in self.rows if self.matches(row, variables["where"])],
+                key=lambda row: (row["created_at"], row["activity_id"])
+            )
+            return {"moped_activity_log": rows[:variables["limit"]]}
+        if "DeleteActivityLogChunk" in query:
+            self.deletes += 1
+            ids = set(variables["activityIds"])
+            count = len(self.rows)
+            self.rows = [row for row in self.rows if row["activity_id"] not in ids]
+            return {"delete_moped_activity_log": {"affected_rows": count - len(self.rows)}}
+        if "ExistingActivityLogEvents" in query:
+            event_ids = set(variables["eventIds"])
+            return {
+                "moped_activity_log": [
+                    {"event_id": row["event_id"]} for row in self.rows if row.get("event_id", None) in event_ids
+                ]
+            }
+        if "RestoreActivityLogChunk" in query:
+            ids = {row["activity_id"] for row in self.rows}
+            new_rows = [row for row in variables["objects"] if row["activity_id"] not in ids]
+            # moped_activity_log_event_id_key fails the whole insert
+            events = [(row["event_id"], row["created_at"]) for row in self.rows + new_rows if row.get("event_id", None)]
+            if len(events) != len(set(events)):
+                raise Exception("duplicate key value violates unique constraint moped_activity_log_event_id_key")
+            self.rows.extend(new_rows)
+            return {"insert_moped_activity_log": {"affected_rows": len(new_rows)}}
+        raise ValueError(query)
+
+
+def create_rows(count: int, month: str = "2019-07", offset: int = 0) -> list:
+    return [
+        {
+            "activity_id": f"00000000-0000-0000-0000-{offset + index:012d}",
+            "created_at": f"{month}-01T00:00:{index % 60:02d}+00:00",
+            "record_id": index,
+            "record_type": "moped_project",
+            "record_data": {"event": {"data": {"new": {"project_id": index}}}},
+            "description": [],
+        }
+        for index in range(count)
+    ]
+
+
+class TestArchive:
+    def test_archive_horizon(self) -> None:
+        assert get_archive_horizon(24, today=datetime.date(2021, 7, 20)) == "2019-07-01T00:00:00+00:00"
+
+    def test_chunk_where(self) -> None:
+        assert get_chunk_where("2021-01-01") == {"created_at": {"_lt": "2021-01-01"}}
+        where = get_chunk_where("2021-01-01", {"created_at": "2019-01-01", "activity_id": "a"})
+        assert where["_and"][1]["_or"][1] == {"created_at": {"_eq": "2019-01-01"}, "activity_id": {"_gt": "a"}}
+
+    def test_serialize_chunk_is_deterministic(self) -> None:
+        rows = create_rows(3)
+        assert serialize_chunk(rows) == serialize_chunk(json.loads(json.dumps(rows)))
+
+    def test_archive_and_restore(self, mocker: MockerFixture, tmp_path) -> None:
+        rows = create_rows(25) + create_rows(5, month="2021-07", offset=100)
+        table = FakeActivityLog(list(rows))
+        mocker.patch.object(archive, "run_query", side_effect=table.run_query)
+        sink = LocalSink(str(tmp_path))
+
+        result = archive_activity_log(sink, before="2021-01-01T00:00:00+00:00", chunk_size=10)
+        assert result["archived"] == 25
+        assert result["deleted"] == 25
+        assert len(result["files"]) == 3
+        assert table.deletes == 3
+        assert len(table.rows) == 5
+        assert list(sink.list()) == sorted(list(sink.list("2019/07")))
+
+        result = restore_activity_log(sink, chunk_size=7)
+        assert result["restored"] == 25
+        assert sorted(table.rows, key=lambda row: row["activity_id"]) == rows
+
+        # Restoring twice does not duplicate rows
+        assert restore_activity_log(sink)["restored"] == 0
+
+    def test_restore_logged_events(self, mocker: MockerFixture, tmp_path) -> None:
+        rows = create_rows(6)
+        for index, row in enumerate(rows):
+            row["event_id"] = f"10000000-0000-0000-0000-{index:012d}"
+        table = FakeActivityLog(list(rows))
+        mocker.patch.object(archive, "run_query", side_effect=table.run_query)
+        sink = LocalSink(str(tmp_path))
+        archive_activity_log(sink, before="2021-01-01", chunk_size=10)
+
+        # An event logged again after it was archived, under another primary key
+        relogged = dict(rows[2], activity_id="20000000-0000-0000-0000-000000000000")
+        table.rows.append(relogged)
+
+        result = restore_activity_log(sink)
+        assert result["restored"] == 5
+        assert len(table.rows) == 6
+        assert relogged in table.rows
+        assert rows[2] not in table.rows
+
+    def test_archive_keep_rows(self, mocker: MockerFixture, tmp_path) -> None:
+        table = FakeActivityLog(create_rows(12))
+        mocker.patch.object(archive, "run_query", side_effect=table.run_query)
+        result = archive_activity_log(LocalSink(str(tmp_path)), before="2021-01-01", chunk_size=5, delete=False)
+        assert result == {"files": result["files"], "archived": 12, "deleted": 0}
+        assert len(table.rows) == 12
+
+    def test_archive_max_chunks(self, mocker: MockerFixture, tmp_path) -> None:
+        table = FakeActivityLog(create_rows(12))
+        mocker.patch.object(archive, "run_query", side_effect=table.run_query)
+        result = archive_activity_log(LocalSink(str(tmp_path)), before="2021-01-01", chunk_size=5, max_chunks=1)
+        assert result["archived"] == 5
+        assert len(table.rows) == 7
+
+    def test_restore_corrupted_file(self, mocker: MockerFixture, tmp_path) -> None:
+        run_query = mocker.patch.object(archive, "run_query")
+        sink = LocalSink(str(tmp_path))
+        digest, _ = serialize_chunk(create_rows(2))
+        sink.write(f"2019/07/{digest}.jsonl.gz", gzip.compress(b'{"activity_id":"tampered"}\n'))
+
+        with pytest.raises(ValueError):
+            restore_activity_log(sink)
+        run_query.assert_not_called()
+
+    def test_get_sink(self) -> None:
+        assert isinstance(get_sink("/tmp/archive"), LocalSink)
+        assert str(get_sink("s3://bucket/archive/staging/")) == "s3://bucket/archive/staging"
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import datetime
+
+from pytest_mock import MockerFixture
+
+import partitions
+from partitions import (
+    add_months,
+    get_partition_month,
+    get_partition_name,
+    create_future_partitions,
+    detach_old_partitions,
+)
+
+
+class TestPartitions:
+    def test_add_months(self) -> None:
+        assert add_months(datetime.date(2021, 11, 1), 3) == datetime.date(2022, 2, 1)
+        assert add_months(datetime.date(2021, 1, 1), -1) == datetime.date(2020, 12, 1)
+        assert add_months(datetime.date(2021, 7, 1), 0) == datetime.date(2021, 7, 1)
+
+    def test_partition_name(self) -> None:
+        assert get_partition_name(datetime.date(2021, 7, 15)) == "moped_activity_log_y2021m07"
+        assert get_partition_month("moped_activity_log_y2021m07") == datetime.date(2021, 7, 1)
+        assert get_partition_month("moped_activity_log_default") is None
+
+    def test_create_future_partitions(self, mocker: MockerFixture) -> None:
+        run_sql = mocker.patch.object(partitions, "run_sql", side_effect=[
+            [["moped_activity_log_default"], ["moped_activity_log_y2021m07"]],
+            [],
+            [],
+        ])
+        created = create_future_partitions(months_ahead=2, today=datetime.date(2021, 7, 20))
+        assert created == ["moped_activity_log_y2021m08", "moped_activity_log_y2021m09"]
+        assert "'2021-08-01', '2021-09-01'" in run_sql.call_args_list[2][0][0]
+
+    def test_create_missed_partitions(self, mocker: MockerFixture) -> None:
+        # The job did not run in May and June, their rows are in the default partition
+        run_sql = mocker.patch.object(partitions, "run_sql", side_effect=[
+            [["moped_activity_log_default"], ["moped_activity_log_y2021m04"]],
+            [["2021-05-01"], ["2021-06-01"], ["2021-07-01"]],
+            [],
+        ])
+        created = create_future_partitions(months_ahead=1, today=datetime.date(2021, 7, 20))
+        assert created == [
+            "moped_activity_log_y2021m05",
+            "moped_activity_log_y2021m06",
+            "moped_activity_log_y2021m07",
+            "moped_activity_log_y2021m08",
+        ]
+        assert "FROM public.moped_activity_log_default" in run_sql.call_args_list[1][0][0]
+        assert "'2021-05-01', '2021-06-01', '2021-07-01', '2021-08-01'" in run_sql.call_args_list[2][0][0]
+
+    def test_create_future_partitions_nothing_missing(self, mocker: MockerFixture) -> None:
+        run_sql = mocker.patch.object(partitions, "run_sql", return_value=[["moped_activity_log_y2021m07"]])
+        assert create_future_partitions(months_ahead=0, today=datetime.date(2021, 7, 20)) == []
+        assert run_sql.call_count == 1
+
+    def test_detach_old_partitions(self, mocker: MockerFixture) -> None:
+        run_sql = mocker.patch.object(partitions, "run_sql", side_effect=[
+            [
+                ["moped_activity_log_default"],
+                ["moped_activity_log_y2020m11"],
+                ["moped_activity_log_y2020m12"],
+                ["moped_activity_log_y2021m01"],
+                ["moped_activity_log_y2021m07"],
+            ],
+            # November was archived, December was not
+            [["t"]],
+            [],
+            [["f"]],
+            [],
+        ])
+        result = detach_old_partitions(detach_after_months=6, today=datetime.date(2021, 7, 20))
+        assert result == {"detached": ["moped_activity_log_y2020m12"], "dropped": ["moped_activity_log_y2020m11"]}
+        assert 'DROP TABLE public."moped_activity_log_y2020m11"' in run_sql.call_args_list[2][0][0]
+        assert 'DETACH PARTITION public."moped_activity_log_y2020m12"' in run_sql.call_args_list[4][0][0]
+
+    def test_detach_disabled(self, mocker: MockerFixture) -> None:
+        run_sql = mocker.patch.object(partitions, "run_sql")
+        assert detach_old_partitions(detach_after_months=0) == {"detached": [], "dropped": []}
+        run_sql.assert_not_called()
@@ -0,0 +1,63 @@
+/*
+    Offset vs keyset pagination of a project's activity feed.
+
+    Generates a synthetic activity log of 5 million rows (spread over 500 projects),
+    then compares page 1 and a deep page with both strategies. Everything runs in a
+    transaction that is rolled back, so it can be pointed at a local database:
+
+        $ psql -h localhost -U moped moped -f benchmarks/activity_log_keyset_pagination.sql
+
+    Expect the offset page cost to grow with the page number, while the keyset page
+    costs the same as page 1 (an index range scan of "limit" rows).
+*/
+\timing on
+
+BEGIN;
+
+INSERT INTO moped_activity_log (
+    record_id, record_type, record_data, description, created_at, updated_by, record_project_id, operation_type
+)
+SELECT
+    series,
+    'moped_project',
+    '{}'::jsonb,
+    '[]'::jsonb,
+    now() - (series || ' seconds')::interval,
+    '00000000-0000-0000-0000-000000000000'::uuid,
+    series % 500,
+    'UPDATE'
+FROM generate_series(1, 5000000) AS series;
+
+ANALYZE moped_activity_log;
+
+-- Page 1
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT activity_id, created_at FROM moped_activity_log
+WHERE record_project_id = 42
+ORDER BY created_at DESC, activity_id DESC
+LIMIT 50;
+
+-- Page 200 with OFFSET
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT activity_id, created_at FROM moped_activity_log
+WHERE record_project_id = 42
+ORDER BY created_at DESC, activity_id DESC
+LIMIT 50 OFFSET 9950;
+
+-- The cursor of page 199 (the last row the client received)
+SELECT created_at AS cursor_created_at, activity_id AS cursor_activity_id FROM moped_activity_log
+WHERE record_project_id = 42
+ORDER BY created_at DESC, activity_id DESC
+LIMIT 1 OFFSET 9949 \gset
+
+-- Page 200 with the cursor, the same where clause the API generates
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT activity_id, created_at FROM moped_activity_log
+WHERE record_project_id = 42
+  AND created_at <= :'cursor_created_at'
+  AND (created_at < :'cursor_created_at'
+       OR (created_at = :'cursor_created_at' AND activity_id < :'cursor_activity_id'))
+ORDER BY created_at DESC, activity_id DESC
+LIMIT 50;
+
+ROLLBACK;
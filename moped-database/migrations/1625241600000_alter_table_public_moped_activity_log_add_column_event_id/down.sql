@@ -0,0 +1,2 @@
+ALTER TABLE "public"."moped_activity_log" DROP CONSTRAINT "moped_activity_log_event_id_key";
+ALTER TABLE "public"."moped_activity_log" DROP COLUMN "event_id";
@@ -0,0 +1,3 @@
+ALTER TABLE "public"."moped_activity_log" ADD COLUMN "event_id" uuid NULL;
+COMMENT ON COLUMN "public"."moped_activity_log"."event_id" IS E'The id of the Hasura event, it prevents SQS redeliveries from being logged twice';
+ALTER TABLE "public"."moped_activity_log" ADD CONSTRAINT "moped_activity_log_event_id_key" UNIQUE ("event_id");
@@ -0,0 +1,3 @@
+CREATE INDEX moped_activity_log_project_id_index ON moped_activity_log (record_project_id);
+
+DROP INDEX IF EXISTS moped_activity_log_project_created_at_index;
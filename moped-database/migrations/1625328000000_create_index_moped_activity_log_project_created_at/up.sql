@@ -0,0 +1,10 @@
+/*
+    Supports keyset pagination of a project's activity feed:
+        WHERE record_project_id = $1 AND (created_at, activity_id) < ($2, $3)
+        ORDER BY created_at DESC, activity_id DESC
+    The index leads with record_project_id, so it replaces the single-column one.
+*/
+CREATE INDEX moped_activity_log_project_created_at_index
+    ON moped_activity_log (record_project_id, created_at DESC, activity_id DESC);
+
+DROP INDEX IF EXISTS moped_activity_log_project_id_index;
@@ -0,0 +1,62 @@
+/*
+    Restores moped_activity_log as a single table. The rows of every attached
+    partition are copied back, detached partitions are left as they are.
+*/
+ALTER TABLE moped_activity_log RENAME TO moped_activity_log_partitioned;
+ALTER TABLE moped_activity_log_partitioned RENAME CONSTRAINT moped_activity_log_pk TO moped_activity_log_partitioned_pk;
+ALTER TABLE moped_activity_log_partitioned RENAME CONSTRAINT moped_activity_log_event_id_key TO moped_activity_log_partitioned_event_id_key;
+ALTER INDEX moped_activity_log_record_id_index RENAME TO moped_activity_log_partitioned_record_id_index;
+ALTER INDEX moped_activity_log_record_type_index RENAME TO moped_activity_log_partitioned_record_type_index;
+ALTER INDEX moped_activity_log_updated_by_index RENAME TO moped_activity_log_partitioned_updated_by_index;
+ALTER INDEX moped_activity_log_operation_type_index RENAME TO moped_activity_log_partitioned_operation_type_index;
+ALTER INDEX moped_activity_log_project_created_at_index RENAME TO moped_activity_log_partitioned_project_created_at_index;
+
+CREATE TABLE moped_activity_log
+(
+    activity_id uuid DEFAULT gen_random_uuid() NOT NULL
+        CONSTRAINT moped_activity_log_pk
+            PRIMARY KEY,
+    record_id int NOT NULL,
+    record_type varchar(64) NOT NULL,
+    record_data jsonb NOT NULL,
+    description jsonb NOT NULL,
+    created_at timestamptz DEFAULT now(),
+    updated_by uuid NOT NULL,
+    record_project_id int DEFAULT 0,
+    operation_type varchar(8) NULL,
+    event_id uuid NULL
+        CONSTRAINT moped_activity_log_event_id_key
+            UNIQUE
+);
+
+CREATE INDEX moped_activity_log_record_id_index ON moped_activity_log (record_id);
+CREATE INDEX moped_activity_log_record_type_index ON moped_activity_log (record_type);
+CREATE INDEX moped_activity_log_updated_by_index ON moped_activity_log (updated_by);
+CREATE INDEX moped_activity_log_operation_type_index ON moped_activity_log (operation_type);
+CREATE INDEX moped_activity_log_project_created_at_index
+    ON moped_activity_log (record_project_id, created_at DESC, activity_id DESC);
+
+INSERT INTO moped_activity_log (
+    activity_id, record_id, record_type, record_data, description, created_at,
+    updated_by, record_project_id, operation_type, event_id
+)
+SELECT
+    activity_id, record_id, record_type, record_data, description, created_at,
+    updated_by, record_project_id, operation_type, event_id
+FROM moped_activity_log_partitioned
+ON CONFLICT DO NOTHING;
+
+DROP TABLE moped_activity_log_partitioned CASCADE;
+DROP FUNCTION IF EXISTS moped_activity_log_create_partition(date);
+
+COMMENT ON TABLE moped_activity_log IS 'Stores all changes made to records in the database relying on Hasura Events';
+COMMENT ON COLUMN moped_activity_log.activity_id IS 'UUID that guarantees record uniqueness';
+COMMENT ON COLUMN moped_activity_log.record_id IS 'Equivalent to the primary id value of the record type';
+COMMENT ON COLUMN moped_activity_log.record_type IS 'The table being modified, ie. moped_project';
+COMMENT ON COLUMN moped_activity_log.record_data IS 'The change payload as provided by Hasura, reduced according to record_data_policy';
+COMMENT ON COLUMN moped_activity_log.description IS 'A summary description of the changes as provided by Python';
+COMMENT ON COLUMN moped_activity_log.created_at IS 'An automatic timestamp at the time of creation';
+COMMENT ON COLUMN moped_activity_log.updated_by IS 'The Cognito UUID';
+COMMENT ON COLUMN moped_activity_log.record_project_id IS 'A project id number if this record is related to a project';
+COMMENT ON COLUMN moped_activity_log.operation_type IS 'The operation type as provided by Hasura: INSERT, UPDATE, DELETE';
+COMMENT ON COLUMN moped_activity_log.event_id IS 'The id of the Hasura event, it prevents SQS redeliveries from being logged twice';
@@ -0,0 +1,106 @@
+/*
+    Converts moped_activity_log into a table partitioned by month on created_at.
+    The table keeps its name, columns and comments, so Hasura (permissions and
+    the moped_user relationship) is not affected.
+
+    Postgres requires the partition key in every unique constraint:
+        - The primary key becomes (activity_id, created_at)
+        - The event id key becomes (event_id, created_at), created_at is the
+          Hasura event timestamp, so SQS redeliveries still conflict.
+
+    New partitions are created ahead of time by the activity_log_maintenance job,
+    the default partition only catches rows outside of every monthly partition.
+*/
+ALTER TABLE moped_activity_log RENAME TO moped_activity_log_unpartitioned;
+ALTER TABLE moped_activity_log_unpartitioned RENAME CONSTRAINT moped_activity_log_pk TO moped_activity_log_unpartitioned_pk;
+ALTER TABLE moped_activity_log_unpartitioned RENAME CONSTRAINT moped_activity_log_event_id_key TO moped_activity_log_unpartitioned_event_id_key;
+ALTER INDEX moped_activity_log_record_id_index RENAME TO moped_activity_log_unpartitioned_record_id_index;
+ALTER INDEX moped_activity_log_record_type_index RENAME TO moped_activity_log_unpartitioned_record_type_index;
+ALTER INDEX moped_activity_log_updated_by_index RENAME TO moped_activity_log_unpartitioned_updated_by_index;
+ALTER INDEX moped_activity_log_operation_type_index RENAME TO moped_activity_log_unpartitioned_operation_type_index;
+ALTER INDEX moped_activity_log_project_created_at_index RENAME TO moped_activity_log_unpartitioned_project_created_at_index;
+
+CREATE TABLE moped_activity_log
+(
+    activity_id uuid DEFAULT gen_random_uuid() NOT NULL,
+    record_id int NOT NULL,
+    record_type varchar(64) NOT NULL,
+    record_data jsonb NOT NULL,
+    description jsonb NOT NULL,
+    created_at timestamptz DEFAULT now() NOT NULL,
+    updated_by uuid NOT NULL,
+    record_project_id int DEFAULT 0,
+    operation_type varchar(8) NULL,
+    event_id uuid NULL,
+    CONSTRAINT moped_activity_log_pk PRIMARY KEY (activity_id, created_at),
+    CONSTRAINT moped_activity_log_event_id_key UNIQUE (event_id, created_at)
+) PARTITION BY RANGE (created_at);
+
+/*
+    Indexes (created on every partition)
+ */
+CREATE INDEX moped_activity_log_record_id_index ON moped_activity_log (record_id);
+CREATE INDEX moped_activity_log_record_type_index ON moped_activity_log (record_type);
+CREATE INDEX moped_activity_log_updated_by_index ON moped_activity_log (updated_by);
+CREATE INDEX moped_activity_log_operation_type_index ON moped_activity_log (operation_type);
+CREATE INDEX moped_activity_log_project_created_at_index
+    ON moped_activity_log (record_project_id, created_at DESC, activity_id DESC);
+
+/*
+    Creates the partition for the month of a given date, if it does not exist
+ */
+CREATE OR REPLACE FUNCTION moped_activity_log_create_partition(partition_month date)
+    RETURNS text
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start date := date_trunc('month', partition_month)::date;
+    partition_name text := 'moped_activity_log_' || to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.moped_activity_log FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        month_start::timestamp AT TIME ZONE 'UTC',
+        (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$;
+
+COMMENT ON FUNCTION moped_activity_log_create_partition(date) IS 'Creates the monthly partition of moped_activity_log for the month of a date';
+
+-- One partition per month, from the oldest row to three months from now
+SELECT moped_activity_log_create_partition(month::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT min(created_at) FROM moped_activity_log_unpartitioned), now()) AT TIME ZONE 'UTC'),
+    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+    interval '1 month'
+) AS month;
+
+CREATE TABLE moped_activity_log_default PARTITION OF moped_activity_log DEFAULT;
+
+INSERT INTO moped_activity_log (
+    activity_id, record_id, record_type, record_data, description, created_at,
+    updated_by, record_project_id, operation_type, event_id
+)
+SELECT
+    activity_id, record_id, record_type, record_data, description, COALESCE(created_at, now()),
+    updated_by, record_project_id, operation_type, event_id
+FROM moped_activity_log_unpartitioned;
+
+DROP TABLE moped_activity_log_unpartitioned;
+
+/*
+    Documentation
+*/
+COMMENT ON TABLE moped_activity_log IS 'Stores all changes made to records in the database relying on Hasura Events, partitioned by month';
+COMMENT ON COLUMN moped_activity_log.activity_id IS 'UUID that guarantees record uniqueness';
+COMMENT ON COLUMN moped_activity_log.record_id IS 'Equivalent to the primary id value of the record type';
+COMMENT ON COLUMN moped_activity_log.record_type IS 'The table being modified, ie. moped_project';
+COMMENT ON COLUMN moped_activity_log.record_data IS 'The change payload as provided by Hasura, reduced according to record_data_policy';
+COMMENT ON COLUMN moped_activity_log.description IS 'A summary description of the changes as provided by Python';
+COMMENT ON COLUMN moped_activity_log.created_at IS 'The time of the change, as provided by the Hasura event';
+COMMENT ON COLUMN moped_activity_log.updated_by IS 'The Cognito UUID';
+COMMENT ON COLUMN moped_activity_log.record_project_id IS 'A project id number if this record is related to a project';
+COMMENT ON COLUMN moped_activity_log.operation_type IS 'The operation type as provided by Hasura: INSERT, UPDATE, DELETE';
+COMMENT ON COLUMN moped_activity_log.event_id IS 'The id of the Hasura event, it prevents SQS redeliveries from being logged twice';
@@ -0,0 +1,19 @@
+CREATE OR REPLACE FUNCTION moped_activity_log_create_partition(partition_month date)
+    RETURNS text
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start date := date_trunc('month', partition_month)::date;
+    partition_name text := 'moped_activity_log_' || to_char(month_start, '"y"YYYY"m"MM');
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.moped_activity_log FOR VALUES FROM (%L) TO (%L)',
+        partition_name,
+        month_start::timestamp AT TIME ZONE 'UTC',
+        (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+    );
+    RETURN partition_name;
+END;
+$$;
+
+COMMENT ON FUNCTION moped_activity_log_create_partition(date) IS 'Creates the monthly partition of moped_activity_log for the month of a date';
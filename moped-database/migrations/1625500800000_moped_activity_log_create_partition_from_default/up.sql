@@ -0,0 +1,48 @@
+/*
+    moped_activity_log_create_partition moves the rows of the month out of the
+    default partition. If the maintenance job did not run in time, the rows of a
+    month without a partition land in moped_activity_log_default, and Postgres
+    refuses to create a partition while the default partition holds rows of its
+    range: every later run of the job failed. The partition is now created as a
+    regular table, the rows are moved into it and it is attached, all in the
+    transaction of the call.
+*/
+CREATE OR REPLACE FUNCTION moped_activity_log_create_partition(partition_month date)
+    RETURNS text
+    LANGUAGE plpgsql
+AS $$
+DECLARE
+    month_start date := date_trunc('month', partition_month)::date;
+    partition_name text := 'moped_activity_log_' || to_char(month_start, '"y"YYYY"m"MM');
+    range_start timestamptz := month_start::timestamp AT TIME ZONE 'UTC';
+    range_end timestamptz := (month_start + interval '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+    IF to_regclass(format('public.%I', partition_name)) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    IF to_regclass('public.moped_activity_log_default') IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE public.%I PARTITION OF public.moped_activity_log FOR VALUES FROM (%L) TO (%L)',
+            partition_name, range_start, range_end
+        );
+        RETURN partition_name;
+    END IF;
+
+    EXECUTE format('CREATE TABLE public.%I (LIKE public.moped_activity_log INCLUDING DEFAULTS)', partition_name);
+    EXECUTE format(
+        'WITH moved AS (
+            DELETE FROM public.moped_activity_log_default WHERE created_at >= %L AND created_at < %L RETURNING *
+        ) INSERT INTO public.%I SELECT * FROM moved',
+        range_start, range_end, partition_name
+    );
+    -- The indexes and constraints of moped_activity_log are created on attach
+    EXECUTE format(
+        'ALTER TABLE public.moped_activity_log ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, range_start, range_end
+    );
+    RETURN partition_name;
+END;
+$$;
+
+COMMENT ON FUNCTION moped_activity_log_create_partition(date) IS 'Creates the monthly partition of moped_activity_log for the month of a date, its rows in the default partition are moved into it';
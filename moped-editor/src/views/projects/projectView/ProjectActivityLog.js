@@ -300,6 +300,19 @@ const ProjectActivityLog = () => {
                                           ]?.label
                                         }
                                       </b>
+                                    ) : Array.isArray(changeItem.changes) ? (
+                                      <>
+                                        <b>
+                                          {getRecordTypeLabel(
+                                            change.record_type
+                                          )}{" "}
+                                          {getHumanReadableField(
+                                            change.record_type,
+                                            changeItem.field
+                                          )}
+                                        </b>{" "}
+                                        changed
+                                      </>
                                     ) : (
                                       <>
                                         <b>